@@ -0,0 +1,738 @@
+"""
+Server asyncio (aiohttp) cho Pi: cùng route với app_complete.py, nhưng chờ I/O không giữ thread
+- Chạy trên event loop: /api/detect-shrimp (upload Cloudinary bằng aiohttp, lưu MongoDB bằng motor),
+  gallery /api/shrimp-images, /api/shrimp-images/<id> (GET, DELETE), SSE /api/events,
+  MJPEG /blynk_feed, /video_feed (async generator, không thread nào ngủ chờ client chậm)
+- Decode/inference/vẽ/encode JPEG chạy trên BoundedExecutor (ASYNC_CPU_WORKERS thread,
+  tối đa ASYNC_CPU_QUEUE việc chờ, quá thì 503)
+- Các route còn lại (snapshot, ROI, recordings, stats, bulk delete, /health, ...) chạy app Flask
+  qua cầu WSGI trên ASYNC_IO_WORKERS thread; body được đọc xong trên event loop trước
+Cấu hình, camera, store, spool, retention... khởi tạo y như app_complete.py (import module đó).
+Chạy: python app_async.py   (port ASYNC_PORT, mặc định 8000)
+"""
+import asyncio
+import functools
+import io
+import os
+import sys
+import time
+
+import aiohttp
+import cloudinary
+import cloudinary.utils
+import cv2
+import numpy as np
+from aiohttp import web
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+import app_complete as core
+from bounded_executor import BoundedExecutor, ExecutorBusy
+from detection_codec import document_detections
+from detection_store import AsyncMongoDetectionStore, MongoDetectionStore
+from detector import ImageTooLarge
+from memory_budget import MemoryBudgetExceeded
+from mjpeg_stream import StreamSettings, AdaptiveStreamController, encode_frame, quantize_width
+from response_cache import CachedResponse
+from retention import document_public_id
+from rollups import build_rollup_update, empty_bucket_reset, hour_start
+from serialization import accepts_msgpack, serialize_payload, dumps_json, loads_json, JSON_MIMETYPE
+
+# ==================== ASYNC SERVER SETUP ====================
+ASYNC_PORT = int(os.getenv('ASYNC_PORT', '8000'))
+# Decode/inference: việc đang chờ chỉ giữ body đã đọc (RAM decode do memory_budget giới hạn),
+# hàng chờ đủ dài cho một đợt upload cùng xong, quá thì 503 thay vì để latency tăng vô hạn
+ASYNC_CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', '2'))
+ASYNC_CPU_QUEUE = int(os.getenv('ASYNC_CPU_QUEUE', '32'))
+# Route Flask, SQLite, spool (việc chặn ngắn)
+ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', '4'))
+ASYNC_IO_QUEUE = int(os.getenv('ASYNC_IO_QUEUE', '64'))
+# Encode JPEG cho stream (mỗi frame encode 1 lần cho mỗi quality/width, dùng chung giữa client)
+ASYNC_STREAM_WORKERS = int(os.getenv('ASYNC_STREAM_WORKERS', '1'))
+# 0: gọi pymongo trên io executor thay vì motor (VD khi test với mongomock)
+ASYNC_MONGO = os.getenv('ASYNC_MONGO', '1') == '1'
+CLOUDINARY_TIMEOUT_SECONDS = float(os.getenv('CLOUDINARY_TIMEOUT_SECONDS', '60'))
+
+cpu_executor = BoundedExecutor('cpu', ASYNC_CPU_WORKERS, ASYNC_CPU_QUEUE)
+io_executor = BoundedExecutor('io', ASYNC_IO_WORKERS, ASYNC_IO_QUEUE)
+stream_executor = BoundedExecutor('stream', ASYNC_STREAM_WORKERS, 64)
+
+http_session = None
+motor_client = None
+frame_signals = {}
+_async_store = {"source": None, "store": None}
+
+
+def json_response(payload, status=200, headers=None):
+    return web.Response(body=dumps_json(payload), status=status, content_type=JSON_MIMETYPE,
+                        headers=headers)
+
+
+def error_response(message, status, headers=None):
+    return json_response({"success": False, "message": message}, status, headers)
+
+
+def negotiated_response(request, payload, status=200, headers=None):
+    """Trả về JSON hoặc MessagePack tuỳ header Accept của client"""
+    body, mimetype = serialize_payload(payload, accepts_msgpack(request.headers.get('Accept')))
+    response = web.Response(body=body, status=status, content_type=mimetype, headers=headers)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def busy_response(e):
+    print(f"[ERROR] {str(e)}")
+    return error_response(str(e), 503, {"Retry-After": str(int(e.retry_after) + 1)})
+
+
+async def add_cors_headers(request, response):
+    """Giống flask-cors mặc định cho các route chạy trên event loop"""
+    if 'Origin' in request.headers and 'Access-Control-Allow-Origin' not in response.headers:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+
+
+# ==================== AUTH ====================
+def authorized(request):
+    header = request.headers.get('Authorization')
+    if not header:
+        return False
+    try:
+        auth = aiohttp.BasicAuth.decode(header)
+    except ValueError:
+        return False
+    return core.check_auth(auth.login, auth.password)
+
+
+def authenticate():
+    return web.Response(text='Authentication required', status=401,
+                        headers={'WWW-Authenticate': 'Basic realm="Login Required"'})
+
+
+# ==================== ASYNC STORAGE ====================
+class ExecutorStore:
+    """Store đồng bộ (SQLite, hoặc MongoDB khi không dùng motor) chạy trên io executor"""
+
+    def __init__(self, store, executor):
+        self.store = store
+        self.executor = executor
+        self.name = store.name
+        self.changes = store.changes
+
+    async def insert(self, doc):
+        return await self.executor.run(self.store.insert, doc)
+
+    async def list(self, **query):
+        return await self.executor.run(self.store.list, **query)
+
+    async def get(self, image_id):
+        return await self.executor.run(self.store.get, image_id)
+
+    async def delete(self, image_id):
+        return await self.executor.run(self.store.delete, image_id)
+
+
+def get_motor_db():
+    """Database MongoDB qua motor, None nếu chưa kết nối MongoDB hoặc không dùng motor"""
+    global motor_client
+    if not ASYNC_MONGO or AsyncIOMotorClient is None or core.collection is None:
+        return None
+    if motor_client is None:
+        motor_client = AsyncIOMotorClient(core.MONGODB_URI, serverSelectionTimeoutMS=5000)
+    return motor_client[core.MONGODB_DB]
+
+
+def get_async_store():
+    """
+    Bản async của core.store (tạo lại khi core kết nối lại MongoDB), None nếu chưa có store
+    Dùng chung changes với store đồng bộ nên cache gallery thấy mọi thay đổi
+    """
+    store = core.store
+    if store is None:
+        return None
+    if _async_store["source"] is not store:
+        db = get_motor_db() if isinstance(store, MongoDetectionStore) else None
+        if db is not None:
+            async_store = AsyncMongoDetectionStore(db['detections'], store.changes)
+        else:
+            async_store = ExecutorStore(store, io_executor)
+        _async_store.update(source=store, store=async_store)
+    return _async_store["store"]
+
+
+async def update_rollups(source, timestamp, detections, sign=1):
+    """Cập nhật rollup theo giờ; lỗi rollup không làm hỏng request chính"""
+    if core.rollup_collection is None:
+        return
+    db = get_motor_db()
+    try:
+        if db is None:
+            await io_executor.run(core.update_rollups, source, timestamp, detections, sign)
+        else:
+            await db['rollups'].update_one({"source": source, "hour": hour_start(timestamp)},
+                                           build_rollup_update(detections, sign), upsert=True)
+            if sign < 0:
+                await db['rollups'].update_one(*empty_bucket_reset(source, timestamp))
+    except Exception as e:
+        print(f"[ERROR] Rollup update failed: {str(e)}")
+
+
+# ==================== ASYNC CLOUDINARY ====================
+async def cloudinary_call(action, params, file_bytes=None):
+    """Gọi Upload API của Cloudinary (ký request như SDK) bằng aiohttp"""
+    config = cloudinary.config()
+    params = dict(params, timestamp=int(time.time()))
+    params["signature"] = cloudinary.utils.api_sign_request(params, config.api_secret)
+    form = aiohttp.FormData()
+    for name, value in params.items():
+        form.add_field(name, str(value))
+    form.add_field('api_key', str(config.api_key))
+    if file_bytes is not None:
+        form.add_field('file', file_bytes, filename='detection.jpg', content_type='image/jpeg')
+
+    url = cloudinary.utils.cloudinary_api_url(action, resource_type='image')
+    async with http_session.post(url, data=form) as response:
+        result = await response.json(content_type=None)
+    if response.status != 200:
+        message = (result.get('error') or {}).get('message') if isinstance(result, dict) else None
+        raise RuntimeError(f"Cloudinary {action} failed: {message or f'HTTP {response.status}'}")
+    return result
+
+
+async def upload_image(image_bytes):
+    """Upload JPEG lên Cloudinary, chỉ giữ các field cần lưu (như core.upload_to_cloudinary)"""
+    result = await cloudinary_call('upload', {"folder": "shrimp-detections"}, image_bytes)
+    return {key: result.get(key) for key in ('url', 'secure_url', 'public_id')}
+
+
+async def delete_cloudinary_asset(doc):
+    """Xoá ảnh Cloudinary của 1 document, lỗi chỉ ghi log (như core.delete_cloudinary_asset)"""
+    public_id = document_public_id(doc)
+    if not public_id:
+        return
+    try:
+        await cloudinary_call('destroy', {"public_id": public_id})
+    except Exception as e:
+        print(f"[WARN] Cloudinary delete failed for {public_id}: {str(e)}")
+
+
+# ==================== DETECTION API ====================
+async def save_detection_result(jpeg_bytes, detections, inference_time, source, tiled):
+    """Như core.save_detection_result, upload/lưu bằng I/O async"""
+    record = core.new_detection_record(detections, inference_time, source)
+
+    if core.service_available('cloudinary'):
+        print("[INFO] Uploading to Cloudinary...")
+        try:
+            record["upload"] = await upload_image(jpeg_bytes)
+            core.report_service('cloudinary')
+            print(f"[INFO] Uploaded to: {record['upload']['secure_url']}")
+        except Exception as e:
+            if not core.OFFLINE_SPOOL:
+                raise
+            core.report_service('cloudinary', e)
+            print(f"[ERROR] Cloudinary upload failed, spooling: {str(e)}")
+
+    mongo_id = None
+    store = get_async_store()
+    if record["upload"] is not None and store is not None and core.service_available('storage'):
+        try:
+            mongo_id = await store.insert(core.build_detection_document(record))
+            core.report_service('storage')
+            print(f"[INFO] Saved to {store.name} with ID: {mongo_id}")
+            await update_rollups(source, record["timestamp"], detections)
+        except Exception as e:
+            if not core.OFFLINE_SPOOL:
+                raise
+            core.report_service('storage', e)
+            print(f"[ERROR] Storage insert failed, spooling: {str(e)}")
+
+    queued = mongo_id is None and core.OFFLINE_SPOOL
+    if queued:
+        mongo_id = await io_executor.run(core.spool_detection_record, record, jpeg_bytes)
+    elif mongo_id is None:
+        # Như core.save_detection_result: không có id thật thì không phát event SSE
+        mongo_id = "no-mongodb"
+    else:
+        core.publish_detection_event(mongo_id, record["timestamp"], detections, source,
+                                     core.build_thumbnail_url(record["upload"]))
+
+    return core.detection_payload(record, mongo_id, tiled, queued)
+
+
+async def detect_shrimp(request):
+    """/api/detect-shrimp: body đọc trên event loop, CPU trên cpu executor, upload/lưu async"""
+    started = core.detection_started()
+    response = None
+    try:
+        response = await _detect_shrimp(request)
+        return response
+    finally:
+        core.detection_finished(started, response.status if response is not None else 500)
+
+
+async def _detect_shrimp(request):
+    try:
+        body = await request.read()
+        data = await cpu_executor.run(loads_json, body)
+        del body
+        source, lane, tiled = core.parse_detection_request(data)
+    except web.HTTPRequestEntityTooLarge as e:
+        return error_response(e.text, 413)
+    except ExecutorBusy as e:
+        return busy_response(e)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        print(f"[INFO] Receiving image from {source}")
+        jpeg_bytes, detections, inference_time = await cpu_executor.run(
+            core.run_image_detection, data, source, lane, tiled)
+        payload = await save_detection_result(jpeg_bytes, detections, inference_time, source, tiled)
+        return negotiated_response(request, payload)
+    except ImageTooLarge as e:
+        print(f"[ERROR] {str(e)}")
+        return error_response(str(e), 413)
+    except MemoryBudgetExceeded as e:
+        print(f"[ERROR] {str(e)}")
+        return error_response(str(e), 503, {"Retry-After": "2"})
+    except ExecutorBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return error_response(f"Error: {str(e)}", 500)
+
+
+# ==================== GALLERY API ====================
+async def cached_gallery_response(request, handler):
+    """Như core.cached_gallery_response: cache dùng chung, ETag (không Last-Modified), 304"""
+    store = get_async_store()
+    if not core.GALLERY_CACHE or store is None:
+        return await handler(request)
+
+    changes = store.changes
+    version = (id(changes), changes.version)
+    key = (request.path, tuple(sorted(request.query.items())), accepts_msgpack(request.headers.get('Accept')))
+
+    entry = core.gallery_cache.get(key, version)
+    if entry is None:
+        response = await handler(request)
+        if response.status != 200:
+            return response
+        headers = {name: response.headers[name] for name in core.CACHED_RESPONSE_HEADERS
+                   if name in response.headers}
+        entry = core.gallery_cache.put(key, CachedResponse(response.body, response.content_type,
+                                                           headers, version))
+
+    headers = dict(entry.headers)
+    headers.update({
+        "ETag": f'"{entry.etag}"',
+        # Client được lưu nhưng phải hỏi lại server trước khi dùng
+        "Cache-Control": "no-cache",
+        "Vary": "Accept"
+    })
+    if_none_match = request.headers.get('If-None-Match')
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')] if if_none_match else []
+    if headers["ETag"] in tags or '*' in tags:
+        core.gallery_cache.record_not_modified()
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=entry.body, content_type=entry.mimetype, headers=headers)
+
+
+async def _get_images(request):
+    try:
+        store = get_async_store()
+        if store is None:
+            return json_response([])
+
+        form = request.query.get('detections', 'verbose')
+        if form not in core.DETECTION_FORMS:
+            return error_response("detections must be verbose, compact or none", 400)
+
+        query = core.parse_gallery_query(request.query)
+        images = await store.list(**query)
+        headers = core.format_gallery_page(images, form, query["limit"])
+        print(f"[INFO] Returning {len(images)} images")
+        return negotiated_response(request, images, headers=headers)
+    except ValueError as e:
+        return error_response(f"Invalid parameter: {str(e)}", 400)
+    except ExecutorBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        return error_response(str(e), 500)
+
+
+async def _get_image_detail(request):
+    try:
+        store = get_async_store()
+        if store is None:
+            return error_response("Storage not available", 503)
+
+        form = request.query.get('detections', 'verbose')
+        if form not in core.DETECTION_FORMS:
+            form = 'verbose'
+
+        image = await store.get(request.match_info['image_id'])
+        if image:
+            core.format_document_detections(image, form)
+            return negotiated_response(request, image)
+        return error_response("Image not found", 404)
+    except ExecutorBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_images(request):
+    return await cached_gallery_response(request, _get_images)
+
+
+async def get_image_detail(request):
+    return await cached_gallery_response(request, _get_image_detail)
+
+
+async def delete_image(request):
+    image_id = request.match_info['image_id']
+    try:
+        store = get_async_store()
+        if store is None:
+            return error_response("Storage not available", 503)
+
+        deleted = await store.delete(image_id)
+        if deleted is None:
+            return error_response("Image not found", 404)
+        await update_rollups(deleted.get('capturedFrom', 'unknown'), deleted.get('timestamp', 0),
+                             document_detections(deleted), sign=-1)
+        await delete_cloudinary_asset(deleted)
+        print(f"[INFO] Deleted image {image_id}")
+        return json_response({"success": True, "message": "Image deleted successfully"})
+    except ExecutorBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+# ==================== LIVE EVENTS (SSE) ====================
+# Handler SSE/MJPEG chỉ kết thúc khi client ngắt: on_shutdown huỷ chúng,
+# nếu không graceful shutdown sẽ chờ hết shutdown_timeout (60s) mới tắt
+stream_tasks = set()
+
+
+def tracks_stream(handler):
+    @functools.wraps(handler)
+    async def wrapper(request):
+        task = asyncio.current_task()
+        stream_tasks.add(task)
+        try:
+            return await handler(request)
+        finally:
+            stream_tasks.discard(task)
+    return wrapper
+
+
+async def sse_events(subscription):
+    """Async generator text/event-stream: event mới hoặc keep-alive mỗi SSE_HEARTBEAT_SECONDS"""
+    yield "retry: 3000\n\n"
+    while True:
+        event = await subscription.get(timeout=core.SSE_HEARTBEAT_SECONDS)
+        if event is None:
+            # Giữ kết nối qua proxy/ngrok
+            yield ": keep-alive\n\n"
+            continue
+        yield core.format_sse(event)
+
+
+@tracks_stream
+async def detection_events(request):
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream',
+                                           'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+    subscription = core.event_hub.subscribe_async(last_event_id=last_event_id)
+    events = sse_events(subscription)
+    try:
+        async for chunk in events:
+            await response.write(chunk.encode('utf-8'))
+    except ConnectionResetError:
+        pass
+    finally:
+        await events.aclose()
+        subscription.close()
+    return response
+
+
+# ==================== CAMERA STREAMING ====================
+class FrameSignal:
+    """Đánh thức các client stream trên event loop khi capture thread có frame mới"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._future = loop.create_future()
+
+    def notify_threadsafe(self, seq):
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Event loop đã đóng
+            pass
+
+    def _wake(self):
+        future, self._future = self._future, self._loop.create_future()
+        future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def mjpeg_frames(settings, name=None):
+    """Như core.generate_frames nhưng là async generator: chờ frame/nhịp FPS không giữ thread"""
+    source = core.cameras.get(name)
+
+    if source is None:
+        # Nếu không có camera, trả về ảnh placeholder
+        placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(placeholder, "No Camera", (200, 240),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        width = quantize_width(settings.width, placeholder.shape[1])
+        frame = encode_frame(placeholder, settings.quality, width)
+        while True:
+            if frame:
+                yield core._multipart_frame(frame)
+            await asyncio.sleep(max(0.1, settings.frame_interval))
+
+    with core.active_streams_lock:
+        core.active_streams += 1
+
+    try:
+        signal = frame_signals[source.name]
+        encoder = core.frame_encoders[source.name]
+        controller = None
+        last_seq = 0
+        while True:
+            started = time.time()
+            seq, frame, _ = source.latest()
+            if frame is None or seq == last_seq:
+                await signal.wait(1.0)
+                continue
+            last_seq = seq
+
+            max_width = frame.shape[1]
+            if settings.adaptive:
+                if controller is None:
+                    controller = AdaptiveStreamController(settings, max_width)
+                quality, width = controller.current()
+            else:
+                quality, width = settings.quality, quantize_width(settings.width, max_width)
+
+            try:
+                jpeg = await stream_executor.run(encoder.get, seq, frame, quality, width)
+            except ExecutorBusy:
+                # Encoder quá tải: bỏ frame này
+                continue
+            if jpeg is None:
+                continue
+
+            # Consumer chỉ lấy chunk tiếp theo sau khi ghi xong (await write có backpressure),
+            # nên thời gian quanh yield là thời gian ghi socket như bản Flask
+            write_started = time.time()
+            yield core._multipart_frame(jpeg)
+            write_time = time.time() - write_started
+
+            interval = settings.frame_interval
+            if controller is not None:
+                controller.record(len(jpeg), write_time)
+                interval = controller.frame_interval
+
+            remaining = interval - (time.time() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+    finally:
+        with core.active_streams_lock:
+            core.active_streams -= 1
+
+
+@tracks_stream
+async def stream_response(request):
+    name = request.match_info.get('name')
+    if name is not None and core.cameras.get(name) is None:
+        return error_response(f"Camera not found: {name}", 404)
+
+    response = web.StreamResponse(headers={'Content-Type': 'multipart/x-mixed-replace; boundary=frame'})
+    await response.prepare(request)
+    frames = mjpeg_frames(StreamSettings.from_args(request.query), name)
+    try:
+        async for chunk in frames:
+            await response.write(chunk)
+    except ConnectionResetError:
+        pass
+    finally:
+        await frames.aclose()
+    return response
+
+
+async def blynk_feed(request):
+    """Camera stream endpoint (no auth for app)"""
+    return await stream_response(request)
+
+
+async def video_feed(request):
+    """Camera stream endpoint (with auth)"""
+    if not authorized(request):
+        return authenticate()
+    return await stream_response(request)
+
+
+# ==================== FLASK FALLBACK (WSGI) ====================
+HOP_BY_HOP_HEADERS = ('content-length', 'transfer-encoding', 'connection')
+
+
+def wsgi_environ(request, body):
+    """environ WSGI cho request aiohttp (body đã đọc xong)"""
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': request.path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': request.url.host or 'localhost',
+        'SERVER_PORT': str(request.url.port or ASYNC_PORT),
+        'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in request.headers.items():
+        key = name.upper().replace('-', '_')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            continue
+        key = f"HTTP_{key}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_flask(environ):
+    """Chạy app Flask (trên io executor), trả về (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, headers
+
+    result = core.app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response["status"], response["headers"], body
+
+
+async def flask_fallback(request):
+    """Route không có bản async: chạy handler Flask của app_complete"""
+    try:
+        body = await request.read()
+        status, headers, body = await io_executor.run(call_flask, wsgi_environ(request, body))
+    except web.HTTPRequestEntityTooLarge as e:
+        return error_response(e.text, 413)
+    except ExecutorBusy as e:
+        return busy_response(e)
+
+    code, _, reason = status.partition(' ')
+    response = web.Response(status=int(code), reason=reason or None, body=body)
+    for name, value in headers:
+        if name.lower() not in HOP_BY_HOP_HEADERS:
+            response.headers.add(name, value)
+    return response
+
+
+# ==================== APP ====================
+def async_server_stats():
+    return {
+        "mongo": "motor" if motor_client is not None else "executor",
+        "cpu": cpu_executor.stats(),
+        "io": io_executor.stats(),
+        "stream": stream_executor.stats()
+    }
+
+
+async def on_startup(app):
+    global http_session
+    http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=CLOUDINARY_TIMEOUT_SECONDS))
+    loop = asyncio.get_running_loop()
+    for name in core.cameras.names():
+        frame_signals[name] = FrameSignal(loop)
+        core.cameras.get(name).add_listener(frame_signals[name].notify_threadsafe)
+    core.health_extensions["asyncServer"] = async_server_stats
+
+
+async def on_shutdown(app):
+    """Đóng các kết nối SSE/MJPEG đang mở (finally của handler đóng subscription/generator)"""
+    for task in list(stream_tasks):
+        task.cancel()
+
+
+async def on_cleanup(app):
+    await http_session.close()
+    if motor_client is not None:
+        motor_client.close()
+    for executor in (cpu_executor, io_executor, stream_executor):
+        executor.shutdown()
+
+
+def create_app():
+    app = web.Application(client_max_size=core.MAX_UPLOAD_MB * 1024 * 1024)
+    app.router.add_post('/api/detect-shrimp', detect_shrimp)
+    app.router.add_get('/api/shrimp-images', get_images)
+    app.router.add_get('/api/shrimp-images/{image_id}', get_image_detail)
+    app.router.add_delete('/api/shrimp-images/{image_id}', delete_image)
+    app.router.add_get('/api/events', detection_events)
+    app.router.add_get('/blynk_feed', blynk_feed)
+    app.router.add_get('/blynk_feed/{name}', blynk_feed)
+    app.router.add_get('/video_feed', video_feed)
+    app.router.add_get('/video_feed/{name}', video_feed)
+    # Mọi route khác (và OPTIONS preflight CORS) do Flask xử lý
+    app.router.add_route('*', '/{tail:.*}', flask_fallback)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    app.on_response_prepare.append(add_cors_headers)
+    return app
+
+
+def run(host='0.0.0.0', port=ASYNC_PORT):
+    web.run_app(create_app(), host=host, port=port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    print("\n" + "="*50)
+    print("🦐 Shrimp Detection Server (asyncio) Starting...")
+    print("="*50)
+    print(f"Camera: {'✅ ' + ', '.join(core.cameras.names()) if len(core.cameras) else '❌ Not found'}")
+    print(f"Model: {'✅ Loaded' if core.interpreter else '❌ Not loaded'}")
+    print(f"MongoDB: {'✅ Connected' if core.collection is not None else '❌ Not connected'}"
+          f"{' (motor)' if ASYNC_MONGO and AsyncIOMotorClient is not None else ''}")
+    print(f"Storage: {'✅ ' + core.DETECTION_DB if core.store is not None else '❌ Not available'}")
+    print(f"Executors: cpu {ASYNC_CPU_WORKERS} (+{ASYNC_CPU_QUEUE} queued), io {ASYNC_IO_WORKERS}, "
+          f"stream {ASYNC_STREAM_WORKERS}")
+    print(f"Listening on port {ASYNC_PORT} (same endpoints as app_complete.py)")
+    print("="*50 + "\n")
+
+    run()
@@ -3,81 +3,92 @@ from flask_cors import CORS
 from functools import wraps
 import cloudinary
 import cloudinary.uploader
+import cloudinary.api
+import cloudinary.exceptions
 from pymongo import MongoClient
 import base64
 from io import BytesIO
-from PIL import Image
 import numpy as np
 import time
 import os
 from dotenv import load_dotenv
 import cv2
-from bson import ObjectId
 import threading
+import json
+from markupsafe import escape
+from werkzeug.exceptions import RequestEntityTooLarge
+from event_hub import EventHub
+from camera_registry import (CameraRegistry, InferenceScheduler, parse_camera_specs,
+                             open_camera, probe_cameras)
+from mjpeg_stream import (StreamSettings, SharedFrameEncoder, AdaptiveStreamController,
+                          encode_frame, quantize_width)
+from detector import (MODEL_PATH, interpreter, run_inference, parse_yolo_output, DEFAULT_CALIBRATION,
+                      draw_detections, detect_tiled, TILED_INFERENCE,
+                      decode_image, tiled_decode_side, check_image_size, reduction_factor,
+                      ImageTooLarge, interpreter_lock, tile_regions, batch_input_bytes, TILE_MAX_COUNT,
+                      batch_interpreters)
+from inference_lanes import LANES, inference_lane
+from motion_gate import MotionGate
+from tracker import ShrimpTracker, average_frame_detections
+from frame_recorder import FrameRecorder, RecordingReader
+from roi import RoiConfig, detect_rois
+from size_estimator import CalibrationConfig
+from detection_codec import (pack_detections, document_detections, format_document_detections,
+                             detections_summary)
+from serialization import FastJSONProvider, negotiated_response, wants_msgpack
+from response_cache import ResponseCache, CachedResponse
+from rollups import ensure_rollup_indexes, record_detections, query_rollups, HOUR_MS
+from offline_spool import OfflineSpool, SpoolForwarder
+from memory_budget import MemoryBudget, MemoryBudgetExceeded, estimate_request_bytes
+from retention import AssetDeleter, RetentionPurger, RateLimited, document_public_id
+from detection_store import (MongoDetectionStore, SQLiteDetectionStore,
+                             encode_cursor, decode_cursor, parse_filters)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # ==================== CAMERA SETUP ====================
+# Tên source của camera mặc định gắn với Pi (live detection, snapshot, ROI)
+CAMERA_SOURCE = os.getenv('CAMERA_SOURCE', 'pi-camera')
+# VD: CAMERAS=tank1=/dev/video0,tank2=/dev/video2:1280x720@15 (trống: tự dò)
+CAMERAS = os.getenv('CAMERAS', '')
+MAX_CAMERAS = int(os.getenv('MAX_CAMERAS', '4'))
+
 print("Initializing camera...")
-camera = None
-camera_lock = threading.Lock()
-
-for i in range(30):
-    test_cam = cv2.VideoCapture(i, cv2.CAP_V4L2)
-    if test_cam.isOpened():
-        ret, frame = test_cam.read()
-        if ret:
-            print(f"✅ Camera found at /dev/video{i}")
-            camera = test_cam
-            break
-        test_cam.release()
-
-if camera is None:
+cameras = CameraRegistry()
+
+try:
+    if CAMERAS:
+        opened = []
+        for settings in parse_camera_specs(CAMERAS, CAMERA_SOURCE):
+            device = open_camera(settings.device)
+            if device is None:
+                print(f"⚠️  Camera {settings.name} ({settings.device}) not available")
+                continue
+            opened.append((settings, device))
+    else:
+        opened = probe_cameras(CAMERA_SOURCE, max_cameras=MAX_CAMERAS)
+except ValueError as e:
+    print(f"⚠️  Invalid CAMERAS: {e}")
+    opened = []
+
+if not opened:
     print("⚠️  Warning: No camera found! Camera streaming will not work.")
 else:
     time.sleep(2)
-    camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    camera.set(cv2.CAP_PROP_FPS, 30)
-    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-    camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-    print("✅ Camera initialized successfully!")
+    # Mỗi camera 1 thread đọc riêng, các client stream dùng chung frame mới nhất
+    for settings, device in opened:
+        cameras.add(settings, device)
+        print(f"✅ Camera {settings.name} initialized ({settings.to_dict()['device']}, "
+              f"{settings.width}x{settings.height}@{settings.fps:g})")
 
-# ==================== AI MODEL SETUP ====================
-MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'models/best-fp16(1).tflite')
-print(f"\nLoading TFLite model from {MODEL_PATH}...")
-
-try:
-    from tflite_runtime.interpreter import Interpreter
-    print("Using tflite_runtime")
-except ImportError:
-    try:
-        import tensorflow as tf
-        Interpreter = tf.lite.Interpreter
-        print("Using tensorflow.lite")
-    except ImportError:
-        print("⚠️  Warning: No TFLite runtime found! Detection will not work.")
-        Interpreter = None
-
-if Interpreter and os.path.exists(MODEL_PATH):
-    interpreter = Interpreter(model_path=MODEL_PATH)
-    interpreter.allocate_tensors()
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    input_shape = input_details[0]['shape']
-    INPUT_HEIGHT = input_shape[1]
-    INPUT_WIDTH = input_shape[2]
-    print(f"✅ TFLite model loaded successfully!")
-    print(f"   Input shape: {input_shape}")
-else:
-    print("⚠️  Warning: Model not loaded!")
-    interpreter = None
-    INPUT_HEIGHT = 320
-    INPUT_WIDTH = 320
+# Camera mặc định (đầu tiên) cho các endpoint không chỉ định camera
+capture = cameras.get()
+camera = capture.camera if capture is not None else None
 
 # ==================== CLOUDINARY SETUP ====================
 cloudinary.config(
@@ -90,15 +101,63 @@ print("✅ Cloudinary configured!")
 # ==================== MONGODB SETUP ====================
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
 MONGODB_DB = os.getenv('MONGODB_DATABASE', 'shrimp_db')
-try:
-    mongo_client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    mongo_client.server_info()  # Test connection
-    db = mongo_client[MONGODB_DB]
-    collection = db['detections']
-    print(f"✅ Connected to MongoDB: {MONGODB_DB}")
-except Exception as e:
-    print(f"⚠️  MongoDB connection failed: {e}")
-    collection = None
+# 'verbose': detections là list dict như cũ; 'packed': mảng nhị phân gọn (detection_codec)
+DETECTION_STORAGE = os.getenv('DETECTION_STORAGE', 'verbose')
+DETECTION_FORMS = ('verbose', 'compact', 'none')
+# Nơi lưu gallery: 'mongodb' hoặc 'sqlite' (database nhúng cho Pi không có MongoDB)
+DETECTION_DB = os.getenv('DETECTION_DB', 'mongodb')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'shrimp_detections.db')
+GALLERY_PAGE_SIZE = 100
+GALLERY_MAX_PAGE_SIZE = 500
+mongo_client = None
+collection = None
+rollup_collection = None
+store = None
+
+def connect_mongodb():
+    """Kết nối MongoDB; spool forwarder gọi lại hàm này khi Pi khởi động lúc mất mạng"""
+    global mongo_client, db, collection, rollup_collection, store
+    client = None
+    try:
+        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
+        client.server_info()  # Test connection
+        db = client[MONGODB_DB]
+        # Rollup biomass theo giờ/nguồn, cập nhật mỗi lần lưu detection
+        ensure_rollup_indexes(db['rollups'])
+        mongo_client = client
+        collection = db['detections']
+        rollup_collection = db['rollups']
+        if DETECTION_DB == 'mongodb':
+            store = MongoDetectionStore(collection)
+            start_summary_backfill(store)
+        print(f"✅ Connected to MongoDB: {MONGODB_DB}")
+    except Exception as e:
+        print(f"⚠️  MongoDB connection failed: {e}")
+        if client is not None:
+            client.close()
+    return collection
+
+def start_summary_backfill(detection_store):
+    """Điền field summary cho document lưu trước khi có field này (thread nền, từng lô)"""
+    def run():
+        total = 0
+        try:
+            while True:
+                updated = detection_store.backfill_summaries()
+                if not updated:
+                    break
+                total += updated
+        except Exception as e:
+            print(f"[ERROR] Summary backfill: {str(e)}")
+        if total:
+            print(f"[INFO] Backfilled summary for {total} images")
+    threading.Thread(target=run, name="summary-backfill", daemon=True).start()
+
+connect_mongodb()
+if DETECTION_DB == 'sqlite':
+    store = SQLiteDetectionStore(SQLITE_PATH)
+    start_summary_backfill(store)
+    print(f"✅ Using SQLite storage: {SQLITE_PATH}")
 
 # ==================== AUTH SETUP ====================
 USERNAME = os.getenv('CAMERA_USERNAME', 'admin')
@@ -121,354 +180,926 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
-# ==================== AI FUNCTIONS ====================
-CLASS_NAMES = ['shrimp']
+# ==================== LIVE EVENTS (SSE) ====================
+# Mỗi client SSE có buffer riêng, client chậm chỉ bị mất event cũ của nó
+SSE_CLIENT_BUFFER = int(os.getenv('SSE_CLIENT_BUFFER', '32'))
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '320'))
 
-# Hằng số để tính toán kích thước thực tế của tôm
-# Giả định: Camera ở độ cao cố định, FOV cố định
-# Bạn có thể điều chỉnh các hằng số này dựa trên setup thực tế
-PIXEL_TO_CM_RATIO = 0.02  # 1 pixel = 0.02 cm (điều chỉnh theo setup camera của bạn)
-# Công thức tính khối lượng tôm: W = a * L^b (W: gram, L: cm)
-# Dựa trên nghiên cứu tôm thẻ chân trắng (Litopenaeus vannamei)
-LENGTH_WEIGHT_A = 0.0065  # Hệ số a
-LENGTH_WEIGHT_B = 3.1     # Hệ số b (thường từ 2.8 - 3.2)
+event_hub = EventHub(client_buffer_size=SSE_CLIENT_BUFFER)
 
-def calculate_shrimp_length(bbox_width, bbox_height):
-    """
-    Tính chiều dài tôm từ bounding box
-    Args:
-        bbox_width: chiều rộng bounding box (pixels)
-        bbox_height: chiều cao bounding box (pixels)
-    Returns:
-        length: chiều dài ước tính (cm)
-    """
-    # Sử dụng cạnh lớn nhất của bounding box làm chiều dài
-    max_dimension = max(bbox_width, bbox_height)
-    # Chuyển đổi từ pixel sang cm
-    length_cm = max_dimension * PIXEL_TO_CM_RATIO
-    return round(length_cm, 2)
+def build_thumbnail_url(upload_result):
+    """Tạo URL thumbnail từ Cloudinary (resize phía Cloudinary, không tốn CPU của Pi)"""
+    public_id = upload_result.get('public_id') if upload_result else None
+    if not public_id:
+        return upload_result.get('secure_url') if upload_result else None
+    try:
+        return cloudinary.CloudinaryImage(public_id).build_url(
+            width=THUMBNAIL_SIZE, height=THUMBNAIL_SIZE, crop='fill', secure=True)
+    except Exception:
+        return upload_result.get('secure_url')
+
+def publish_detection_event(image_id, timestamp, detections, source, thumbnail_url):
+    """Phát kết quả detection mới tới các client SSE (từ upload hoặc camera loop)"""
+    event_hub.publish('detection', {
+        "id": image_id,
+        "timestamp": timestamp,
+        "count": len(detections),
+        "totalWeight": detections_summary(detections)["totalWeight"],
+        "thumbnailUrl": thumbnail_url,
+        "capturedFrom": source
+    })
+
+def format_sse(event):
+    """Đóng gói event theo định dạng text/event-stream"""
+    return (f"id: {event['id']}\n"
+            f"event: {event['event']}\n"
+            f"data: {json.dumps(event['data'])}\n\n")
 
-def calculate_shrimp_weight(length_cm):
+# ==================== CAMERA STREAMING ====================
+# seq của mỗi camera độc lập nên mỗi camera 1 encoder cache riêng
+frame_encoders = {name: SharedFrameEncoder() for name in cameras.names()}
+frame_encoder = frame_encoders.get(cameras.default) or SharedFrameEncoder()
+active_streams = 0
+active_streams_lock = threading.Lock()
+
+def _multipart_frame(jpeg):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+def generate_frames(settings=None, name=None):
     """
-    Ước tính khối lượng tôm từ chiều dài
-    Sử dụng công thức: W = a * L^b
+    Generate camera frames for MJPEG streaming
+    Mỗi client có quality/độ phân giải/FPS riêng (StreamSettings),
+    JPEG được encode 1 lần cho mỗi tổ hợp tham số và dùng chung giữa các client
     Args:
-        length_cm: chiều dài tôm (cm)
-    Returns:
-        weight: khối lượng ước tính (gram)
+        name: tên camera (mặc định: camera đầu tiên)
     """
-    if length_cm <= 0:
-        return 0.0
-
-    weight_gram = LENGTH_WEIGHT_A * (length_cm ** LENGTH_WEIGHT_B)
-    return round(weight_gram, 2)
-
-def preprocess_image(image_np):
-    """Tiền xử lý ảnh cho TFLite model"""
-    img = cv2.resize(image_np, (INPUT_WIDTH, INPUT_HEIGHT))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype(np.float32) / 255.0
-    img = np.expand_dims(img, axis=0)
-    return img
-
-def run_inference(image_np):
-    """Chạy inference với TFLite model"""
-    if interpreter is None:
-        return []
-
-    input_data = preprocess_image(image_np)
-    interpreter.set_tensor(input_details[0]['index'], input_data)
-    interpreter.invoke()
-
-    outputs = []
-    for output in output_details:
-        outputs.append(interpreter.get_tensor(output['index']))
-
-    return outputs
-
-def parse_yolo_output(outputs, original_shape, conf_threshold=0.25, iou_threshold=0.45):
-    """Parse YOLO TFLite output và apply NMS"""
-    detections = []
-    orig_h, orig_w = original_shape[:2]
-
-    if len(outputs) == 0:
-        return detections
-
-    if len(outputs) == 1:
-        output = outputs[0]
-
-        if len(output.shape) == 3:
-            output = output[0]
-
-            boxes = []
-            scores = []
-            class_ids = []
-
-            for detection in output:
-                if len(detection) >= 6:
-                    x, y, w, h, conf = detection[:5]
-
-                    if conf < conf_threshold:
-                        continue
-
-                    if len(detection) == 6:
-                        class_id = int(detection[5])
-                    else:
-                        class_scores = detection[5:]
-                        class_id = np.argmax(class_scores)
-                        conf = conf * class_scores[class_id]
-
-                    if conf < conf_threshold:
-                        continue
-
-                    x1 = int((x - w/2) * orig_w)
-                    y1 = int((y - h/2) * orig_h)
-                    x2 = int((x + w/2) * orig_w)
-                    y2 = int((y + h/2) * orig_h)
-
-                    boxes.append([x1, y1, x2, y2])
-                    scores.append(float(conf))
-                    class_ids.append(class_id)
-
-            if len(boxes) > 0:
-                indices = cv2.dnn.NMSBoxes(boxes, scores, conf_threshold, iou_threshold)
-
-                if len(indices) > 0:
-                    for i in indices.flatten():
-                        x1, y1, x2, y2 = boxes[i]
-                        w = x2 - x1
-                        h = y2 - y1
-                        x = x1 + w/2
-                        y = y1 + h/2
-
-                        # Tính chiều dài và khối lượng tôm
-                        length_cm = calculate_shrimp_length(w, h)
-                        weight_gram = calculate_shrimp_weight(length_cm)
-
-                        detections.append({
-                            "className": CLASS_NAMES[class_ids[i]] if class_ids[i] < len(CLASS_NAMES) else f"class_{class_ids[i]}",
-                            "confidence": scores[i],
-                            "bbox": {
-                                "x": float(x),
-                                "y": float(y),
-                                "width": float(w),
-                                "height": float(h)
-                            },
-                            "length": length_cm,    # Chiều dài (cm)
-                            "weight": weight_gram   # Khối lượng (gram)
-                        })
-
-    return detections
-
-def draw_detections(image_np, detections):
-    """Vẽ bounding boxes lên ảnh"""
-    img = image_np.copy()
-
-    for det in detections:
-        bbox = det['bbox']
-        x = int(bbox['x'])
-        y = int(bbox['y'])
-        w = int(bbox['width'])
-        h = int(bbox['height'])
-
-        x1 = int(x - w/2)
-        y1 = int(y - h/2)
-        x2 = int(x + w/2)
-        y2 = int(y + h/2)
-
-        color = (0, 255, 0)
-        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-
-        # Label với confidence, length và weight
-        conf = det['confidence']
-        length = det.get('length', 0)
-        weight = det.get('weight', 0)
-        label = f"{det['className']} {conf:.2f}"
-        label2 = f"L:{length}cm W:{weight}g"
-
-        # Vẽ background cho label chính
-        label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-        cv2.rectangle(img, (x1, y1 - label_size[1] - 10),
-                     (x1 + label_size[0], y1), color, -1)
-        cv2.putText(img, label, (x1, y1 - 5),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-
-        # Vẽ background cho label length/weight
-        label2_size, _ = cv2.getTextSize(label2, cv2.FONT_HERSHEY_SIMPLEX, 0.4, 1)
-        cv2.rectangle(img, (x1, y2),
-                     (x1 + label2_size[0] + 4, y2 + label2_size[1] + 8),
-                     color, -1)
-        cv2.putText(img, label2, (x1 + 2, y2 + label2_size[1] + 4),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
-
-    return img
+    global active_streams
+    settings = settings or StreamSettings()
+    source = cameras.get(name)
 
-# ==================== CAMERA STREAMING ====================
-def generate_frames():
-    """Generate camera frames for MJPEG streaming"""
-    if camera is None:
+    if source is None:
         # Nếu không có camera, trả về ảnh placeholder
+        placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(placeholder, "No Camera", (200, 240),
+                   cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        width = quantize_width(settings.width, placeholder.shape[1])
+        frame = encode_frame(placeholder, settings.quality, width)
         while True:
-            placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(placeholder, "No Camera", (200, 240),
-                       cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
-            ret, buffer = cv2.imencode('.jpg', placeholder)
-            if ret:
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.1)
-    else:
-        while True:
-            with camera_lock:
-                camera.grab()
-                success, frame = camera.retrieve()
+            if frame:
+                yield _multipart_frame(frame)
+            time.sleep(max(0.1, settings.frame_interval))
+
+    with active_streams_lock:
+        active_streams += 1
 
-            if not success:
-                time.sleep(0.05)
+    try:
+        controller = None
+        last_seq = 0
+        while True:
+            started = time.time()
+            seq, frame, _ = source.wait_for_frame(last_seq, timeout=1.0)
+            if frame is None or seq == last_seq:
+                continue
+            last_seq = seq
+
+            max_width = frame.shape[1]
+            if settings.adaptive:
+                if controller is None:
+                    controller = AdaptiveStreamController(settings, max_width)
+                quality, width = controller.current()
+            else:
+                quality, width = settings.quality, quantize_width(settings.width, max_width)
+
+            jpeg = frame_encoders[source.name].get(seq, frame, quality, width)
+            if jpeg is None:
                 continue
 
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            if ret:
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.033)
+            # Werkzeug chỉ gọi lại generator sau khi ghi xong chunk vào socket,
+            # nên thời gian quanh yield chính là thời gian ghi (bị chặn khi mạng chậm)
+            write_started = time.time()
+            yield _multipart_frame(jpeg)
+            write_time = time.time() - write_started
+
+            interval = settings.frame_interval
+            if controller is not None:
+                controller.record(len(jpeg), write_time)
+                interval = controller.frame_interval
+
+            remaining = interval - (time.time() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    finally:
+        with active_streams_lock:
+            active_streams -= 1
+
+def camera_not_found(name):
+    return jsonify({
+        "success": False,
+        "message": f"Camera not found: {name}"
+    }), 404
+
+def stream_response(name):
+    if name is not None and cameras.get(name) is None:
+        return camera_not_found(name)
+    return Response(generate_frames(StreamSettings.from_args(request.args), name),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/blynk_feed')
-def blynk_feed():
-    """Camera stream endpoint (no auth for app)"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/blynk_feed/<name>')
+def blynk_feed(name=None):
+    """
+    Camera stream endpoint (no auth for app)
+    Query: quality (10-95), width (px), fps (1-30), adaptive (0/1)
+    """
+    return stream_response(name)
 
 @app.route('/video_feed')
+@app.route('/video_feed/<name>')
 @requires_auth
-def video_feed():
+def video_feed(name=None):
     """Camera stream endpoint (with auth)"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    return stream_response(name)
 
 @app.route('/blynk_player')
-def blynk_player():
-    """HTML player for camera stream"""
-    return '''
+@app.route('/blynk_player/<name>')
+def blynk_player(name=None):
+    """HTML player for camera stream (chuyển tiếp query string cho /blynk_feed)"""
+    query = request.query_string.decode('utf-8', 'ignore')
+    feed = f"/blynk_feed/{escape(name)}" if name else "/blynk_feed"
+    src = f"{feed}?{escape(query)}" if query else feed
+    return f'''
     <html>
     <head><title>Camera Stream</title></head>
     <body style="margin:0;padding:0;">
-    <img src="/blynk_feed" style="width:100%;height:100%;">
+    <img src="{src}" style="width:100%;height:100%;">
     </body>
     </html>
     '''
 
+# ==================== REGION OF INTEREST ====================
+# Chỉ đưa vùng bể nuôi vào model (bỏ tường, sàn, thiết bị quanh bể), cấu hình theo source
+ROI_CONFIG = os.getenv('ROI_CONFIG', 'roi.json')
+roi_config = RoiConfig(ROI_CONFIG)
+try:
+    roi_config.load()
+    if roi_config.sets:
+        print(f"✅ ROI configured for: {', '.join(roi_config.sets)}")
+except (OSError, ValueError) as e:
+    print(f"⚠️  Invalid ROI config {ROI_CONFIG}: {e}")
+
+@app.route('/api/roi', methods=['GET'])
+def get_roi():
+    """Cấu hình ROI hiện tại (toạ độ tương đối 0-1)"""
+    return jsonify(roi_config.to_dict())
+
+@app.route('/api/roi', methods=['PUT'])
+@requires_auth
+def update_roi():
+    """
+    Thay cấu hình ROI và lưu vào ROI_CONFIG
+    Body: {"<source>": [{"rect": [x1, y1, x2, y2]} | {"polygon": [[x, y], ...]}], "*": [...]}
+    """
+    try:
+        roi_config.update(request.get_json())
+        print(f"[INFO] ROI updated for: {', '.join(roi_config.sets) or 'none'}")
+        return jsonify(roi_config.to_dict())
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid ROI config: {str(e)}"
+        }), 400
+
+# ==================== SIZE CALIBRATION ====================
+# Quy đổi pixel -> cm theo từng camera (tỉ lệ, vật mẫu hoặc homography), xem size_estimator.py
+CALIBRATION_CONFIG = os.getenv('CALIBRATION_CONFIG', 'calibration.json')
+calibration_config = CalibrationConfig(CALIBRATION_CONFIG, DEFAULT_CALIBRATION)
+try:
+    calibration_config.load()
+    if calibration_config.profiles:
+        print(f"✅ Size calibration for: {', '.join(calibration_config.profiles)}")
+except (OSError, ValueError, KeyError, TypeError) as e:
+    print(f"⚠️  Invalid calibration config {CALIBRATION_CONFIG}: {e}")
+
+@app.route('/api/calibration', methods=['GET'])
+def get_calibration():
+    """Cấu hình hiệu chuẩn kích thước hiện tại theo camera/source"""
+    return jsonify(calibration_config.to_dict())
+
+@app.route('/api/calibration', methods=['PUT'])
+@requires_auth
+def update_calibration():
+    """
+    Thay cấu hình hiệu chuẩn và lưu vào CALIBRATION_CONFIG
+    Body: {"<source>": {"cmPerPixel": 0.02} | {"marker": {"pixels": 180, "cm": 5}}
+                     | {"points": {"image": [[x, y], ...], "plane": [[cm, cm], ...]}}, "*": {...}}
+    """
+    try:
+        calibration_config.update(request.get_json())
+        print(f"[INFO] Calibration updated for: {', '.join(calibration_config.profiles) or 'none'}")
+        return jsonify(calibration_config.to_dict())
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid calibration config: {str(e)}"
+        }), 400
+
+# ==================== RECORDING ====================
+# Ghi frame camera gần đây ra đĩa (segment JPEG + index) để chạy lại detection sau này
+RECORDING = os.getenv('RECORDING', '0') == '1'
+RECORDING_DIR = os.getenv('RECORDING_DIR', 'recordings')
+RECORDING_FPS = float(os.getenv('RECORDING_FPS', '2'))
+RECORDING_SEGMENT_SECONDS = int(os.getenv('RECORDING_SEGMENT_SECONDS', '60'))
+RECORDING_MAX_MB = int(os.getenv('RECORDING_MAX_MB', '2048'))
+RECORDING_QUALITY = int(os.getenv('RECORDING_QUALITY', '80'))
+
+def recording_dir(name):
+    """Camera mặc định ghi thẳng vào RECORDING_DIR (như trước khi có nhiều camera), camera khác vào thư mục con"""
+    return RECORDING_DIR if name == cameras.default else os.path.join(RECORDING_DIR, name)
+
+recorders = {}
+recording_readers = {name: RecordingReader(recording_dir(name)) for name in cameras.names()}
+if RECORDING and len(cameras):
+    # RECORDING_MAX_MB là tổng cho mọi camera, chia đều
+    recording_max_bytes = RECORDING_MAX_MB * 1024 * 1024 // len(cameras)
+    for name in cameras.names():
+        # Dùng chung JPEG với stream khi client xem cùng quality ở độ phân giải gốc
+        recorders[name] = FrameRecorder(
+            cameras.get(name), recording_dir(name), fps=RECORDING_FPS,
+            segment_seconds=RECORDING_SEGMENT_SECONDS, max_bytes=recording_max_bytes,
+            encode=lambda seq, frame, encoder=frame_encoders[name]: encoder.get(
+                seq, frame, RECORDING_QUALITY, None)).start()
+    print(f"✅ Recording {', '.join(recorders)} to {RECORDING_DIR} "
+          f"({RECORDING_FPS} fps, max {RECORDING_MAX_MB} MB total)")
+recorder = recorders.get(cameras.default)
+
+def recording_source(name):
+    """(recorder, reader) của camera name (mặc định: camera đầu tiên); không có camera thì đọc RECORDING_DIR"""
+    name = name or cameras.default
+    reader = recording_readers.get(name) or RecordingReader(RECORDING_DIR)
+    return recorders.get(name), reader
+
+@app.route('/api/recordings', methods=['GET'])
+@app.route('/api/cameras/<name>/recordings', methods=['GET'])
+@requires_auth
+def get_recordings(name=None):
+    """Danh sách segment đã ghi (thời gian đầu/cuối, số frame, dung lượng)"""
+    if name is not None and cameras.get(name) is None:
+        return camera_not_found(name)
+    source_recorder, reader = recording_source(name)
+    return jsonify({
+        "enabled": source_recorder is not None,
+        "stats": source_recorder.stats() if source_recorder is not None else None,
+        "segments": reader.segments()
+    })
+
+@app.route('/api/recordings/frame', methods=['GET'])
+@app.route('/api/cameras/<name>/recordings/frame', methods=['GET'])
+@requires_auth
+def get_recording_frame(name=None):
+    """JPEG đã ghi gần nhất tại hoặc trước thời điểm t (epoch ms)"""
+    if name is not None and cameras.get(name) is None:
+        return camera_not_found(name)
+    _, reader = recording_source(name)
+    try:
+        result = reader.frame_at(int(request.args['t']))
+    except (KeyError, ValueError):
+        return jsonify({
+            "success": False,
+            "message": "Query parameter t (epoch ms) is required"
+        }), 400
+    if result is None:
+        return jsonify({
+            "success": False,
+            "message": "No recorded frame at this time"
+        }), 404
+    timestamp, jpeg = result
+    return Response(jpeg, mimetype='image/jpeg', headers={"X-Frame-Timestamp": str(timestamp)})
+
+# ==================== LIVE DETECTION ====================
+# Detection liên tục trên camera (bật bằng LIVE_DETECTION=1).
+# Motion gate bỏ qua model khi bể tôm không thay đổi, dùng lại kết quả cũ.
+LIVE_DETECTION = os.getenv('LIVE_DETECTION', '0') == '1'
+LIVE_DETECTION_FPS = float(os.getenv('LIVE_DETECTION_FPS', '5'))
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', '0.01'))
+MOTION_PIXEL_THRESHOLD = int(os.getenv('MOTION_PIXEL_THRESHOLD', '15'))
+MOTION_REFRESH_SECONDS = float(os.getenv('MOTION_REFRESH_SECONDS', '10'))
+TRACK_MAX_AGE = int(os.getenv('TRACK_MAX_AGE', '15'))
+TRACK_MIN_HITS = int(os.getenv('TRACK_MIN_HITS', '3'))
+
+def create_live_pipeline():
+    """Motion gate + tracker + kết quả mới nhất của 1 camera"""
+    return {
+        "gate": MotionGate(threshold=MOTION_THRESHOLD,
+                           pixel_threshold=MOTION_PIXEL_THRESHOLD,
+                           refresh_interval=MOTION_REFRESH_SECONDS),
+        # Tracker gán id ổn định cho từng con tôm để đếm không trùng giữa các frame
+        "tracker": ShrimpTracker(max_age=TRACK_MAX_AGE, min_hits=TRACK_MIN_HITS),
+        "state": {"seq": 0, "timestamp": 0, "detections": [], "tracks": [], "fresh": False},
+        "lastCount": None
+    }
+
+live_pipelines = {name: create_live_pipeline() for name in cameras.names()}
+live_state_lock = threading.Lock()
+inference_scheduler = None
+
+def detect_frame(frame, source=None, tiled=False):
+    """
+    Chạy model trên 1 frame BGR, cùng thứ tự ưu tiên với /api/detect-shrimp:
+    ROI của camera nếu có cấu hình, rồi tiled nếu yêu cầu, còn lại cả frame
+    """
+    source = source or CAMERA_SOURCE
+    calibration = calibration_config.for_source(source)
+    roi_set = roi_config.for_source(source)
+    if roi_set is not None:
+        return detect_rois(frame, roi_set, calibration=calibration)
+    if tiled:
+        return detect_tiled(frame, calibration=calibration)
+    return parse_yolo_output(run_inference(frame), frame.shape, calibration=calibration)
+
+def process_live_frame(name, seq, frame, captured_at):
+    """Detection 1 frame của camera name (gọi từ InferenceScheduler)"""
+    pipeline = live_pipelines[name]
+    with inference_lane('live'):
+        detections, ran = pipeline["gate"].process(
+            frame, lambda f: detect_frame(f, name), now=captured_at)
+    tracks = pipeline["tracker"].update(detections, now=captured_at)
+
+    timestamp = int(captured_at * 1000)
+    with live_state_lock:
+        pipeline["state"] = {
+            "seq": seq,
+            "timestamp": timestamp,
+            "detections": detections,
+            "tracks": tracks,
+            "fresh": ran
+        }
+
+    if ran and len(detections) != pipeline["lastCount"]:
+        pipeline["lastCount"] = len(detections)
+        event_hub.publish('live-detection', {
+            "timestamp": timestamp,
+            "count": len(detections),
+            "totalWeight": round(sum(d.get('weight', 0) for d in detections), 2),
+            "capturedFrom": "camera",
+            "camera": name
+        })
+
+if LIVE_DETECTION and len(cameras) and interpreter is not None:
+    # 1 thread inference dùng chung, lần lượt từng camera
+    inference_scheduler = InferenceScheduler(cameras, process_live_frame,
+                                             fps=LIVE_DETECTION_FPS).start()
+    print(f"✅ Live detection enabled ({LIVE_DETECTION_FPS} fps/camera, "
+          f"{len(cameras)} camera(s), motion gated)")
+
+def live_pipeline_or_error(name):
+    """(pipeline, None) hoặc (None, response lỗi)"""
+    if inference_scheduler is None:
+        return None, (jsonify({
+            "success": False,
+            "message": "Live detection not enabled"
+        }), 503)
+    name = name or request.args.get('camera') or cameras.default
+    if name not in live_pipelines:
+        return None, camera_not_found(name)
+    return live_pipelines[name], None
+
+@app.route('/api/live-detections', methods=['GET'])
+@app.route('/api/cameras/<name>/live-detections', methods=['GET'])
+def get_live_detections(name=None):
+    """Kết quả detection mới nhất của camera (?camera=, mặc định camera đầu tiên) và số liệu motion gate"""
+    pipeline, error = live_pipeline_or_error(name)
+    if error is not None:
+        return error
+
+    with live_state_lock:
+        state = dict(pipeline["state"])
+    state["motion"] = pipeline["gate"].stats()
+    return jsonify(state)
+
+@app.route('/api/live-counts', methods=['GET'])
+@app.route('/api/cameras/<name>/live-counts', methods=['GET'])
+def get_live_counts(name=None):
+    """Số tôm duy nhất (theo track) trong cửa sổ thời gian, ?window=60 (giây)"""
+    pipeline, error = live_pipeline_or_error(name)
+    if error is not None:
+        return error
+
+    try:
+        window = float(request.args.get('window', 60))
+    except ValueError:
+        window = 60.0
+
+    counts = pipeline["tracker"].unique_counts(window)
+    counts["tracker"] = pipeline["tracker"].stats()
+    return jsonify(counts)
+
+@app.route('/api/cameras', methods=['GET'])
+def list_cameras():
+    """Các camera: cấu hình, FPS/frame lỗi của capture, FPS/frame bị bỏ của live detection"""
+    scheduler_stats = inference_scheduler.stats() if inference_scheduler is not None else {}
+    result = []
+    for name, info in cameras.stats().items():
+        info["default"] = name == cameras.default
+        info["encoder"] = frame_encoders[name].stats()
+        info["detection"] = scheduler_stats.get(name)
+        info["recording"] = recorders[name].stats() if name in recorders else None
+        result.append(info)
+    return jsonify(result)
+
 # ==================== DETECTION API ====================
+# Giới hạn RAM cho ảnh đang xử lý đồng thời (Pi 1 GB dễ bị swap với nhiều ảnh 12 MP)
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', '256'))
+MEMORY_WAIT_SECONDS = float(os.getenv('MEMORY_WAIT_SECONDS', '10'))
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '32'))
+# Ước lượng khi không đọc được header ảnh (JPEG thường nén ~10 lần)
+UNKNOWN_IMAGE_EXPANSION = 20
+
+# Số frame tối đa được gộp cho 1 snapshot detection
+SNAPSHOT_MAX_FRAMES = int(os.getenv('SNAPSHOT_MAX_FRAMES', '10'))
+
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB * 1024 * 1024, wait_timeout=MEMORY_WAIT_SECONDS)
+# Interpreter batch (tile/ROI) nằm cùng RAM với ảnh đang xử lý
+batch_interpreters.on_change = memory_budget.set_resident
+
+# Tải hiện tại của worker, báo qua /health cho dispatcher (dispatcher.py) chọn node
+detection_load = {"inFlight": 0, "completed": 0, "errors": 0, "avgLatencyMs": 0.0}
+detection_load_lock = threading.Lock()
+
+def detection_started():
+    with detection_load_lock:
+        detection_load["inFlight"] += 1
+    return time.time()
+
+def detection_finished(started, status):
+    latency_ms = (time.time() - started) * 1000
+    with detection_load_lock:
+        detection_load["inFlight"] -= 1
+        detection_load["completed"] += 1
+        if status >= 400:
+            detection_load["errors"] += 1
+        # EWMA để dispatcher thấy latency gần đây
+        detection_load["avgLatencyMs"] += 0.2 * (latency_ms - detection_load["avgLatencyMs"])
+
+def tracks_detection_load(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        started = detection_started()
+        status = 500
+        try:
+            response = f(*args, **kwargs)
+            status = response[1] if isinstance(response, tuple) else response.status_code
+            return response
+        finally:
+            detection_finished(started, status)
+    return decorated
+
+
+def new_detection_record(detections, inference_time, source):
+    """Bản ghi kết quả detection (chưa upload), dạng dùng chung với offline spool"""
+    return {
+        "upload": None,
+        "detections": detections,
+        "timestamp": int(time.time() * 1000),
+        "capturedFrom": source,
+        "inferenceTime": inference_time
+    }
+
+def service_available(name):
+    """False khi spool forwarder đã biết dịch vụ ('cloudinary'/'storage') đang mất kết nối"""
+    return spool_forwarder is None or spool_forwarder.services[name].available
+
+def report_service(name, error=None):
+    """Báo kết quả gọi dịch vụ từ request cho spool forwarder (error None: thành công)"""
+    if spool_forwarder is not None:
+        spool_forwarder.services[name].report(error)
+
+def spool_detection_record(record, jpeg_bytes):
+    """Lưu bản ghi vào spool local (ảnh chỉ giữ khi chưa upload được), trả về id tạm"""
+    spool_id = offline_spool.enqueue(
+        record, None if record["upload"] is not None else jpeg_bytes)
+    spool_forwarder.notify()
+    mongo_id = f"spool-{spool_id}"
+    print(f"[INFO] Spooled offline as {mongo_id}")
+    return mongo_id
+
+def detection_payload(record, mongo_id, tiled, queued):
+    """Payload response của /api/detect-shrimp"""
+    upload = record["upload"] or {}
+    return {
+        "success": True,
+        "imageUrl": upload.get('url', ""),
+        "cloudinaryUrl": upload.get('secure_url', ""),
+        "detections": record["detections"],
+        "mongoId": mongo_id,
+        "inferenceTime": record["inferenceTime"],
+        "tiled": tiled,
+        "queued": queued,
+        "message": "Detection queued for upload" if queued else "Detection completed successfully"
+    }
+
+def save_detection_result(jpeg_bytes, detections, inference_time, source, tiled):
+    """
+    Upload ảnh kết quả, lưu document, phát event SSE (hoặc đưa vào spool khi mất kết nối)
+    Returns:
+        payload response giống /api/detect-shrimp
+    """
+    record = new_detection_record(detections, inference_time, source)
+
+    # Upload to Cloudinary (đang mất kết nối thì spool ngay, không chờ timeout)
+    if service_available('cloudinary'):
+        print("[INFO] Uploading to Cloudinary...")
+        try:
+            record["upload"] = upload_to_cloudinary(jpeg_bytes)
+            report_service('cloudinary')
+            print(f"[INFO] Uploaded to: {record['upload']['secure_url']}")
+        except Exception as e:
+            if not OFFLINE_SPOOL:
+                raise
+            report_service('cloudinary', e)
+            print(f"[ERROR] Cloudinary upload failed, spooling: {str(e)}")
+
+    # Save to MongoDB
+    mongo_id = None
+    if record["upload"] is not None and store is not None and service_available('storage'):
+        try:
+            mongo_id = store.insert(build_detection_document(record))
+            report_service('storage')
+            print(f"[INFO] Saved to {store.name} with ID: {mongo_id}")
+            update_rollups(source, record["timestamp"], detections)
+        except Exception as e:
+            if not OFFLINE_SPOOL:
+                raise
+            report_service('storage', e)
+            print(f"[ERROR] Storage insert failed, spooling: {str(e)}")
+
+    # Mất kết nối: lưu vào spool local, forwarder sẽ gửi lại (và phát event SSE) sau
+    queued = mongo_id is None and OFFLINE_SPOOL
+    if queued:
+        mongo_id = spool_detection_record(record, jpeg_bytes)
+    elif mongo_id is None:
+        # Không có store: client nhận kết quả trong response, không phát event SSE với id
+        # không tồn tại (client sẽ GET /api/shrimp-images/<id> và nhận 404)
+        mongo_id = "no-mongodb"
+    else:
+        publish_detection_event(mongo_id, record["timestamp"], detections, source,
+                                build_thumbnail_url(record["upload"]))
+
+    return detection_payload(record, mongo_id, tiled, queued)
+
+def parse_detection_request(data):
+    """
+    Body JSON của /api/detect-shrimp -> (source, lane, tiled); ValueError nếu thiếu/sai
+    Ảnh base64 vẫn nằm trong data['image'] cho run_image_detection lấy ra
+    """
+    if not isinstance(data, dict):
+        raise ValueError("No image data provided")
+    source = data.get('source', 'unknown')
+    # Làn ưu tiên: app bấm detect là interactive, client xử lý hàng loạt gửi "batch"
+    lane = data.get('priority', 'interactive')
+    if lane not in LANES:
+        raise ValueError(f"Invalid priority: {lane}")
+    if not data.get('image'):
+        raise ValueError("No image data provided")
+    return source, lane, bool(data.get('tiled', TILED_INFERENCE))
+
+def run_image_detection(data, source, lane, tiled):
+    """
+    Phần CPU của /api/detect-shrimp: decode base64/JPEG, inference, vẽ bbox, encode JPEG
+    Ảnh được pop khỏi data để chuỗi base64 được giải phóng ngay sau khi decode
+    Returns:
+        (jpeg_bytes, detections, inference_time)
+    Raises:
+        ImageTooLarge, MemoryBudgetExceeded
+    """
+    decode_side = tiled_decode_side() if tiled else None
+    roi_set = roi_config.for_source(source)
+    # Số ảnh đưa vào model tối đa (ROI > tiled > cả ảnh), để giữ chỗ cho tensor float32
+    max_inputs = len(roi_set.polygons) if roi_set is not None else TILE_MAX_COUNT + 1 if tiled else 1
+
+    # Kiểm tra kích thước từ header và giữ chỗ trong ngân sách RAM trước khi decode
+    image_data = base64.b64decode(data.pop('image'))
+    size = check_image_size(image_data)
+    if size is not None:
+        factor = reduction_factor(size, decode_side)
+        estimate = estimate_request_bytes(len(image_data), -(-size[0] // factor), -(-size[1] // factor),
+                                          batch_input_bytes(max_inputs))
+    else:
+        estimate = len(image_data) * UNKNOWN_IMAGE_EXPANSION + batch_input_bytes(max_inputs)
+
+    with memory_budget.reserve(estimate) as memory:
+        memory.track('encoded', len(image_data))
+
+        # Decode: ảnh lớn được decode thu nhỏ (BGR xuyên suốt), bbox vẫn theo toạ độ ảnh gốc
+        # Ảnh nén và ảnh decode cùng tồn tại trong lúc decode
+        image_np, original_shape = decode_image(image_data, decode_side)
+        memory.track('decoded', image_np.nbytes)
+        del image_data
+        memory.release('encoded')
+        scale = original_shape[1] / image_np.shape[1]
+        height, width = image_np.shape[:2]
+
+        print(f"[INFO] Image size: {original_shape[1]}x{original_shape[0]} "
+              f"(decoded {width}x{height})")
+
+        # Run TFLite inference (ROI: chỉ vùng bể của nguồn ảnh; tiled: chia tile cho ảnh lớn)
+        calibration = calibration_config.for_source(source)
+        if roi_set is not None:
+            inputs = len(roi_set.geometry(width, height)[0])
+        else:
+            inputs = len(tile_regions(width, height)) if tiled else 1
+        memory.track('input', batch_input_bytes(inputs))
+        mode = ' (roi)' if roi_set is not None else ' (tiled)' if tiled else ''
+        print(f"[INFO] Running TFLite detection{mode}...")
+        start_time = time.time()
+        with inference_lane(lane):
+            if roi_set is not None:
+                detections = detect_rois(image_np, roi_set, scale=scale, calibration=calibration)
+                inference_time = time.time() - start_time
+            elif tiled:
+                detections = detect_tiled(image_np, scale=scale, calibration=calibration)
+                inference_time = time.time() - start_time
+            else:
+                outputs = run_inference(image_np)
+                inference_time = time.time() - start_time
+
+                # Parse detections
+                detections = parse_yolo_output(outputs, original_shape, calibration=calibration)
+        memory.release('input')
+        print(f"[INFO] Inference time: {inference_time:.3f}s")
+        print(f"[INFO] Found {len(detections)} detections")
+
+        # Vẽ bbox thẳng lên ảnh decode (không copy) rồi encode JPEG từ BGR
+        draw_detections(image_np, detections, scale=scale, in_place=True)
+        ret, jpeg = cv2.imencode('.jpg', image_np, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ret:
+            raise ValueError("Cannot encode annotated image")
+        memory.track('jpeg', jpeg.nbytes)
+        del image_np
+        memory.release('decoded')
+        jpeg_bytes = jpeg.tobytes()
+        del jpeg
+    print(f"[INFO] Peak image memory: {memory.peak / 1e6:.1f} MB (reserved {estimate / 1e6:.1f} MB)")
+    return jpeg_bytes, detections, inference_time
+
 @app.route('/api/detect-shrimp', methods=['POST'])
+@tracks_detection_load
 def detect_shrimp():
     """
     Endpoint nhận ảnh từ Android app, xử lý với YOLO TFLite,
     lưu lên Cloudinary và MongoDB, trả về kết quả
     """
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        source = data.get('source', 'unknown')
-
-        if not image_base64:
+        # Không cache body/JSON trong request để base64 được giải phóng ngay sau khi decode
+        data = request.get_json(cache=False)
+        try:
+            source, lane, tiled = parse_detection_request(data)
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "message": "No image data provided"
+                "message": str(e)
             }), 400
 
         print(f"[INFO] Receiving image from {source}")
+        jpeg_bytes, detections, inference_time = run_image_detection(data, source, lane, tiled)
 
-        # Decode base64 image
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(BytesIO(image_data))
-        image_np = np.array(image)
+        return negotiated_response(save_detection_result(jpeg_bytes, detections, inference_time,
+                                                         source, tiled))
 
-        if len(image_np.shape) == 3 and image_np.shape[2] == 3:
-            image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+    except (ImageTooLarge, RequestEntityTooLarge) as e:
+        print(f"[ERROR] {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 413
+    except MemoryBudgetExceeded as e:
+        print(f"[ERROR] {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 503, {"Retry-After": "2"}
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "message": f"Error: {str(e)}"
+        }), 500
 
-        print(f"[INFO] Image size: {image.size}")
+@app.route('/api/detect-snapshot', methods=['POST'])
+@app.route('/api/cameras/<name>/detect-snapshot', methods=['POST'])
+@tracks_detection_load
+def detect_snapshot(name=None):
+    """
+    Detection trên frame camera mới nhất của capture thread: app không cần tải stream,
+    encode lại và upload ảnh. Response giống /api/detect-shrimp.
+    Body (tuỳ chọn): source (mặc định tên camera), frames (gộp detections của N frame
+    liên tiếp cho ổn định), tiled, priority (interactive|live|batch, mặc định interactive)
+    Response thêm frames: số frame thực sự dùng (ít hơn yêu cầu nếu camera không ra frame mới)
+    """
+    try:
+        if name is not None and cameras.get(name) is None:
+            return camera_not_found(name)
+        source_capture = cameras.get(name)
+        if source_capture is None or interpreter is None:
+            return jsonify({
+                "success": False,
+                "message": "Camera or model not available"
+            }), 503
 
-        # Run TFLite inference
-        print("[INFO] Running TFLite detection...")
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            raise ValueError("body must be a JSON object")
+        source = data.get('source', source_capture.name)
+        try:
+            frames = int(data.get('frames', 1))
+        except (TypeError, ValueError):
+            # null/list -> TypeError của int(), cũng là tham số sai (400)
+            raise ValueError(f"frames must be an integer, got {data.get('frames')!r}") from None
+        frames = min(max(frames, 1), SNAPSHOT_MAX_FRAMES)
+        tiled = bool(data.get('tiled', TILED_INFERENCE))
+        lane = data.get('priority', 'interactive')
+        if lane not in LANES:
+            raise ValueError(f"priority must be one of {', '.join(LANES)}")
+
+        seq, frame, _ = source_capture.latest()
+        if frame is None:
+            seq, frame, _ = source_capture.wait_for_frame(seq, timeout=2.0)
+            if frame is None:
+                return jsonify({
+                    "success": False,
+                    "message": "No camera frame available"
+                }), 503
+
+        print(f"[INFO] Snapshot detection on {source_capture.name} frame {seq} ({frames} frame(s))")
         start_time = time.time()
-        outputs = run_inference(image_np)
+        results = []
+        with inference_lane(lane):
+            for i in range(frames):
+                if i > 0:
+                    next_seq, next_frame, _ = source_capture.wait_for_frame(seq, timeout=1.0)
+                    if next_seq == seq:
+                        # Camera không ra frame mới: dừng thay vì tính 1 frame nhiều lần
+                        print(f"[WARN] No new frame after {seq}, using {len(results)} of {frames} frame(s)")
+                        break
+                    seq, frame = next_seq, next_frame
+                results.append(detect_frame(frame, source, tiled))
+        detections = average_frame_detections(results)
         inference_time = time.time() - start_time
-        print(f"[INFO] Inference time: {inference_time:.3f}s")
+        print(f"[INFO] Found {len(detections)} detections in {inference_time:.3f}s")
 
-        # Parse detections
-        detections = parse_yolo_output(outputs, image_np.shape)
-        print(f"[INFO] Found {len(detections)} detections")
-
-        # Generate annotated image
-        annotated_image = draw_detections(image_np, detections)
-        annotated_image_rgb = cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(annotated_image_rgb)
+        # Frame dùng chung với capture thread nên vẽ trên bản copy
+        annotated_image = draw_detections(frame, detections)
+        ret, jpeg = cv2.imencode('.jpg', annotated_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ret:
+            raise RuntimeError("Cannot encode annotated image")
 
-        buffer = BytesIO()
-        img_pil.save(buffer, format='JPEG', quality=90)
-        buffer.seek(0)
-
-        # Upload to Cloudinary
-        print("[INFO] Uploading to Cloudinary...")
-        upload_result = cloudinary.uploader.upload(
-            buffer,
-            folder="shrimp-detections",
-            resource_type="image"
-        )
-        cloudinary_url = upload_result['secure_url']
-        print(f"[INFO] Uploaded to: {cloudinary_url}")
-
-        # Save to MongoDB
-        if collection is not None:
-            doc = {
-                "imageUrl": upload_result['url'],
-                "cloudinaryUrl": cloudinary_url,
-                "detections": detections,
-                "timestamp": int(time.time() * 1000),
-                "capturedFrom": source,
-                "inferenceTime": inference_time
-            }
-            result = collection.insert_one(doc)
-            mongo_id = str(result.inserted_id)
-            print(f"[INFO] Saved to MongoDB with ID: {mongo_id}")
-        else:
-            mongo_id = "no-mongodb"
+        payload = save_detection_result(jpeg.tobytes(), detections, inference_time, source, tiled)
+        payload["frames"] = len(results)
+        return negotiated_response(payload)
 
+    except ValueError as e:
         return jsonify({
-            "success": True,
-            "imageUrl": upload_result['url'],
-            "cloudinaryUrl": cloudinary_url,
-            "detections": detections,
-            "mongoId": mongo_id,
-            "inferenceTime": inference_time,
-            "message": "Detection completed successfully"
-        })
-
+            "success": False,
+            "message": f"Invalid parameter: {str(e)}"
+        }), 400
     except Exception as e:
         print(f"[ERROR] {str(e)}")
-        import traceback
-        traceback.print_exc()
         return jsonify({
             "success": False,
             "message": f"Error: {str(e)}"
         }), 500
 
+@app.route('/api/events', methods=['GET'])
+def detection_events():
+    """
+    Server-Sent Events: đẩy mỗi kết quả detection mới tới client
+    thay vì để app poll lại /api/shrimp-images
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscription = event_hub.subscribe(last_event_id=last_event_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    # Giữ kết nối qua proxy/ngrok
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Cache response gallery trong process, vô hiệu theo version của store (insert/delete)
+GALLERY_CACHE = os.getenv('GALLERY_CACHE', '1') == '1'
+GALLERY_CACHE_ENTRIES = int(os.getenv('GALLERY_CACHE_ENTRIES', '256'))
+GALLERY_CACHE_TTL_SECONDS = float(os.getenv('GALLERY_CACHE_TTL_SECONDS', '30'))
+CACHED_RESPONSE_HEADERS = ('X-Next-Cursor',)
+
+gallery_cache = ResponseCache(max_entries=GALLERY_CACHE_ENTRIES, ttl=GALLERY_CACHE_TTL_SECONDS)
+
+def cached_gallery_response(f):
+    """
+    Trả response từ cache nếu store chưa thay đổi; luôn gửi ETag để client hỏi lại bằng
+    If-None-Match và nhận 304. Không gửi Last-Modified: version của store chỉ biết thay đổi
+    trong process này, process khác dùng chung MongoDB ghi thì If-Modified-Since trả 304 sai.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not GALLERY_CACHE or store is None:
+            return f(*args, **kwargs)
+
+        # Store mới (kết nối lại MongoDB) có bộ đếm riêng
+        changes = store.changes
+        version = (id(changes), changes.version)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), wants_msgpack())
+
+        entry = gallery_cache.get(key, version)
+        if entry is None:
+            response = f(*args, **kwargs)
+            if isinstance(response, tuple) or response.status_code != 200:
+                return response
+            headers = {name: response.headers[name] for name in CACHED_RESPONSE_HEADERS
+                       if name in response.headers}
+            entry = gallery_cache.put(key, CachedResponse(response.get_data(), response.mimetype,
+                                                          headers, version))
+
+        response = app.response_class(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+        response.vary.add('Accept')
+        response.set_etag(entry.etag)
+        # Client được lưu nhưng phải hỏi lại server trước khi dùng
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            gallery_cache.record_not_modified()
+        return response
+    return decorated
+
+def parse_gallery_query(args):
+    """Query string gallery -> tham số cho store.list(); ValueError nếu sai kiểu/ngoài khoảng"""
+    # limit <= 0 là "không giới hạn" với MongoDB/SQLite nên phải chặn ở đây
+    limit = int(args.get('limit', GALLERY_PAGE_SIZE))
+    if not 1 <= limit <= GALLERY_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {GALLERY_MAX_PAGE_SIZE}")
+    cursor = args.get('cursor')
+    return {
+        "limit": limit,
+        "source": args.get('source'),
+        "cursor": decode_cursor(cursor) if cursor else None,
+        "filters": parse_filters(args)
+    }
+
+def format_gallery_page(images, form, limit):
+    """Định dạng detections của 1 trang, trả về header chứa cursor trang sau (nếu còn)"""
+    for img in images:
+        format_document_detections(img, form)
+    # Keyset pagination: body vẫn là list như cũ, cursor trang sau nằm trong header
+    return {"X-Next-Cursor": encode_cursor(images[-1])} if len(images) == limit else None
+
 @app.route('/api/shrimp-images', methods=['GET'])
+@cached_gallery_response
 def get_images():
-    """Lấy danh sách tất cả ảnh đã lưu"""
+    """
+    Lấy danh sách ảnh đã lưu, mới nhất trước
+    Query: detections=verbose (mặc định) | compact (mảng song song) | none (chỉ số lượng)
+           limit (1-500, mặc định 100), source, cursor (từ header X-Next-Cursor của trang trước)
+           minCount, maxCount, minWeight, maxWeight (g/con), minLength, maxLength (cm),
+           from, to (timestamp ms) - lọc theo field summary
+    """
     try:
-        if collection is None:
+        if store is None:
             return jsonify([])
 
-        images = list(collection.find().sort('timestamp', -1).limit(100))
-        for img in images:
-            img['id'] = str(img['_id'])
-            del img['_id']
+        form = request.args.get('detections', 'verbose')
+        if form not in DETECTION_FORMS:
+            return jsonify({
+                "success": False,
+                "message": "detections must be verbose, compact or none"
+            }), 400
 
+        query = parse_gallery_query(request.args)
+        images = store.list(**query)
+        headers = format_gallery_page(images, form, query["limit"])
         print(f"[INFO] Returning {len(images)} images")
-        return jsonify(images)
+        return negotiated_response(images, headers=headers)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid parameter: {str(e)}"
+        }), 400
     except Exception as e:
         print(f"[ERROR] {str(e)}")
         return jsonify({
@@ -477,20 +1108,24 @@ def get_images():
         }), 500
 
 @app.route('/api/shrimp-images/<image_id>', methods=['GET'])
+@cached_gallery_response
 def get_image_detail(image_id):
     """Lấy chi tiết 1 ảnh"""
     try:
-        if collection is None:
+        if store is None:
             return jsonify({
                 "success": False,
-                "message": "MongoDB not available"
+                "message": "Storage not available"
             }), 503
 
-        image = collection.find_one({'_id': ObjectId(image_id)})
+        form = request.args.get('detections', 'verbose')
+        if form not in DETECTION_FORMS:
+            form = 'verbose'
+
+        image = store.get(image_id)
         if image:
-            image['id'] = str(image['_id'])
-            del image['_id']
-            return jsonify(image)
+            format_document_detections(image, form)
+            return negotiated_response(image)
         else:
             return jsonify({
                 "success": False,
@@ -506,14 +1141,17 @@ def get_image_detail(image_id):
 def delete_image(image_id):
     """Xóa ảnh"""
     try:
-        if collection is None:
+        if store is None:
             return jsonify({
                 "success": False,
-                "message": "MongoDB not available"
+                "message": "Storage not available"
             }), 503
 
-        result = collection.delete_one({'_id': ObjectId(image_id)})
-        if result.deleted_count > 0:
+        deleted = store.delete(image_id)
+        if deleted is not None:
+            update_rollups(deleted.get('capturedFrom', 'unknown'), deleted.get('timestamp', 0),
+                           document_detections(deleted), sign=-1)
+            delete_cloudinary_asset(deleted)
             print(f"[INFO] Deleted image {image_id}")
             return jsonify({
                 "success": True,
@@ -530,31 +1168,280 @@ def delete_image(image_id):
             "message": str(e)
         }), 500
 
+# ==================== BIOMASS STATISTICS ====================
+def update_rollups(source, timestamp, detections, sign=1):
+    """Cập nhật rollup theo giờ; lỗi rollup không làm hỏng request chính"""
+    if rollup_collection is None:
+        return
+    try:
+        record_detections(rollup_collection, source, timestamp, detections, sign)
+    except Exception as e:
+        print(f"[ERROR] Rollup update failed: {str(e)}")
+
+@app.route('/api/stats/biomass', methods=['GET'])
+def get_biomass_stats():
+    """
+    Thống kê số lượng/kích thước/khối lượng tôm từ rollup theo giờ
+    Query: from, to (epoch ms, mặc định 24h gần nhất), source,
+           granularity (hour/day/total), tzOffset (phút)
+    """
+    try:
+        if rollup_collection is None:
+            return jsonify({
+                "success": False,
+                "message": "MongoDB not available"
+            }), 503
+
+        now_ms = int(time.time() * 1000)
+        end_ms = int(request.args.get('to', now_ms))
+        start_ms = int(request.args.get('from', end_ms - 24 * HOUR_MS))
+        granularity = request.args.get('granularity', 'hour')
+        if granularity not in ('hour', 'day', 'total'):
+            return jsonify({
+                "success": False,
+                "message": "granularity must be hour, day or total"
+            }), 400
+
+        options = {}
+        if 'tzOffset' in request.args:
+            options['tz_offset_minutes'] = int(request.args['tzOffset'])
+
+        stats = query_rollups(rollup_collection, start_ms, end_ms,
+                              source=request.args.get('source'),
+                              granularity=granularity, **options)
+        return negotiated_response(stats)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid parameter: {str(e)}"
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+
+# ==================== OFFLINE SPOOL ====================
+# Store-and-forward: Cloudinary/MongoDB lỗi thì kết quả vẫn được nhận ngay,
+# lưu vào SQLite (WAL) + file ảnh trong SPOOL_DIR và được gửi lại theo lô
+OFFLINE_SPOOL = os.getenv('OFFLINE_SPOOL', '1') == '1'
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_BATCH_SIZE = int(os.getenv('SPOOL_BATCH_SIZE', '20'))
+SPOOL_INTERVAL_SECONDS = float(os.getenv('SPOOL_INTERVAL_SECONDS', '5'))
+# Document bị store từ chối (không phải mất kết nối) quá số lần này thì giữ lại, không gửi nữa
+SPOOL_MAX_REJECTIONS = int(os.getenv('SPOOL_MAX_REJECTIONS', '5'))
+
+def upload_to_cloudinary(image_bytes):
+    """Upload JPEG lên Cloudinary, chỉ giữ các field cần lưu"""
+    upload_result = cloudinary.uploader.upload(
+        BytesIO(image_bytes),
+        folder="shrimp-detections",
+        resource_type="image"
+    )
+    return {key: upload_result.get(key) for key in ('url', 'secure_url', 'public_id')}
+
+def build_detection_document(record):
+    """Tạo document MongoDB từ kết quả detection (dùng chung cho request và spool)"""
+    doc = {
+        "imageUrl": record["upload"]['url'],
+        "cloudinaryUrl": record["upload"]['secure_url'],
+        "cloudinaryPublicId": record["upload"].get('public_id'),
+        "timestamp": record["timestamp"],
+        "capturedFrom": record["capturedFrom"],
+        "inferenceTime": record["inferenceTime"],
+        # Số liệu tóm tắt để gallery lọc bằng index
+        "summary": detections_summary(record["detections"])
+    }
+    if DETECTION_STORAGE == 'packed':
+        doc["detectionsPacked"] = pack_detections(record["detections"])
+    else:
+        doc["detections"] = record["detections"]
+    return doc
+
+def get_detection_store():
+    if store is None and DETECTION_DB == 'mongodb':
+        connect_mongodb()
+    return store
+
+def on_spool_forwarded(record, inserted_id):
+    """Bản ghi từ spool đã lên MongoDB: cập nhật rollup và báo client SSE"""
+    update_rollups(record["capturedFrom"], record["timestamp"], record["detections"])
+    publish_detection_event(str(inserted_id), record["timestamp"], record["detections"],
+                            record["capturedFrom"], build_thumbnail_url(record["upload"]))
+
+offline_spool = None
+spool_forwarder = None
+if OFFLINE_SPOOL:
+    offline_spool = OfflineSpool(SPOOL_DIR, max_rejections=SPOOL_MAX_REJECTIONS)
+    spool_forwarder = SpoolForwarder(offline_spool, upload_to_cloudinary, get_detection_store,
+                                     build_detection_document, on_spool_forwarded,
+                                     batch_size=SPOOL_BATCH_SIZE,
+                                     interval=SPOOL_INTERVAL_SECONDS).start()
+    print(f"✅ Offline spool: {SPOOL_DIR} ({offline_spool.stats()['pending']} pending)")
+
+# ==================== RETENTION ====================
+# Giữ gallery trong giới hạn: xoá ảnh cũ hơn RETENTION_DAYS và/hoặc vượt RETENTION_MAX_IMAGES
+# (0 = không giới hạn), xoá cả ảnh trên Cloudinary. Chỉ xoá theo tuổi bằng job này, không dùng
+# TTL index của MongoDB vì TTL index xoá document mà bỏ lại ảnh trên Cloudinary.
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', '0'))
+RETENTION_MAX_IMAGES = int(os.getenv('RETENTION_MAX_IMAGES', '0'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '100'))
+RETENTION_INTERVAL_SECONDS = float(os.getenv('RETENTION_INTERVAL_SECONDS', '600'))
+# Admin API của Cloudinary bị giới hạn số lần gọi/giờ theo gói tài khoản
+CLOUDINARY_DELETE_CALLS_PER_HOUR = int(os.getenv('CLOUDINARY_DELETE_CALLS_PER_HOUR', '200'))
+BULK_DELETE_MAX = 500
+BULK_DELETE_WAIT_SECONDS = 30
+
+asset_deleter = AssetDeleter(lambda public_ids: cloudinary.api.delete_resources(public_ids),
+                             calls_per_hour=CLOUDINARY_DELETE_CALLS_PER_HOUR)
+retention_purger = None
+if RETENTION_DAYS > 0 or RETENTION_MAX_IMAGES > 0:
+    retention_purger = RetentionPurger(get_detection_store, asset_deleter,
+                                       max_age_ms=int(RETENTION_DAYS * 86400 * 1000),
+                                       max_images=RETENTION_MAX_IMAGES,
+                                       batch_size=RETENTION_BATCH_SIZE,
+                                       interval=RETENTION_INTERVAL_SECONDS).start()
+    print(f"✅ Retention: {RETENTION_DAYS:g} days, max {RETENTION_MAX_IMAGES or 'unlimited'} images")
+
+def delete_cloudinary_asset(doc):
+    """Xoá ảnh Cloudinary của 1 document (Upload API, không tính vào giới hạn Admin API)"""
+    public_id = document_public_id(doc)
+    if not public_id:
+        return
+    try:
+        cloudinary.uploader.destroy(public_id)
+    except Exception as e:
+        print(f"[WARN] Cloudinary delete failed for {public_id}: {str(e)}")
+
+@app.route('/api/shrimp-images/bulk-delete', methods=['POST'])
+def bulk_delete_images():
+    """
+    Xoá nhiều ảnh (document + ảnh Cloudinary)
+    Body: {"ids": ["...", ...]} tối đa BULK_DELETE_MAX id
+    """
+    try:
+        if store is None:
+            return jsonify({
+                "success": False,
+                "message": "Storage not available"
+            }), 503
+
+        data = request.get_json(silent=True)
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not ids or len(ids) > BULK_DELETE_MAX:
+            return jsonify({
+                "success": False,
+                "message": f"ids must be a list of 1-{BULK_DELETE_MAX} image ids"
+            }), 400
+
+        found = store.get_many([str(image_id) for image_id in ids])
+        # Xoá ảnh Cloudinary trước, rồi chỉ xoá document có ảnh đã xoá xong: lỗi giữa chừng
+        # không để lại entry gallery trỏ tới ảnh đã mất, client gửi lại các id còn lại
+        removed = []
+        error = None
+        try:
+            asset_deleter.delete([document_public_id(doc) for doc in found],
+                                 timeout=BULK_DELETE_WAIT_SECONDS, done=removed)
+        except Exception as e:
+            print(f"[ERROR] Cloudinary bulk delete failed: {str(e)}")
+            error = e
+            removed = set(removed)
+            delete_ids = [doc['id'] for doc in found
+                          if document_public_id(doc) is None or document_public_id(doc) in removed]
+        else:
+            delete_ids = [doc['id'] for doc in found]
+
+        deleted = store.delete_many(delete_ids)
+        for doc in deleted:
+            update_rollups(doc.get('capturedFrom', 'unknown'), doc.get('timestamp', 0),
+                           document_detections(doc), sign=-1)
+        print(f"[INFO] Bulk deleted {len(deleted)} images")
+        if error is None:
+            return jsonify({
+                "success": True,
+                "deleted": [doc['id'] for doc in deleted],
+                "notFound": len(ids) - len(deleted)
+            })
+
+        deleted_ids = {doc['id'] for doc in deleted}
+        body = {
+            "success": False,
+            "message": str(error),
+            "deleted": [doc['id'] for doc in deleted],
+            "remaining": [doc['id'] for doc in found if doc['id'] not in deleted_ids]
+        }
+        if isinstance(error, RateLimited):
+            return jsonify(body), 429, {"Retry-After": str(int(error.retry_after) + 1)}
+        if isinstance(error, cloudinary.exceptions.RateLimited):
+            return jsonify(body), 503, {"Retry-After": "60"}
+        # Cloudinary lỗi/không kết nối được
+        return jsonify(body), 502
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+
+# Mục thêm vào /health từ entry point khác (VD app_async.py): tên -> hàm() trả về dict
+health_extensions = {}
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    health = {
         "status": "healthy",
         "camera": "available" if camera is not None else "not found",
+        "cameras": cameras.names(),
         "model": MODEL_PATH,
         "model_type": "TFLite",
         "model_loaded": interpreter is not None,
         "mongodb": "connected" if collection is not None else "not connected",
-        "cloudinary": "configured"
-    })
+        "storage": DETECTION_DB if store is not None else "not available",
+        "cloudinary": "configured",
+        "events": event_hub.stats(),
+        "stream": {
+            "clients": active_streams,
+            "capture": capture.stats() if capture is not None else None,
+            "encoder": frame_encoder.stats()
+        },
+        "live_detection": {name: dict(scheduled, motion=live_pipelines[name]["gate"].stats())
+                           for name, scheduled in inference_scheduler.stats().items()}
+                          if inference_scheduler is not None else "disabled",
+        "recording": recorder.stats() if recorder is not None else "disabled",
+        "spool": spool_forwarder.stats() if spool_forwarder is not None else "disabled",
+        "galleryCache": gallery_cache.stats() if GALLERY_CACHE else "disabled",
+        "retention": retention_purger.stats() if retention_purger is not None else "disabled",
+        "memory": memory_budget.stats(),
+        "inference": interpreter_lock.stats(),
+        "batchInterpreters": batch_interpreters.stats(),
+        "detection": dict(detection_load, avgLatencyMs=round(detection_load["avgLatencyMs"], 1))
+    }
+    for name, report in health_extensions.items():
+        health[name] = report()
+    return jsonify(health)
 
 if __name__ == '__main__':
     print("\n" + "="*50)
     print("🦐 Shrimp Detection Server (TFLite) Starting...")
     print("="*50)
-    print(f"Camera: {'✅ Available' if camera else '❌ Not found'}")
+    print(f"Camera: {'✅ ' + ', '.join(cameras.names()) if len(cameras) else '❌ Not found'}")
     print(f"Model: {'✅ Loaded' if interpreter else '❌ Not loaded'}")
     print(f"MongoDB: {'✅ Connected' if collection is not None else '❌ Not connected'}")
+    print(f"Storage: {'✅ ' + DETECTION_DB if store is not None else '❌ Not available'}")
     print(f"Cloudinary: ✅ Configured")
     print("\nEndpoints:")
-    print("  - Camera Stream: /blynk_feed")
+    print("  - Camera Stream: /blynk_feed, /blynk_feed/<camera>")
+    print("  - Cameras: /api/cameras")
     print("  - Detection API: /api/detect-shrimp")
+    print("  - Snapshot Detection: /api/detect-snapshot, /api/cameras/<camera>/detect-snapshot")
     print("  - Gallery API: /api/shrimp-images")
+    print("  - Bulk Delete: /api/shrimp-images/bulk-delete")
+    print("  - Live Events (SSE): /api/events")
+    print("  - Live Detections: /api/live-detections")
+    print("  - Live Counts: /api/live-counts")
+    print("  - Biomass Stats: /api/stats/biomass")
+    print("  - Recordings: /api/recordings, /api/cameras/<name>/recordings")
     print("  - Health Check: /health")
     print("="*50 + "\n")
 
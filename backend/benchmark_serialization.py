@@ -0,0 +1,69 @@
+"""
+Benchmark serialize response gallery: json chuẩn (như jsonify mặc định),
+orjson và MessagePack trên trang gallery giả lập
+"""
+import argparse
+import gzip
+import json
+import time
+
+import numpy as np
+
+import serialization
+from benchmark_storage import make_documents
+from detection_codec import format_document_detections
+
+
+def build_page(page_size, per_image, form):
+    page = []
+    for doc in make_documents(page_size, per_image, packed=(form == 'compact')):
+        doc['id'] = str(doc.pop('_id'))
+        page.append(format_document_detections(doc, form))
+    return page
+
+
+def time_call(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return result, np.median(timings) * 1000
+
+
+def benchmark(page_size, per_image, repeat):
+    print("=" * 50)
+    print("🧪 Benchmark: response serialization")
+    print("=" * 50)
+
+    encoders = [("json (jsonify mặc định)",
+                 lambda page: json.dumps(page, sort_keys=True, default=serialization._default).encode())]
+    if serialization.orjson is not None:
+        encoders.append(("orjson", serialization.dumps_json))
+    else:
+        print("⚠️  orjson chưa cài, bỏ qua")
+    if serialization.msgpack is not None:
+        encoders.append(("msgpack", serialization.dumps_msgpack))
+    else:
+        print("⚠️  msgpack chưa cài, bỏ qua")
+
+    for form in ('verbose', 'compact'):
+        page = build_page(page_size, per_image, form)
+        print(f"\n[{page_size} ảnh x {per_image} tôm, detections={form}]")
+        for name, encode in encoders:
+            body, ms = time_call(lambda: encode(page), repeat)
+            print(f"   - {name:<24} {ms:7.1f} ms  {len(body) / 1024:7.0f} KB  "
+                  f"(gzip {len(gzip.compress(body, 6)) / 1024:.0f} KB)")
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh tốc độ/kích thước serialize response")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--per-image", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    benchmark(args.page_size, args.per_image, args.repeat)
@@ -0,0 +1,125 @@
+"""
+Benchmark định dạng lưu detections: verbose (list dict) so với packed (mảng nhị phân)
+Đo kích thước document BSON, kích thước JSON của 1 trang gallery và thời gian chuẩn bị
+response. Với --mongo sẽ đo thêm thời gian query thật trên collection tạm.
+"""
+import argparse
+import copy
+import json
+import os
+import time
+
+import bson
+import numpy as np
+
+from detection_codec import pack_detections, format_document_detections
+
+
+def make_detections(count, rng):
+    detections = []
+    for _ in range(count):
+        w, h = rng.uniform(20, 120, size=2)
+        length = round(max(w, h) * 0.02, 2)
+        detections.append({
+            "className": "shrimp",
+            "confidence": float(rng.uniform(0.25, 1.0)),
+            "bbox": {"x": float(rng.integers(0, 4000)) + 0.5, "y": float(rng.integers(0, 3000)),
+                     "width": float(int(w)), "height": float(int(h))},
+            "length": length,
+            "weight": round(0.0065 * length ** 3.1, 2)
+        })
+    return detections
+
+
+def make_documents(pages, per_image, packed, seed=0):
+    rng = np.random.default_rng(seed)
+    documents = []
+    for i in range(pages):
+        detections = make_detections(per_image, rng)
+        doc = {
+            "_id": bson.ObjectId(),
+            "imageUrl": f"http://res.cloudinary.com/demo/image/upload/v1/shrimp-detections/{i}.jpg",
+            "cloudinaryUrl": f"https://res.cloudinary.com/demo/image/upload/v1/shrimp-detections/{i}.jpg",
+            "timestamp": 1700000000000 + i * 1000,
+            "capturedFrom": "benchmark",
+            "inferenceTime": 0.05
+        }
+        if packed:
+            doc["detectionsPacked"] = pack_detections(detections)
+        else:
+            doc["detections"] = detections
+        documents.append(doc)
+    return documents
+
+
+def render_page(documents, form):
+    page = []
+    for doc in documents:
+        doc = dict(doc)
+        doc['id'] = str(doc.pop('_id'))
+        page.append(format_document_detections(doc, form))
+    return json.dumps(page).encode()
+
+
+def time_call(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return result, np.median(timings) * 1000
+
+
+def benchmark(per_image, page_size, repeat, mongo):
+    print("=" * 50)
+    print("🧪 Benchmark: verbose vs packed detection storage")
+    print("=" * 50)
+    print(f"\n{page_size} ảnh/trang, {per_image} tôm/ảnh")
+
+    verbose_docs = make_documents(page_size, per_image, packed=False)
+    packed_docs = make_documents(page_size, per_image, packed=True)
+
+    verbose_size = np.mean([len(bson.encode(d)) for d in verbose_docs])
+    packed_size = np.mean([len(bson.encode(d)) for d in packed_docs])
+    print(f"\n📦 BSON document size: verbose {verbose_size / 1024:.1f} KB, "
+          f"packed {packed_size / 1024:.1f} KB ({packed_size / verbose_size:.0%})")
+
+    print("\n⏱️  Gallery response (format + JSON encode):")
+    for label, docs, form in [("verbose storage → verbose", verbose_docs, 'verbose'),
+                              ("packed storage  → verbose", packed_docs, 'verbose'),
+                              ("packed storage  → compact", packed_docs, 'compact'),
+                              ("packed storage  → none", packed_docs, 'none')]:
+        body, ms = time_call(lambda: render_page(docs, form), repeat)
+        print(f"   - {label}: {ms:.1f} ms, {len(body) / 1024:.0f} KB")
+
+    if mongo:
+        from pymongo import MongoClient
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+                             serverSelectionTimeoutMS=5000)
+        db = client[os.getenv('MONGODB_DATABASE', 'shrimp_db')]
+        print("\n🗄️  MongoDB query (find 100 mới nhất + format + JSON):")
+        for label, docs, form in [("verbose", verbose_docs, 'verbose'),
+                                  ("packed → compact", packed_docs, 'compact')]:
+            temp = db['detections_benchmark']
+            temp.drop()
+            temp.insert_many(copy.deepcopy(docs))
+            temp.create_index('timestamp')
+            query = lambda: render_page(list(temp.find().sort('timestamp', -1).limit(100)), form)
+            _, ms = time_call(query, repeat)
+            stats = db.command('collStats', 'detections_benchmark')
+            print(f"   - {label}: {ms:.1f} ms, collection {stats['size'] / 1024:.0f} KB")
+            temp.drop()
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh định dạng lưu detections")
+    parser.add_argument("--per-image", type=int, default=300, help="Số tôm mỗi ảnh")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo", action="store_true", help="Đo thêm trên MongoDB thật (MONGODB_URI)")
+    args = parser.parse_args()
+
+    benchmark(args.per_image, args.page_size, args.repeat, args.mongo)
@@ -0,0 +1,113 @@
+"""
+Benchmark backend lưu trữ gallery: SQLite nhúng so với MongoDB
+Đo tốc độ ghi (từng document và theo lô) và độ trễ query trang gallery
+(trang đầu, trang sâu qua keyset cursor, lọc theo nguồn).
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmark_storage import make_documents, time_call
+from detection_codec import format_document_detections
+from detection_store import MongoDetectionStore, SQLiteDetectionStore
+
+
+def prepare_documents(count, per_image, packed):
+    documents = make_documents(count, per_image, packed)
+    for i, doc in enumerate(documents):
+        del doc['_id']
+        doc['capturedFrom'] = f"pond-{i % 4}"
+    return documents
+
+
+def measure_ingest(store, documents, batch_size):
+    half = len(documents) // 2
+    started = time.perf_counter()
+    for doc in documents[:half]:
+        store.insert(dict(doc))
+    single_rate = half / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(half, len(documents), batch_size):
+        store.insert_many([dict(doc) for doc in documents[i:i + batch_size]])
+    batch_rate = (len(documents) - half) / (time.perf_counter() - started)
+    return single_rate, batch_rate
+
+
+def measure_queries(store, page_size, repeat):
+    def page(cursor=None, source=None):
+        docs = store.list(limit=page_size, cursor=cursor, source=source)
+        return [format_document_detections(doc, 'compact') for doc in docs]
+
+    # Cursor trang sâu: đi qua vài trang trước khi đo
+    cursor = None
+    for _ in range(5):
+        docs = store.list(limit=page_size, cursor=cursor)
+        if not docs:
+            break
+        cursor = (docs[-1]['timestamp'], docs[-1]['id'])
+
+    results = {}
+    _, results["first page"] = time_call(lambda: page(), repeat)
+    _, results["page 6 (cursor)"] = time_call(lambda: page(cursor), repeat)
+    _, results["source filter"] = time_call(lambda: page(source="pond-1"), repeat)
+    first = store.list(limit=1)[0]
+    _, results["detail by id"] = time_call(lambda: store.get(first['id']), repeat)
+    return results
+
+
+def report(label, single_rate, batch_rate, queries):
+    print(f"\n🗄️  {label}")
+    print(f"   - Ghi từng ảnh: {single_rate:.0f} docs/s")
+    print(f"   - Ghi theo lô:  {batch_rate:.0f} docs/s")
+    for name, ms in queries.items():
+        print(f"   - {name}: {ms:.2f} ms")
+
+
+def benchmark(count, per_image, page_size, batch_size, repeat, packed, mongo):
+    print("=" * 50)
+    print("🧪 Benchmark: SQLite vs MongoDB gallery storage")
+    print("=" * 50)
+    print(f"\n{count} ảnh, {per_image} tôm/ảnh, trang {page_size}, lô {batch_size}, "
+          f"{'packed' if packed else 'verbose'}")
+
+    documents = prepare_documents(count, per_image, packed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteDetectionStore(os.path.join(directory, 'benchmark.db'))
+        single_rate, batch_rate = measure_ingest(store, documents, batch_size)
+        queries = measure_queries(store, page_size, repeat)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        report(f"SQLite ({size / 1024 / 1024:.1f} MB)", single_rate, batch_rate, queries)
+
+    if mongo:
+        from pymongo import MongoClient
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+                             serverSelectionTimeoutMS=5000)
+        temp = client[os.getenv('MONGODB_DATABASE', 'shrimp_db')]['detections_benchmark']
+        temp.drop()
+        try:
+            store = MongoDetectionStore(temp)
+            single_rate, batch_rate = measure_ingest(store, documents, batch_size)
+            queries = measure_queries(store, page_size, repeat)
+            report("MongoDB", single_rate, batch_rate, queries)
+        finally:
+            temp.drop()
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh SQLite và MongoDB cho gallery")
+    parser.add_argument("--count", type=int, default=2000, help="Số ảnh ghi vào")
+    parser.add_argument("--per-image", type=int, default=30, help="Số tôm mỗi ảnh")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--packed", action="store_true", help="Lưu detections dạng packed")
+    parser.add_argument("--mongo", action="store_true", help="Đo thêm trên MongoDB thật (MONGODB_URI)")
+    args = parser.parse_args()
+
+    benchmark(args.count, args.per_image, args.page_size, args.batch_size,
+              args.repeat, args.packed, args.mongo)
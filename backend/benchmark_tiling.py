@@ -0,0 +1,134 @@
+"""
+Benchmark tiled inference so với single-pass
+Đo latency và số lượng tôm phát hiện; nếu có file nhãn YOLO (.txt cùng tên ảnh,
+mỗi dòng: class cx cy w h chuẩn hoá 0-1) thì tính thêm precision/recall @ IoU 0.5
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+import detector
+
+
+def load_labels(image_path, width, height):
+    """Đọc nhãn YOLO, trả về mảng boxes [x1, y1, x2, y2] theo pixel (None nếu không có)"""
+    label_path = os.path.splitext(image_path)[0] + '.txt'
+    if not os.path.exists(label_path):
+        return None
+
+    boxes = []
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            boxes.append([(cx - w/2) * width, (cy - h/2) * height,
+                          (cx + w/2) * width, (cy + h/2) * height])
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def detections_to_boxes(detections):
+    boxes = []
+    for det in detections:
+        b = det['bbox']
+        boxes.append([b['x'] - b['width']/2, b['y'] - b['height']/2,
+                      b['x'] + b['width']/2, b['y'] + b['height']/2])
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def count_matches(predicted, truth, iou_threshold=0.5):
+    """Ghép greedy theo IoU, trả về số true positive"""
+    if len(predicted) == 0 or len(truth) == 0:
+        return 0
+    ious = iou_matrix(predicted, truth)
+    matched = 0
+    while ious.size and ious.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        matched += 1
+        ious[i, :] = 0
+        ious[:, j] = 0
+    return matched
+
+
+def run_mode(name, detect, images, repeat):
+    latencies = []
+    total = {"found": 0, "tp": 0, "truth": 0, "labelled": 0}
+    for path, image in images:
+        detections = detect(image)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            detections = detect(image)
+            latencies.append(time.perf_counter() - started)
+
+        total["found"] += len(detections)
+        truth = load_labels(path, image.shape[1], image.shape[0])
+        if truth is not None:
+            total["labelled"] += 1
+            total["truth"] += len(truth)
+            total["tp"] += count_matches(detections_to_boxes(detections), truth)
+
+    latencies = np.array(latencies) * 1000
+    print(f"\n[{name}]")
+    print(f"   - Latency: mean {latencies.mean():.1f} ms, "
+          f"p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms")
+    print(f"   - Detections: {total['found']}")
+    if total["labelled"]:
+        found_labelled = max(total["found"], 1)
+        print(f"   - Precision: {total['tp'] / found_labelled:.3f}  "
+              f"Recall: {total['tp'] / max(total['truth'], 1):.3f}  "
+              f"({total['labelled']} ảnh có nhãn)")
+
+
+def benchmark(image_paths, repeat, max_tiles, overlap):
+    print("=" * 50)
+    print("🧪 Benchmark: single-pass vs tiled inference")
+    print("=" * 50)
+
+    if detector.interpreter is None:
+        print("❌ Model chưa load, không thể benchmark")
+        return
+
+    images = []
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"⚠️  Bỏ qua (không đọc được): {path}")
+            continue
+        images.append((path, image))
+    print(f"\n{len(images)} ảnh, model input {detector.INPUT_WIDTH}x{detector.INPUT_HEIGHT}, "
+          f"max {max_tiles} tiles, overlap {overlap}")
+
+    run_mode("single-pass",
+             lambda image: detector.parse_yolo_output(detector.run_inference(image), image.shape),
+             images, repeat)
+    run_mode("tiled",
+             lambda image: detector.detect_tiled(image, max_tiles=max_tiles, overlap=overlap),
+             images, repeat)
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh single-pass và tiled inference")
+    parser.add_argument("images", nargs="+", help="Ảnh test (nhãn YOLO .txt cùng tên nếu có)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-tiles", type=int, default=detector.TILE_MAX_COUNT)
+    parser.add_argument("--overlap", type=float, default=detector.TILE_OVERLAP)
+    args = parser.parse_args()
+
+    benchmark(args.images, args.repeat, args.max_tiles, args.overlap)
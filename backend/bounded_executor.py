@@ -0,0 +1,80 @@
+"""
+Thread pool có giới hạn cho server asyncio (app_async.py)
+Việc chặn (decode/inference, encode JPEG, Flask route, SQLite) chạy trên số thread cố định;
+số việc đang chờ cũng có hạn, vượt quá thì từ chối ngay (ExecutorBusy -> 503 + Retry-After)
+thay vì xếp hàng vô hạn và giữ RAM của từng request trên Pi.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    """Executor đã đủ việc đang chạy + đang chờ"""
+
+    def __init__(self, name, retry_after=1.0):
+        super().__init__(f"Server busy ({name} executor full), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor với giới hạn số việc chờ, gọi từ event loop bằng await run(...)"""
+
+    def __init__(self, name, workers, max_pending):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"async-{name}")
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_total = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Chạy fn(*args, **kwargs) trên thread pool (giữ contextvars như asyncio.to_thread)
+        Raises:
+            ExecutorBusy: đã có workers việc đang chạy và max_pending việc đang chờ
+        """
+        with self._lock:
+            if self._submitted >= self.workers + self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy(self.name)
+            # Giảm trong thread khi việc thực sự xong: request bị huỷ vẫn chiếm chỗ tới lúc đó
+            self._submitted += 1
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._call, call, time.monotonic())
+
+    def _call(self, call, submitted_at):
+        with self._lock:
+            self._running += 1
+            self.queue_total += time.monotonic() - submitted_at
+        try:
+            return call()
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._submitted -= 1
+                self.completed += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self._running
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._submitted - self._running,
+                "maxPending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avgQueueMs": round(self.queue_total / started * 1000, 1) if started else 0.0
+            }
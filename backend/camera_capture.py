@@ -0,0 +1,94 @@
+"""
+Thread đọc camera liên tục, giữ frame mới nhất để mọi client stream dùng chung
+(thay vì mỗi client tự grab() camera)
+"""
+import threading
+import time
+
+
+class CameraCapture:
+    """Đọc frame từ cv2.VideoCapture trong thread riêng"""
+
+    def __init__(self, camera, lock=None, name='camera'):
+        self.camera = camera
+        self.lock = lock or threading.Lock()
+        self.name = name
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self._running = False
+        self._thread = None
+        self._listeners = []
+        self.frames = 0
+        self.failures = 0
+        self.fps = 0.0
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        last_time = None
+        while self._running:
+            with self.lock:
+                success = self.camera.grab()
+                if success:
+                    success, frame = self.camera.retrieve()
+
+            if not success:
+                self.failures += 1
+                time.sleep(0.05)
+                continue
+
+            now = time.time()
+            if last_time is not None and now > last_time:
+                # FPS thực tế, làm mượt bằng EWMA
+                self.fps = 0.9 * self.fps + 0.1 * (1.0 / (now - last_time))
+            last_time = now
+
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._timestamp = now
+                self.frames += 1
+                seq = self._seq
+                self._cond.notify_all()
+            for listener in self._listeners:
+                listener(seq)
+
+    def add_listener(self, callback):
+        """
+        callback(seq) được gọi trên capture thread sau mỗi frame mới
+        (VD đánh thức client trên event loop asyncio); phải nhanh và không chặn
+        """
+        self._listeners.append(callback)
+
+    def latest(self):
+        """Trả về (seq, frame, timestamp) của frame mới nhất"""
+        with self._cond:
+            return self._seq, self._frame, self._timestamp
+
+    def wait_for_frame(self, after_seq, timeout=1.0):
+        """Chờ tới khi có frame mới hơn after_seq (hoặc hết timeout)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or not self._running, timeout)
+            return self._seq, self._frame, self._timestamp
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "failures": self.failures,
+            "fps": round(self.fps, 1)
+        }
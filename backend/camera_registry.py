@@ -0,0 +1,249 @@
+"""
+Nhiều camera USB trên 1 Pi (mỗi bể 1 camera): mỗi camera có capture thread và cấu hình riêng
+InferenceScheduler là thread inference dùng chung, lấy lần lượt frame mới nhất của từng camera
+(round-robin) để camera nhiều chuyển động không chiếm hết model.
+
+Cấu hình (CAMERAS), các camera cách nhau dấu phẩy, độ phân giải và FPS tuỳ chọn:
+    CAMERAS=tank1=/dev/video0,tank2=/dev/video2:1280x720@15
+Không đặt CAMERAS: tự dò /dev/video0-29 như trước nhưng mở mọi camera đọc được.
+"""
+import re
+import threading
+import time
+
+import cv2
+
+from camera_capture import CameraCapture
+
+SPEC_PATTERN = re.compile(
+    r'^(?:(?P<name>[\w.-]+)=)?(?P<device>[^:@=]+)'
+    r'(?::(?P<width>\d+)x(?P<height>\d+))?(?:@(?P<fps>\d+(?:\.\d+)?))?$')
+
+
+class CameraSettings:
+    """Cấu hình 1 camera: tên (dùng làm source/ROI key), device, độ phân giải, FPS"""
+
+    def __init__(self, name, device, width=640, height=480, fps=30):
+        self.name = name
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "device": self.device if isinstance(self.device, str) else f"/dev/video{self.device}",
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps
+        }
+
+
+def parse_camera_specs(value, default_name):
+    """
+    "tank1=/dev/video0,tank2=/dev/video2:1280x720@15" -> list CameraSettings
+    Camera đầu tiên không đặt tên sẽ lấy default_name, các camera khác lấy tên device (video2)
+    """
+    specs = []
+    for item in (part.strip() for part in value.split(',')):
+        if not item:
+            continue
+        match = SPEC_PATTERN.match(item)
+        if match is None:
+            raise ValueError(f"Invalid camera spec: {item}")
+        device = match.group('device')
+        device = int(device) if device.isdigit() else device
+        name = match.group('name')
+        if name is None:
+            name = default_name if not specs else str(device).rsplit('/', 1)[-1]
+        settings = CameraSettings(name, device)
+        if match.group('width'):
+            settings.width, settings.height = int(match.group('width')), int(match.group('height'))
+        if match.group('fps'):
+            settings.fps = float(match.group('fps'))
+        specs.append(settings)
+
+    names = [settings.name for settings in specs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate camera names: {', '.join(names)}")
+    return specs
+
+
+def open_camera(device):
+    """Mở device V4L2 và đọc thử 1 frame, None nếu không dùng được"""
+    camera = cv2.VideoCapture(device, cv2.CAP_V4L2)
+    if camera.isOpened():
+        ret, _ = camera.read()
+        if ret:
+            return camera
+    camera.release()
+    return None
+
+
+def configure_camera(camera, settings):
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
+    camera.set(cv2.CAP_PROP_FPS, settings.fps)
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+
+
+def probe_cameras(default_name, max_cameras=4, max_index=30):
+    """Dò /dev/video0..max_index-1, trả về list (CameraSettings, VideoCapture) đọc được"""
+    found = []
+    for i in range(max_index):
+        if len(found) >= max_cameras:
+            break
+        camera = open_camera(i)
+        if camera is not None:
+            name = default_name if not found else f"{default_name}-{i}"
+            found.append((CameraSettings(name, i), camera))
+    return found
+
+
+class CameraRegistry:
+    """Các camera đang chạy theo tên, camera đầu tiên là mặc định"""
+
+    def __init__(self):
+        self.captures = {}
+        self.settings = {}
+
+    def add(self, settings, camera):
+        configure_camera(camera, settings)
+        capture = CameraCapture(camera, name=settings.name).start()
+        self.captures[settings.name] = capture
+        self.settings[settings.name] = settings
+        return capture
+
+    def get(self, name=None):
+        """Capture của camera name (mặc định: camera đầu tiên), None nếu không có"""
+        if name is None:
+            name = self.default
+        return self.captures.get(name)
+
+    @property
+    def default(self):
+        return next(iter(self.captures), None)
+
+    def names(self):
+        return list(self.captures)
+
+    def __len__(self):
+        return len(self.captures)
+
+    def stats(self):
+        return {name: dict(self.settings[name].to_dict(), capture=capture.stats())
+                for name, capture in self.captures.items()}
+
+
+class InferenceScheduler:
+    """
+    1 thread inference cho mọi camera
+    Mỗi lượt phục vụ camera kế tiếp (round-robin) đã tới hạn và có frame mới, mỗi camera
+    tối đa fps lần/giây. Khi model không kịp, các camera chia đều thời gian inference.
+    Số liệu mỗi camera:
+        processed: số frame đã xử lý, fps: tốc độ xử lý thực tế
+        dropped: số lượt tới hạn bị lỡ vì thread đang bận camera khác
+        skipped: frame camera đã chụp nhưng không được xử lý (gồm cả do giới hạn fps)
+    """
+
+    def __init__(self, registry, process, fps=5.0):
+        """
+        Args:
+            process: hàm(name, seq, frame, captured_at), chạy trên thread scheduler
+        """
+        self.registry = registry
+        self.process = process
+        self.interval = 1.0 / fps
+        self._lock = threading.Lock()
+        self._state = {}
+        self._next = 0
+        self._running = False
+        self._thread = None
+        for name in registry.names():
+            self._state[name] = {
+                "lastSeq": 0, "due": 0.0, "lastRun": None,
+                "processed": 0, "dropped": 0, "skipped": 0, "errors": 0,
+                "fps": 0.0, "busySeconds": 0.0
+            }
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _pick(self, now):
+        """Camera kế tiếp (theo vòng) đã tới hạn và có frame mới: (name, seq, frame, captured_at)"""
+        names = self.registry.names()
+        for offset in range(len(names)):
+            index = (self._next + offset) % len(names)
+            name = names[index]
+            state = self._state[name]
+            if state["due"] > now:
+                continue
+            seq, frame, captured_at = self.registry.get(name).latest()
+            if frame is None or seq == state["lastSeq"]:
+                continue
+            self._next = index + 1
+            return name, seq, frame, captured_at
+        return None
+
+    def _run(self):
+        while self._running:
+            now = time.time()
+            picked = self._pick(now)
+            if picked is None:
+                # Chưa camera nào tới hạn/có frame mới
+                with self._lock:
+                    due = min((s["due"] for s in self._state.values()), default=now)
+                time.sleep(min(max(due - now, 0.005), self.interval))
+                continue
+
+            name, seq, frame, captured_at = picked
+            started = time.time()
+            try:
+                self.process(name, seq, frame, captured_at)
+                error = False
+            except Exception as e:
+                print(f"[ERROR] Live detection ({name}): {str(e)}")
+                error = True
+            finished = time.time()
+
+            with self._lock:
+                state = self._state[name]
+                if state["lastSeq"]:
+                    state["skipped"] += max(seq - state["lastSeq"] - 1, 0)
+                    # Số lượt lẽ ra phải chạy trong lúc camera chờ tới lượt
+                    if state["due"]:
+                        state["dropped"] += int((started - state["due"]) / self.interval)
+                if state["lastRun"] is not None and started > state["lastRun"]:
+                    state["fps"] = 0.8 * state["fps"] + 0.2 / (started - state["lastRun"])
+                state["lastRun"] = started
+                state["lastSeq"] = seq
+                state["processed"] += 1
+                state["errors"] += error
+                state["busySeconds"] += finished - started
+                # Giữ nhịp đều: hạn kế tiếp tính từ hạn cũ, không dồn lượt khi bị trễ
+                due = state["due"] + self.interval
+                state["due"] = due if due >= started else started + self.interval
+                if error:
+                    # Camera lỗi nghỉ 1 giây, các camera khác vẫn chạy
+                    state["due"] = finished + 1.0
+
+    def stats(self):
+        with self._lock:
+            return {name: {
+                "processed": state["processed"],
+                "fps": round(state["fps"], 1),
+                "dropped": state["dropped"],
+                "skipped": state["skipped"],
+                "errors": state["errors"],
+                "busySeconds": round(state["busySeconds"], 2)
+            } for name, state in self._state.items()}
@@ -0,0 +1,153 @@
+"""
+Mã hoá gọn danh sách detections để lưu MongoDB
+Dạng verbose lặp lại key (className, confidence, bbox.x, ...) cho từng con tôm;
+dạng packed lưu 1 bảng class + 2 mảng nhị phân (uint16 class id, float32 N x 7).
+"""
+import numpy as np
+
+PACKED_VERSION = 1
+COLUMNS = ["confidence", "x", "y", "width", "height", "length", "weight"]
+
+# Số chữ số thập phân khi trả về (float32 không giữ đúng giá trị đã làm tròn)
+COLUMN_DECIMALS = {"confidence": 4, "x": 2, "y": 2, "width": 2, "height": 2, "length": 2, "weight": 2}
+
+
+def pack_detections(detections):
+    """List detections verbose -> dict packed (dùng cho field detectionsPacked)"""
+    classes = []
+    class_index = {}
+    for det in detections:
+        name = det.get('className', 'shrimp')
+        if name not in class_index:
+            class_index[name] = len(classes)
+            classes.append(name)
+
+    class_ids = np.array([class_index[d.get('className', 'shrimp')] for d in detections], dtype='<u2')
+    values = np.array([[d.get('confidence', 0.0),
+                        d['bbox']['x'], d['bbox']['y'], d['bbox']['width'], d['bbox']['height'],
+                        d.get('length', 0.0), d.get('weight', 0.0)] for d in detections],
+                      dtype='<f4').reshape(-1, len(COLUMNS))
+
+    return {
+        "version": PACKED_VERSION,
+        "count": len(detections),
+        "classes": classes,
+        "columns": COLUMNS,
+        "classIds": class_ids.tobytes(),
+        "values": values.tobytes()
+    }
+
+
+def _packed_arrays(packed):
+    columns = packed.get("columns", COLUMNS)
+    class_ids = np.frombuffer(packed["classIds"], dtype='<u2')
+    values = np.frombuffer(packed["values"], dtype='<f4').reshape(-1, len(columns))
+    return columns, class_ids, values
+
+
+def unpack_detections(packed):
+    """dict packed -> list detections verbose (giống format API cũ)"""
+    columns, class_ids, values = _packed_arrays(packed)
+    classes = packed.get("classes", [])
+    index = {name: i for i, name in enumerate(columns)}
+    rounded = {name: np.round(values[:, i].astype(np.float64), COLUMN_DECIMALS.get(name, 4)).tolist()
+               for name, i in index.items()}
+
+    names = [classes[c] if c < len(classes) else f"class_{c}" for c in range(int(class_ids.max()) + 1)] \
+        if len(class_ids) else []
+    return [
+        {
+            "className": names[class_id],
+            "confidence": confidence,
+            "bbox": {"x": x, "y": y, "width": width, "height": height},
+            "length": length,
+            "weight": weight
+        }
+        for class_id, confidence, x, y, width, height, length, weight in zip(
+            class_ids.tolist(), *(rounded[name] for name in COLUMNS))
+    ]
+
+
+def columns_from_packed(packed):
+    """dict packed -> mảng song song cho JSON compact (không tạo dict cho từng con tôm)"""
+    columns, class_ids, values = _packed_arrays(packed)
+    result = {"classes": packed.get("classes", []), "classId": class_ids.tolist()}
+    for i, name in enumerate(columns):
+        result[name] = np.round(values[:, i].astype(np.float64), COLUMN_DECIMALS.get(name, 4)).tolist()
+    return result
+
+
+def columns_from_detections(detections):
+    """List detections verbose -> mảng song song cho JSON compact"""
+    return columns_from_packed(pack_detections(detections))
+
+
+def summarize_sizes(lengths, weights):
+    """Số liệu tóm tắt 1 ảnh từ mảng chiều dài/khối lượng (float64)"""
+    if not len(lengths):
+        return {"count": 0, "totalWeight": 0.0,
+                "meanLength": 0.0, "minLength": 0.0, "maxLength": 0.0,
+                "meanWeight": 0.0, "minWeight": 0.0, "maxWeight": 0.0}
+    return {
+        "count": int(len(lengths)),
+        "totalWeight": round(float(weights.sum()), 2),
+        "meanLength": round(float(lengths.mean()), 2),
+        "minLength": round(float(lengths.min()), 2),
+        "maxLength": round(float(lengths.max()), 2),
+        "meanWeight": round(float(weights.mean()), 2),
+        "minWeight": round(float(weights.min()), 2),
+        "maxWeight": round(float(weights.max()), 2)
+    }
+
+
+def summarize_detections(detections):
+    """
+    Số liệu tóm tắt 1 ảnh, lưu cùng document (field summary) để gallery lọc/sắp xếp
+    bằng index thay vì đọc lại toàn bộ detections
+    """
+    lengths = np.array([d.get('length', 0.0) for d in detections], dtype=np.float64)
+    weights = np.array([d.get('weight', 0.0) for d in detections], dtype=np.float64)
+    return summarize_sizes(lengths, weights)
+
+
+class DetectionList(list):
+    """
+    List detections verbose kèm summary đã tính từ mảng chiều dài/khối lượng (build_detections),
+    document/event dùng lại thay vì tổng hợp lại từ list dict
+    """
+
+    def __init__(self, detections=(), summary=None):
+        super().__init__(detections)
+        self.summary = summary
+
+
+def detections_summary(detections):
+    """Summary có sẵn của DetectionList, hoặc tính từ list dict (VD detections gộp nhiều frame, spool)"""
+    summary = getattr(detections, 'summary', None)
+    return summary if summary is not None else summarize_detections(detections)
+
+
+def document_detections(doc):
+    """Lấy detections verbose từ document MongoDB ở cả 2 định dạng lưu"""
+    if "detectionsPacked" in doc:
+        return unpack_detections(doc["detectionsPacked"])
+    return doc.get("detections", [])
+
+
+def format_document_detections(doc, form='verbose'):
+    """
+    Chuẩn hoá field detections của document trước khi trả về API
+    Args:
+        form: 'verbose' (list dict như cũ), 'compact' (detectionsColumns) hoặc 'none' (chỉ detectionCount)
+    """
+    packed = doc.pop("detectionsPacked", None)
+    verbose = doc.pop("detections", None)
+
+    if form == 'compact':
+        doc["detectionsColumns"] = columns_from_packed(packed) if packed is not None \
+            else columns_from_detections(verbose or [])
+    elif form == 'verbose':
+        doc["detections"] = unpack_detections(packed) if packed is not None else (verbose or [])
+
+    doc["detectionCount"] = packed["count"] if packed is not None else len(verbose or [])
+    return doc
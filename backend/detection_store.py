@@ -0,0 +1,490 @@
+"""
+Lớp lưu trữ detections cho gallery API
+- MongoDetectionStore: collection MongoDB như trước
+- SQLiteDetectionStore: database nhúng cho Pi chạy độc lập (không có MongoDB)
+- AsyncMongoDetectionStore: cùng collection MongoDB qua motor cho server asyncio
+Cả 2 trả về document cùng dạng (field 'id' là string) và phân trang theo keyset
+(timestamp, id) nên trang sau không phải skip qua các trang trước.
+Mỗi document có field summary (số tôm, chiều dài/khối lượng trung bình/min/max, tổng biomass);
+các field dùng để lọc nằm cuối index (equality, sort, range) nên lọc theo số tôm/kích thước
+được kiểm tra ngay trên index, không phải đọc detections của từng document.
+"""
+import sqlite3
+import threading
+
+import bson
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from detection_codec import document_detections, summarize_detections
+
+# Query gallery -> (field trong summary, toán tử)
+SUMMARY_FILTERS = {
+    'minCount': ('count', '$gte'),
+    'maxCount': ('count', '$lte'),
+    'minWeight': ('meanWeight', '$gte'),
+    'maxWeight': ('meanWeight', '$lte'),
+    'minLength': ('meanLength', '$gte'),
+    'maxLength': ('meanLength', '$lte')
+}
+SUMMARY_INDEX_KEYS = [('summary.count', ASCENDING), ('summary.meanWeight', ASCENDING),
+                      ('summary.meanLength', ASCENDING)]
+SQL_COLUMNS = {'count': 'count', 'meanWeight': 'mean_weight', 'meanLength': 'mean_length'}
+SQL_OPERATORS = {'$gte': '>=', '$lte': '<='}
+LIST_SORT = [('timestamp', DESCENDING), ('_id', DESCENDING)]
+DUPLICATE_KEY = 11000
+
+
+def encode_cursor(doc):
+    """Cursor trang tiếp theo từ document cuối cùng của trang hiện tại"""
+    return f"{doc['timestamp']}_{doc['id']}"
+
+
+def decode_cursor(cursor):
+    """'timestamp_id' -> (timestamp, id); ValueError nếu sai định dạng"""
+    timestamp, _, image_id = cursor.partition('_')
+    if not image_id:
+        raise ValueError(f"invalid cursor: {cursor}")
+    return int(timestamp), image_id
+
+
+def parse_filters(args):
+    """
+    Query string -> dict filter cho list()
+    minCount/maxCount (số tôm), minWeight/maxWeight (khối lượng TB 1 con, g),
+    minLength/maxLength (chiều dài TB, cm), from/to (timestamp ms, [from, to))
+    ValueError nếu giá trị sai kiểu
+    """
+    filters = {}
+    for name in list(SUMMARY_FILTERS) + ['from', 'to']:
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        filters[name] = float(value) if name.endswith(('Weight', 'Length')) else int(value)
+    return filters
+
+
+def ensure_summary(doc):
+    """Thêm summary cho document chưa có (document cũ, hoặc tạo ngoài build_detection_document)"""
+    if 'summary' not in doc:
+        doc['summary'] = summarize_detections(document_detections(doc))
+    return doc
+
+
+class StoreVersion:
+    """
+    Bộ đếm thay đổi của store trong process (tăng mỗi lần insert/delete),
+    dùng để vô hiệu cache response gallery
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def changed(self):
+        with self._lock:
+            self.version += 1
+
+
+class MongoDetectionStore:
+    """Lưu detections trong collection MongoDB"""
+
+    name = 'mongodb'
+
+    # Index cũ là tiền tố của index mới, giữ lại chỉ tốn thêm ghi
+    REPLACED_INDEXES = ('timestamp_-1__id_-1', 'capturedFrom_1_timestamp_-1__id_-1')
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.changes = StoreVersion()
+        self.collection.create_index([('timestamp', DESCENDING), ('_id', DESCENDING)] + SUMMARY_INDEX_KEYS)
+        self.collection.create_index([('capturedFrom', ASCENDING), ('timestamp', DESCENDING),
+                                      ('_id', DESCENDING)] + SUMMARY_INDEX_KEYS)
+        existing = self.collection.index_information()
+        for name in self.REPLACED_INDEXES:
+            if name in existing:
+                self.collection.drop_index(name)
+        # Khoá idempotent của bản ghi từ offline spool (document thường không có field này)
+        self.collection.create_index('spoolKey', unique=True, sparse=True)
+
+    @staticmethod
+    def _object_id(image_id):
+        try:
+            return ObjectId(image_id)
+        except (InvalidId, TypeError):
+            return None
+
+    @staticmethod
+    def _public(doc):
+        doc['id'] = str(doc.pop('_id'))
+        doc.pop('spoolKey', None)
+        return doc
+
+    def insert(self, doc):
+        inserted_id = self.collection.insert_one(ensure_summary(doc)).inserted_id
+        self.changes.changed()
+        return str(inserted_id)
+
+    def insert_many(self, docs):
+        docs = [ensure_summary(doc) for doc in docs]
+        inserted_ids = self.collection.insert_many(docs, ordered=True).inserted_ids
+        self.changes.changed()
+        return [str(i) for i in inserted_ids]
+
+    def insert_spooled(self, docs):
+        """
+        Ghi lô từ offline spool, idempotent theo doc['spoolKey'] (lần gửi trước có thể đã ghi
+        một phần rồi timeout). Trả về cho từng document: id (kể cả bản đã ghi từ lần trước)
+        hoặc Exception nếu chính document đó bị từ chối; lỗi kết nối thì raise cả lô
+        """
+        if not docs:
+            return []
+        docs = [ensure_summary(doc) for doc in docs]
+        errors = {}
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = {error['index']: error for error in e.details.get('writeErrors', [])}
+
+        duplicates = [docs[i]['spoolKey'] for i, error in errors.items() if error.get('code') == DUPLICATE_KEY]
+        existing = {}
+        if duplicates:
+            existing = {doc['spoolKey']: str(doc['_id'])
+                        for doc in self.collection.find({'spoolKey': {'$in': duplicates}}, {'spoolKey': 1})}
+
+        results = []
+        for i, doc in enumerate(docs):
+            if i not in errors:
+                results.append(str(doc['_id']))
+            elif doc['spoolKey'] in existing:
+                results.append(existing[doc['spoolKey']])
+            else:
+                results.append(ValueError(errors[i].get('errmsg', 'write error')))
+        if len(errors) < len(docs):
+            self.changes.changed()
+        return results
+
+    @classmethod
+    def list_query(cls, cursor=None, source=None, filters=None):
+        """Query MongoDB cho 1 trang gallery (dùng chung với AsyncMongoDetectionStore)"""
+        query = {}
+        if source:
+            query['capturedFrom'] = source
+        for name, value in (filters or {}).items():
+            if name in SUMMARY_FILTERS:
+                field, operator = SUMMARY_FILTERS[name]
+                query.setdefault(f'summary.{field}', {})[operator] = value
+        if filters and 'from' in filters:
+            query.setdefault('timestamp', {})['$gte'] = filters['from']
+        if filters and 'to' in filters:
+            query.setdefault('timestamp', {})['$lt'] = filters['to']
+        if cursor is not None:
+            timestamp, image_id = cursor
+            object_id = cls._object_id(image_id)
+            if object_id is None:
+                # Như SQLite (int(id)): cursor sai -> 400, không query {'$lt': None}
+                raise ValueError(f"invalid cursor id: {image_id}")
+            query['$or'] = [{'timestamp': {'$lt': timestamp}},
+                            {'timestamp': timestamp, '_id': {'$lt': object_id}}]
+        return query
+
+    def list(self, limit=100, cursor=None, source=None, filters=None):
+        docs = self.collection.find(self.list_query(cursor, source, filters)).sort(LIST_SORT).limit(limit)
+        return [self._public(doc) for doc in docs]
+
+    def get(self, image_id):
+        object_id = self._object_id(image_id)
+        if object_id is None:
+            return None
+        doc = self.collection.find_one({'_id': object_id})
+        return self._public(doc) if doc is not None else None
+
+    def get_many(self, image_ids):
+        """Nhiều ảnh trong 1 query (id không hợp lệ/không tồn tại bị bỏ qua)"""
+        object_ids = [oid for oid in map(self._object_id, image_ids) if oid is not None]
+        if not object_ids:
+            return []
+        return [self._public(doc) for doc in self.collection.find({'_id': {'$in': object_ids}})]
+
+    def delete(self, image_id):
+        object_id = self._object_id(image_id)
+        if object_id is None:
+            return None
+        doc = self.collection.find_one_and_delete({'_id': object_id})
+        if doc is None:
+            return None
+        self.changes.changed()
+        return self._public(doc)
+
+    def delete_many(self, image_ids):
+        """Xoá nhiều ảnh, trả về các document đã xoá (id không hợp lệ/không tồn tại bị bỏ qua)"""
+        object_ids = [oid for oid in map(self._object_id, image_ids) if oid is not None]
+        if not object_ids:
+            return []
+        docs = list(self.collection.find({'_id': {'$in': object_ids}}))
+        self.collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        self.changes.changed()
+        return [self._public(doc) for doc in docs]
+
+    def oldest(self, limit=100):
+        """Các ảnh cũ nhất (không kèm detections), cũ nhất trước"""
+        docs = self.collection.find({}, {'detections': 0, 'detectionsPacked': 0}) \
+            .sort([('timestamp', ASCENDING), ('_id', ASCENDING)]).limit(limit)
+        return [self._public(doc) for doc in docs]
+
+    def count(self):
+        return self.collection.estimated_document_count()
+
+    def backfill_summaries(self, limit=500):
+        """Thêm summary cho tối đa limit document cũ, trả về số document đã cập nhật"""
+        docs = list(self.collection.find({'summary': {'$exists': False}}).limit(limit))
+        if docs:
+            self.collection.bulk_write([
+                UpdateOne({'_id': doc['_id']},
+                          {'$set': {'summary': summarize_detections(document_detections(doc))}})
+                for doc in docs], ordered=False)
+            self.changes.changed()
+        return len(docs)
+
+
+class AsyncMongoDetectionStore:
+    """
+    Các thao tác gallery/upload của MongoDetectionStore qua driver async (motor), cho app_async.py
+    Index do MongoDetectionStore tạo; changes dùng chung với store đồng bộ để cache gallery
+    thấy cả thay đổi từ spool forwarder/retention chạy trên thread.
+    """
+
+    name = 'mongodb'
+
+    def __init__(self, collection, changes):
+        self.collection = collection
+        self.changes = changes
+
+    async def insert(self, doc):
+        result = await self.collection.insert_one(ensure_summary(doc))
+        self.changes.changed()
+        return str(result.inserted_id)
+
+    async def list(self, limit=100, cursor=None, source=None, filters=None):
+        query = MongoDetectionStore.list_query(cursor, source, filters)
+        docs = await self.collection.find(query).sort(LIST_SORT).limit(limit).to_list(length=limit)
+        return [MongoDetectionStore._public(doc) for doc in docs]
+
+    async def get(self, image_id):
+        object_id = MongoDetectionStore._object_id(image_id)
+        if object_id is None:
+            return None
+        doc = await self.collection.find_one({'_id': object_id})
+        return MongoDetectionStore._public(doc) if doc is not None else None
+
+    async def delete(self, image_id):
+        object_id = MongoDetectionStore._object_id(image_id)
+        if object_id is None:
+            return None
+        doc = await self.collection.find_one_and_delete({'_id': object_id})
+        if doc is None:
+            return None
+        self.changes.changed()
+        return MongoDetectionStore._public(doc)
+
+
+class SQLiteDetectionStore:
+    """
+    Lưu detections trong file SQLite (WAL)
+    Các field dùng để lọc/sắp xếp là cột có index, phần còn lại của document
+    (kể cả detectionsPacked nhị phân) được lưu nguyên dạng BSON.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.changes = StoreVersion()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                document BLOB NOT NULL
+            )
+        """)
+        # Database tạo trước khi có summary: thêm cột, document cũ được backfill_summaries() điền sau
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(detections)")}
+        for column, sql_type in (('count', 'INTEGER'), ('mean_weight', 'REAL'), ('mean_length', 'REAL'),
+                                 ('spool_key', 'TEXT')):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE detections ADD COLUMN {column} {sql_type}")
+        self._db.execute("DROP INDEX IF EXISTS idx_detections_time")
+        self._db.execute("DROP INDEX IF EXISTS idx_detections_source")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_detections_time_summary "
+                         "ON detections (timestamp DESC, id DESC, count, mean_weight, mean_length)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_detections_source_summary "
+                         "ON detections (source, timestamp DESC, id DESC, count, mean_weight, mean_length)")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_detections_spool_key "
+                         "ON detections (spool_key) WHERE spool_key IS NOT NULL")
+        self._db.commit()
+
+    @staticmethod
+    def _row(doc):
+        doc = ensure_summary({k: v for k, v in doc.items() if k not in ('_id', 'id', 'spoolKey')})
+        summary = doc['summary']
+        return (doc.get('timestamp', 0), doc.get('capturedFrom', 'unknown'), summary['count'],
+                summary['meanWeight'], summary['meanLength'], bson.encode(doc))
+
+    @staticmethod
+    def _public(row):
+        doc = bson.decode(row[1])
+        doc['id'] = str(row[0])
+        return doc
+
+    def insert(self, doc):
+        return self.insert_many([doc])[0]
+
+    def insert_many(self, docs):
+        """Ghi cả lô trong 1 transaction (1 lần fsync WAL cho cả lô)"""
+        rows = [self._row(doc) for doc in docs]
+        ids = []
+        with self._lock:
+            with self._db:
+                for row in rows:
+                    cursor = self._db.execute(
+                        "INSERT INTO detections (timestamp, source, count, mean_weight, mean_length, document) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", row)
+                    ids.append(str(cursor.lastrowid))
+        self.changes.changed()
+        return ids
+
+    def insert_spooled(self, docs):
+        """Như MongoDetectionStore.insert_spooled: bỏ qua spool_key đã có, lỗi từng document không chặn cả lô"""
+        results = []
+        with self._lock:
+            with self._db:
+                for doc in docs:
+                    try:
+                        row = self._row(doc)
+                    except Exception as e:
+                        results.append(e)
+                        continue
+                    cursor = self._db.execute(
+                        "INSERT INTO detections (timestamp, source, count, mean_weight, mean_length, document, "
+                        "spool_key) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING", row + (doc['spoolKey'],))
+                    if cursor.rowcount:
+                        results.append(str(cursor.lastrowid))
+                    else:
+                        existing = self._db.execute("SELECT id FROM detections WHERE spool_key = ?",
+                                                    (doc['spoolKey'],)).fetchone()
+                        results.append(str(existing[0]))
+        self.changes.changed()
+        return results
+
+    def list(self, limit=100, cursor=None, source=None, filters=None):
+        where, params = [], []
+        if source:
+            where.append("source = ?")
+            params.append(source)
+        for name, value in (filters or {}).items():
+            if name in SUMMARY_FILTERS:
+                field, operator = SUMMARY_FILTERS[name]
+                where.append(f"{SQL_COLUMNS[field]} {SQL_OPERATORS[operator]} ?")
+                params.append(value)
+        if filters and 'from' in filters:
+            where.append("timestamp >= ?")
+            params.append(filters['from'])
+        if filters and 'to' in filters:
+            where.append("timestamp < ?")
+            params.append(filters['to'])
+        if cursor is not None:
+            timestamp, image_id = cursor
+            where.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params += [timestamp, timestamp, int(image_id)]
+        sql = "SELECT id, document FROM detections"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit]).fetchall()
+        return [self._public(row) for row in rows]
+
+    def get(self, image_id):
+        if not str(image_id).isdigit():
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT id, document FROM detections WHERE id = ?",
+                                   (int(image_id),)).fetchone()
+        return self._public(row) if row is not None else None
+
+    def get_many(self, image_ids):
+        """Nhiều ảnh trong 1 query (id không hợp lệ/không tồn tại bị bỏ qua)"""
+        ids = [int(image_id) for image_id in image_ids if str(image_id).isdigit()]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, document FROM detections WHERE id IN ({placeholders})",
+                                    ids).fetchall()
+        return [self._public(row) for row in rows]
+
+    def delete(self, image_id):
+        if not str(image_id).isdigit():
+            return None
+        with self._lock:
+            with self._db:
+                row = self._db.execute("SELECT id, document FROM detections WHERE id = ?",
+                                       (int(image_id),)).fetchone()
+                if row is not None:
+                    self._db.execute("DELETE FROM detections WHERE id = ?", (row[0],))
+        if row is None:
+            return None
+        self.changes.changed()
+        return self._public(row)
+
+    def delete_many(self, image_ids):
+        """Xoá nhiều ảnh trong 1 transaction, trả về các document đã xoá"""
+        ids = [int(image_id) for image_id in image_ids if str(image_id).isdigit()]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            with self._db:
+                rows = self._db.execute(f"SELECT id, document FROM detections WHERE id IN ({placeholders})",
+                                        ids).fetchall()
+                self._db.execute(f"DELETE FROM detections WHERE id IN ({placeholders})", ids)
+        self.changes.changed()
+        return [self._public(row) for row in rows]
+
+    def oldest(self, limit=100):
+        """Các ảnh cũ nhất, cũ nhất trước"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, document FROM detections ORDER BY timestamp, id LIMIT ?",
+                                    (limit,)).fetchall()
+        return [self._public(row) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+    def backfill_summaries(self, limit=500):
+        """Thêm summary cho tối đa limit document cũ, trả về số document đã cập nhật"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, document FROM detections WHERE count IS NULL LIMIT ?",
+                                    (limit,)).fetchall()
+        updates = []
+        for row_id, document in rows:
+            doc = bson.decode(document)
+            doc['summary'] = summarize_detections(document_detections(doc))
+            summary = doc['summary']
+            updates.append((summary['count'], summary['meanWeight'], summary['meanLength'],
+                            bson.encode(doc), row_id))
+        if updates:
+            with self._lock:
+                with self._db:
+                    self._db.executemany("UPDATE detections SET count = ?, mean_weight = ?, mean_length = ?, "
+                                         "document = ? WHERE id = ?", updates)
+            self.changes.changed()
+        return len(updates)
@@ -0,0 +1,528 @@
+"""
+Pipeline AI dùng chung: load TFLite model, tiền xử lý, inference,
+parse output YOLO, tính chiều dài/khối lượng tôm và vẽ kết quả
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+
+from detection_codec import DetectionList
+from inference_lanes import PriorityLock, parse_lane_weights
+from size_estimator import CalibrationProfile
+
+load_dotenv()
+
+# ==================== AI MODEL SETUP ====================
+MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'models/best-fp16(1).tflite')
+print(f"\nLoading TFLite model from {MODEL_PATH}...")
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+    print("Using tflite_runtime")
+except ImportError:
+    try:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+        print("Using tensorflow.lite")
+    except ImportError:
+        print("⚠️  Warning: No TFLite runtime found! Detection will not work.")
+        Interpreter = None
+
+# Trọng số các làn ưu tiên và thời gian chờ tối đa mong muốn của request từ app
+INFERENCE_LANE_WEIGHTS = parse_lane_weights(os.getenv('INFERENCE_LANE_WEIGHTS', 'interactive=8,live=2,batch=1'))
+INTERACTIVE_LATENCY_TARGET_MS = float(os.getenv('INTERACTIVE_LATENCY_TARGET_MS', '250'))
+
+# Interpreter không thread-safe: mọi lần invoke đi qua lock này, lượt được cấp theo làn ưu tiên
+interpreter_lock = PriorityLock(INFERENCE_LANE_WEIGHTS,
+                                {'interactive': INTERACTIVE_LATENCY_TARGET_MS / 1000})
+
+if Interpreter and os.path.exists(MODEL_PATH):
+    interpreter = Interpreter(model_path=MODEL_PATH)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    input_shape = input_details[0]['shape']
+    INPUT_HEIGHT = input_shape[1]
+    INPUT_WIDTH = input_shape[2]
+    print(f"✅ TFLite model loaded successfully!")
+    print(f"   Input shape: {input_shape}")
+else:
+    print("⚠️  Warning: Model not loaded!")
+    interpreter = None
+    INPUT_HEIGHT = 320
+    INPUT_WIDTH = 320
+
+# ==================== AI FUNCTIONS ====================
+CLASS_NAMES = ['shrimp']
+
+# Hằng số để tính toán kích thước thực tế của tôm
+# Giả định: Camera ở độ cao cố định, FOV cố định
+# Bạn có thể điều chỉnh các hằng số này dựa trên setup thực tế
+PIXEL_TO_CM_RATIO = 0.02  # 1 pixel = 0.02 cm (điều chỉnh theo setup camera của bạn)
+# Công thức tính khối lượng tôm: W = a * L^b (W: gram, L: cm)
+# Dựa trên nghiên cứu tôm thẻ chân trắng (Litopenaeus vannamei)
+LENGTH_WEIGHT_A = 0.0065  # Hệ số a
+LENGTH_WEIGHT_B = 3.1     # Hệ số b (thường từ 2.8 - 3.2)
+
+# Profile mặc định cho camera chưa hiệu chuẩn (xem size_estimator.py, calibration.json)
+DEFAULT_CALIBRATION = CalibrationProfile(cm_per_pixel=PIXEL_TO_CM_RATIO,
+                                         length_weight_a=LENGTH_WEIGHT_A,
+                                         length_weight_b=LENGTH_WEIGHT_B)
+
+def preprocess_image(image_np):
+    """Tiền xử lý ảnh cho TFLite model"""
+    img = cv2.resize(image_np, (INPUT_WIDTH, INPUT_HEIGHT))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    img = np.expand_dims(img, axis=0)
+    return img
+
+def run_inference(image_np):
+    """Chạy inference với TFLite model"""
+    if interpreter is None:
+        return []
+
+    input_data = preprocess_image(image_np)
+
+    # Interpreter không thread-safe: upload và camera loop dùng chung 1 lock (theo làn ưu tiên)
+    with interpreter_lock:
+        interpreter.set_tensor(input_details[0]['index'], input_data)
+        interpreter.invoke()
+
+        outputs = []
+        for output in output_details:
+            outputs.append(interpreter.get_tensor(output['index']))
+
+    return outputs
+
+def decode_yolo_boxes(output, orig_w, orig_h, conf_threshold=0.25, offset=(0, 0)):
+    """
+    Giải mã 1 output YOLO (N x 6+) thành boxes [x1, y1, x2, y2] theo pixel ảnh gốc
+    Args:
+        output: mảng 2D các dự đoán của 1 ảnh (x, y, w, h chuẩn hoá 0-1)
+        orig_w, orig_h: kích thước vùng ảnh đã đưa vào model
+        offset: (x, y) của vùng ảnh trong ảnh gốc (dùng cho tile/ROI)
+    Returns:
+        boxes (int Nx4), scores (float N), class_ids (int N)
+    """
+    output = np.asarray(output)
+    if output.ndim != 2 or output.shape[1] < 6:
+        return np.empty((0, 4), dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    rows = output[output[:, 4] >= conf_threshold]
+    if rows.shape[1] == 6:
+        class_ids = rows[:, 5].astype(np.int64)
+        scores = rows[:, 4]
+    else:
+        class_scores = rows[:, 5:]
+        class_ids = np.argmax(class_scores, axis=1)
+        scores = rows[:, 4] * class_scores[np.arange(len(rows)), class_ids]
+
+    keep = scores >= conf_threshold
+    rows, scores, class_ids = rows[keep], scores[keep], class_ids[keep]
+
+    x, y, w, h = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+    boxes = np.stack([
+        (x - w/2) * orig_w,
+        (y - h/2) * orig_h,
+        (x + w/2) * orig_w,
+        (y + h/2) * orig_h
+    ], axis=1).astype(np.int64)
+    boxes += np.array([offset[0], offset[1], offset[0], offset[1]], dtype=np.int64)
+    return boxes, scores.astype(np.float32), class_ids
+
+def build_detections(boxes, scores, class_ids, conf_threshold=0.25, iou_threshold=0.45,
+                     calibration=None, image_size=None):
+    """
+    Apply NMS trên boxes [x1, y1, x2, y2] và tạo danh sách detections
+    Chiều dài/khối lượng và summary của ảnh tính 1 lần cho cả mảng box giữ lại theo calibration
+    (mặc định DEFAULT_CALIBRATION)
+    image_size: (width, height) ảnh gốc, để quy đổi calibration đo ở độ phân giải khác
+    Returns:
+        DetectionList (summary: count, totalWeight, mean/min/max của ảnh)
+    """
+    detections = []
+    if len(boxes) == 0:
+        return detections
+
+    # NMSBoxes nhận box dạng [x, y, w, h]
+    nms_boxes = [[int(x1), int(y1), int(x2 - x1), int(y2 - y1)] for x1, y1, x2, y2 in boxes]
+    indices = cv2.dnn.NMSBoxes(nms_boxes, [float(s) for s in scores], conf_threshold, iou_threshold)
+    if len(indices) == 0:
+        return detections
+
+    keep = np.asarray(indices).flatten()
+    kept = np.asarray(boxes, dtype=np.int64)[keep]
+    lengths, weights, summary = (calibration or DEFAULT_CALIBRATION).estimate_biomass(kept, image_size)
+    detections = DetectionList(summary=summary)
+
+    for i, (x1, y1, x2, y2), length_cm, weight_gram in zip(keep, kept.tolist(), lengths.tolist(), weights.tolist()):
+        w = x2 - x1
+        h = y2 - y1
+        class_id = int(class_ids[i])
+        detections.append({
+            "className": CLASS_NAMES[class_id] if class_id < len(CLASS_NAMES) else f"class_{class_id}",
+            "confidence": float(scores[i]),
+            "bbox": {
+                "x": float(x1 + w/2),
+                "y": float(y1 + h/2),
+                "width": float(w),
+                "height": float(h)
+            },
+            "length": length_cm,    # Chiều dài (cm)
+            "weight": weight_gram   # Khối lượng (gram)
+        })
+
+    return detections
+
+def parse_yolo_output(outputs, original_shape, conf_threshold=0.25, iou_threshold=0.45, calibration=None):
+    """Parse YOLO TFLite output và apply NMS"""
+    orig_h, orig_w = original_shape[:2]
+
+    if len(outputs) != 1 or len(outputs[0].shape) != 3:
+        return []
+
+    boxes, scores, class_ids = decode_yolo_boxes(outputs[0][0], orig_w, orig_h, conf_threshold)
+    return build_detections(boxes, scores, class_ids, conf_threshold, iou_threshold,
+                            calibration, (orig_w, orig_h))
+
+# ==================== TILED INFERENCE ====================
+# Ảnh điện thoại 12MP bị thu về 320x320 làm tôm nhỏ biến mất.
+# Chế độ tile: cắt ảnh thành các ô chồng lấn cỡ input model, chạy batch,
+# đưa toạ độ về ảnh gốc rồi NMS toàn cục.
+TILED_INFERENCE = os.getenv('TILED_INFERENCE', '0') == '1'
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', '0.2'))
+TILE_MAX_COUNT = int(os.getenv('TILE_MAX_COUNT', '16'))
+TILE_MIN_SCALE = float(os.getenv('TILE_MIN_SCALE', '2.0'))  # chỉ chia tile khi ảnh lớn hơn N lần input
+
+# Số interpreter batch giữ sẵn (mỗi cái 1 arena riêng, ~20 MB với model 320x320 batch 1)
+BATCH_INTERPRETER_CACHE = int(os.getenv('BATCH_INTERPRETER_CACHE', '2'))
+
+
+def interpreter_bytes(interp):
+    """RAM ước lượng của 1 interpreter đã allocate (tổng kích thước các tensor)"""
+    return sum(int(np.prod(t['shape'])) * np.dtype(t['dtype']).itemsize
+               for t in interp.get_tensor_details())
+
+
+class BatchInterpreters:
+    """
+    Interpreter riêng cho từng batch size, resize + allocate 1 lần cho mỗi size (LRU)
+    Số tile/ROI khác nhau giữa các request không làm allocate lại mỗi lần; RAM của các
+    interpreter đang giữ được báo qua on_change (ngân sách bộ nhớ trừ phần này)
+    """
+
+    def __init__(self, max_interpreters, on_change=None):
+        self.max_interpreters = max_interpreters
+        self.on_change = on_change
+        self.supported = True
+        self.allocations = 0
+        self._interpreters = OrderedDict()
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def get(self, batch_size):
+        """Interpreter cho batch_size, None nếu model không hỗ trợ batch (gọi khi giữ interpreter_lock)"""
+        if not self.supported or self.max_interpreters <= 0:
+            return None
+        with self._lock:
+            batch_interp = self._interpreters.get(batch_size)
+            if batch_interp is not None:
+                self._interpreters.move_to_end(batch_size)
+                return batch_interp
+        try:
+            batch_interp = Interpreter(model_path=MODEL_PATH)
+            batch_interp.resize_tensor_input(
+                batch_interp.get_input_details()[0]['index'],
+                [batch_size, INPUT_HEIGHT, INPUT_WIDTH, 3])
+            batch_interp.allocate_tensors()
+        except Exception as e:
+            print(f"[WARN] Batch inference not supported, falling back to per-tile: {e}")
+            self.supported = False
+            return None
+
+        with self._lock:
+            self._interpreters[batch_size] = batch_interp
+            self._bytes[batch_size] = interpreter_bytes(batch_interp)
+            self.allocations += 1
+            while len(self._interpreters) > self.max_interpreters:
+                evicted, _ = self._interpreters.popitem(last=False)
+                del self._bytes[evicted]
+            resident = sum(self._bytes.values())
+        print(f"[INFO] Batch interpreter allocated for {batch_size} inputs "
+              f"({resident / 1e6:.0f} MB resident in {len(self._bytes)} batch interpreters)")
+        if self.on_change is not None:
+            self.on_change(resident)
+        return batch_interp
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(self._bytes.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "supported": self.supported,
+                "batchSizes": list(self._interpreters),
+                "residentBytes": sum(self._bytes.values()),
+                "allocations": self.allocations
+            }
+
+
+batch_interpreters = BatchInterpreters(BATCH_INTERPRETER_CACHE)
+
+def run_inference_batch(images):
+    """
+    Chạy inference cho nhiều ảnh trong 1 lần invoke nếu model cho phép,
+    không thì chạy từng ảnh
+    Returns:
+        list outputs, mỗi phần tử có dạng giống kết quả run_inference
+    """
+    if interpreter is None:
+        return [[] for _ in images]
+
+    batch = np.concatenate([preprocess_image(img) for img in images], axis=0)
+    with interpreter_lock:
+        batch_interp = batch_interpreters.get(len(images))
+        if batch_interp is not None:
+            batch_interp.set_tensor(batch_interp.get_input_details()[0]['index'], batch)
+            batch_interp.invoke()
+            outputs = [batch_interp.get_tensor(o['index']) for o in batch_interp.get_output_details()]
+            return [[out[i:i + 1] for out in outputs] for i in range(len(images))]
+
+    return [run_inference(img) for img in images]
+
+def batch_input_bytes(count):
+    """RAM cho count ảnh đã tiền xử lý (float32) cộng mảng batch ghép từ chúng"""
+    per_image = INPUT_WIDTH * INPUT_HEIGHT * 3 * np.dtype(np.float32).itemsize
+    return per_image * count * (2 if count > 1 else 1)
+
+def _tile_positions(length, tile_size, step):
+    if length <= tile_size:
+        return [0]
+    positions = list(range(0, length - tile_size, step))
+    positions.append(length - tile_size)
+    return positions
+
+def make_tiles(width, height, tile_size, overlap, max_tiles):
+    """
+    Tính các tile vuông chồng lấn phủ toàn ảnh
+    Nếu số tile vượt max_tiles thì tăng kích thước tile (tile sẽ bị thu nhỏ khi vào model)
+    Returns:
+        list (x1, y1, x2, y2)
+    """
+    while True:
+        step = max(1, int(tile_size * (1 - overlap)))
+        xs = _tile_positions(width, tile_size, step)
+        ys = _tile_positions(height, tile_size, step)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        tile_size = int(tile_size * 1.25) + 1
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in ys for x in xs]
+
+def tiled_decode_side(max_tiles=None, overlap=None):
+    """Cạnh dài tối thiểu cần giữ khi decode để các tile vẫn đủ chi tiết"""
+    max_tiles = TILE_MAX_COUNT if max_tiles is None else max_tiles
+    overlap = TILE_OVERLAP if overlap is None else overlap
+    input_size = max(INPUT_WIDTH, INPUT_HEIGHT)
+    needed = input_size * math.sqrt(max_tiles) / max(1e-3, 1 - overlap)
+    return max(DECODE_MAX_SIDE, int(needed))
+
+def tile_regions(width, height, include_full=True, max_tiles=None, overlap=None):
+    """
+    Các vùng (x1, y1, x2, y2) detect_tiled đưa vào model
+    Ảnh nhỏ hơn TILE_MIN_SCALE lần input không chia tile: 1 vùng là cả ảnh
+    """
+    input_size = max(INPUT_WIDTH, INPUT_HEIGHT)
+    if max(width, height) < TILE_MIN_SCALE * input_size:
+        return [(0, 0, width, height)]
+    regions = make_tiles(width, height, input_size,
+                         TILE_OVERLAP if overlap is None else overlap,
+                         TILE_MAX_COUNT if max_tiles is None else max_tiles)
+    if include_full:
+        regions.append((0, 0, width, height))
+    return regions
+
+def detect_tiled(image_np, conf_threshold=0.25, iou_threshold=0.45, include_full=True,
+                 max_tiles=None, overlap=None, scale=1.0, calibration=None):
+    """
+    Detection theo tile cho ảnh độ phân giải cao
+    Args:
+        include_full: chạy thêm 1 lượt toàn ảnh để bắt tôm lớn bị cắt qua nhiều tile
+        max_tiles, overlap: mặc định lấy TILE_MAX_COUNT, TILE_OVERLAP
+        scale: tỉ lệ ảnh gốc / image_np (ảnh decode thu nhỏ), bbox trả về theo ảnh gốc
+        calibration: CalibrationProfile của camera chụp ảnh (mặc định DEFAULT_CALIBRATION)
+    """
+    orig_h, orig_w = image_np.shape[:2]
+    input_size = max(INPUT_WIDTH, INPUT_HEIGHT)
+    if max(orig_w, orig_h) < TILE_MIN_SCALE * input_size:
+        original_shape = (int(round(orig_h * scale)), int(round(orig_w * scale)))
+        return parse_yolo_output(run_inference(image_np), original_shape, conf_threshold, iou_threshold,
+                                 calibration)
+
+    regions = tile_regions(orig_w, orig_h, include_full, max_tiles, overlap)
+    crops = [image_np[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+    results = run_inference_batch(crops)
+
+    all_boxes, all_scores, all_classes = [], [], []
+    for (x1, y1, x2, y2), outputs in zip(regions, results):
+        if len(outputs) != 1 or len(outputs[0].shape) != 3:
+            continue
+        boxes, scores, class_ids = decode_yolo_boxes(
+            outputs[0][0], x2 - x1, y2 - y1, conf_threshold, offset=(x1, y1))
+        all_boxes.append(boxes)
+        all_scores.append(scores)
+        all_classes.append(class_ids)
+
+    if not all_boxes:
+        return []
+
+    boxes = np.concatenate(all_boxes)
+    if scale != 1.0:
+        boxes = (boxes * scale).astype(np.int64)
+    image_size = (int(round(orig_w * scale)), int(round(orig_h * scale)))
+    return build_detections(boxes, np.concatenate(all_scores),
+                            np.concatenate(all_classes), conf_threshold, iou_threshold,
+                            calibration, image_size)
+
+# ==================== IMAGE DECODE ====================
+# Ảnh upload 4000x3000 không cần decode đủ độ phân giải để đưa vào model nhỏ:
+# JPEG hỗ trợ decode trực tiếp ở 1/2, 1/4, 1/8 (DCT scaling) nhanh và ít RAM hơn nhiều.
+DECODE_MAX_SIDE = int(os.getenv('DECODE_MAX_SIDE', '1280'))
+# Giới hạn số pixel theo header ảnh: chặn decompression bomb (file nhỏ, kích thước khai báo khổng lồ)
+# Giới hạn riêng của PIL (Image.MAX_IMAGE_PIXELS) vẫn giữ nguyên cho cả process: header vượt
+# 2 lần giới hạn đó (~179 MP) bị PIL từ chối trước, cũng trả về ImageTooLarge
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', '50000000'))
+
+
+class ImageTooLarge(ValueError):
+    """Ảnh vượt giới hạn pixel cho phép"""
+
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def read_image_size(image_data):
+    """
+    Đọc kích thước (width, height) từ header ảnh, không decode pixel
+    Returns:
+        (width, height) hoặc None nếu không đọc được header
+    Raises:
+        ImageTooLarge nếu PIL từ chối header (DecompressionBombError)
+    """
+    try:
+        with Image.open(BytesIO(image_data)) as header:
+            return header.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from None
+    except Exception:
+        return None
+
+def check_image_size(image_data, max_pixels=None):
+    """
+    Kiểm tra kích thước ảnh từ header trước khi decode
+    Returns:
+        (width, height) hoặc None nếu không đọc được header
+    Raises:
+        ImageTooLarge nếu ảnh vượt max_pixels
+    """
+    max_pixels = max_pixels or MAX_IMAGE_PIXELS
+    size = read_image_size(image_data)
+    if size is not None and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image {size[0]}x{size[1]} exceeds {max_pixels} pixels")
+    return size
+
+def reduction_factor(size, target_side=None):
+    """Mức decode giảm (1, 2, 4, 8) lớn nhất mà cạnh dài vẫn >= target_side"""
+    target_side = target_side or DECODE_MAX_SIDE
+    factor = 1
+    if size is not None:
+        while factor < 8 and max(size) / (factor * 2) >= target_side:
+            factor *= 2
+    return factor
+
+def decode_image(image_data, target_side=None):
+    """
+    Decode ảnh (BGR) ở mức giảm lớn nhất mà cạnh dài vẫn >= target_side
+    Args:
+        image_data: bytes ảnh (JPEG/PNG...)
+        target_side: cạnh dài tối thiểu cần giữ (mặc định DECODE_MAX_SIDE)
+    Returns:
+        image_bgr, original_shape (h, w, 3) của ảnh gốc
+    """
+    size = check_image_size(image_data)
+    factor = reduction_factor(size, target_side)
+
+    # Giữ nguyên hướng pixel như trước (không xoay theo EXIF) để bbox khớp ảnh gốc
+    flags = _REDUCED_DECODE_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION
+    image_bgr = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags)
+    if image_bgr is None:
+        raise ValueError("Cannot decode image data")
+    if size is None and image_bgr.shape[0] * image_bgr.shape[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image {image_bgr.shape[1]}x{image_bgr.shape[0]} exceeds {MAX_IMAGE_PIXELS} pixels")
+
+    if size is None:
+        orig_h, orig_w = image_bgr.shape[:2]
+    else:
+        orig_w, orig_h = size
+    return image_bgr, (orig_h, orig_w, 3)
+
+def draw_detections(image_np, detections, scale=1.0, in_place=False):
+    """
+    Vẽ bounding boxes lên ảnh
+    Args:
+        scale: tỉ lệ ảnh gốc / ảnh đang vẽ (bbox luôn theo toạ độ ảnh gốc)
+        in_place: vẽ thẳng lên image_np (không copy) khi không cần ảnh gốc nữa
+    """
+    img = image_np if in_place else image_np.copy()
+
+    for det in detections:
+        bbox = det['bbox']
+        x = int(bbox['x'] / scale)
+        y = int(bbox['y'] / scale)
+        w = int(bbox['width'] / scale)
+        h = int(bbox['height'] / scale)
+
+        x1 = int(x - w/2)
+        y1 = int(y - h/2)
+        x2 = int(x + w/2)
+        y2 = int(y + h/2)
+
+        color = (0, 255, 0)
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+
+        # Label với confidence, length và weight
+        conf = det['confidence']
+        length = det.get('length', 0)
+        weight = det.get('weight', 0)
+        label = f"{det['className']} {conf:.2f}"
+        label2 = f"L:{length}cm W:{weight}g"
+
+        # Vẽ background cho label chính
+        label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+        cv2.rectangle(img, (x1, y1 - label_size[1] - 10),
+                     (x1 + label_size[0], y1), color, -1)
+        cv2.putText(img, label, (x1, y1 - 5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+        # Vẽ background cho label length/weight
+        label2_size, _ = cv2.getTextSize(label2, cv2.FONT_HERSHEY_SIMPLEX, 0.4, 1)
+        cv2.rectangle(img, (x1, y2),
+                     (x1 + label2_size[0] + 4, y2 + label2_size[1] + 8),
+                     color, -1)
+        cv2.putText(img, label2, (x1 + 2, y2 + label2_size[1] + 4),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+
+    return img
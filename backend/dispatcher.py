@@ -0,0 +1,310 @@
+"""
+Dispatcher phân tải detection cho nhiều Pi worker
+Nhận /api/detect-shrimp (cùng request/response với app_complete) và chuyển tới worker
+ít tải nhất, dựa trên số request đang xử lý và latency mà worker báo qua /health.
+- Mỗi worker có connection pool riêng (requests.Session)
+- Thử lại worker khác khi không kết nối được hoặc worker trả 503 (chưa xử lý ảnh)
+- Drain: ngừng gửi request mới tới 1 worker để bảo trì, request đang chạy vẫn hoàn tất
+
+Chạy: DISPATCHER_WORKERS=http://pi-ao1:8000,http://pi-ao2:8000 python dispatcher.py
+Thử trên 1 máy: python dispatcher.py --local-workers 3
+"""
+import argparse
+import os
+import threading
+import time
+from functools import wraps
+
+import requests
+from dotenv import load_dotenv
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+DISPATCHER_WORKERS = os.getenv('DISPATCHER_WORKERS', '')
+DISPATCHER_PORT = int(os.getenv('DISPATCHER_PORT', '8080'))
+HEALTH_INTERVAL_SECONDS = float(os.getenv('DISPATCHER_HEALTH_INTERVAL', '2'))
+DISPATCH_RETRIES = int(os.getenv('DISPATCHER_RETRIES', '2'))
+WORKER_POOL_SIZE = int(os.getenv('DISPATCHER_POOL_SIZE', '8'))
+CONNECT_TIMEOUT = 3
+READ_TIMEOUT = 120
+
+# Header của request/response được chuyển tiếp nguyên vẹn
+FORWARD_REQUEST_HEADERS = ('Content-Type', 'Accept', 'Accept-Encoding')
+FORWARD_RESPONSE_HEADERS = ('Content-Type', 'Content-Encoding', 'Vary', 'Retry-After')
+
+
+class Worker:
+    """Trạng thái 1 worker backend"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WORKER_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.healthy = False
+        self.draining = False
+        self.in_flight = 0          # request dispatcher đang chờ worker này
+        self.remote_in_flight = 0   # request worker báo đang xử lý (kể cả từ nguồn khác)
+        self.remote_latency_ms = 0.0
+        self.latency_ms = 0.0       # EWMA latency dispatcher đo được
+        self.dispatched = 0
+        self.failures = 0
+        self.last_error = None
+
+    def score(self):
+        """Thời gian chờ ước tính nếu gửi thêm 1 request (càng nhỏ càng tốt)"""
+        latency = self.latency_ms or self.remote_latency_ms or 1.0
+        return (max(self.in_flight, self.remote_in_flight) + 1) * latency
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "inFlight": self.in_flight,
+            "remoteInFlight": self.remote_in_flight,
+            "latencyMs": round(self.latency_ms, 1),
+            "remoteLatencyMs": round(self.remote_latency_ms, 1),
+            "dispatched": self.dispatched,
+            "failures": self.failures,
+            "lastError": self.last_error
+        }
+
+
+class WorkerPool:
+    """Danh sách worker + thread poll /health"""
+
+    def __init__(self, urls, health_interval=HEALTH_INTERVAL_SECONDS):
+        self.workers = [Worker(url) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.poll_health()
+        self._thread = threading.Thread(target=self._run, name="dispatcher-health", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.poll_health()
+
+    def poll_health(self):
+        for worker in self.workers:
+            try:
+                health = worker.session.get(f"{worker.url}/health", timeout=CONNECT_TIMEOUT).json()
+                load = health.get('detection', {})
+                memory = health.get('memory', {})
+                with self._lock:
+                    worker.healthy = bool(health.get('model_loaded', True))
+                    worker.remote_in_flight = load.get('inFlight', 0) + memory.get('waiting', 0)
+                    worker.remote_latency_ms = load.get('avgLatencyMs', 0.0)
+            except (requests.RequestException, ValueError) as e:
+                with self._lock:
+                    worker.healthy = False
+                    worker.last_error = str(e)
+
+    def find(self, url):
+        url = url.rstrip('/')
+        for worker in self.workers:
+            if worker.url == url:
+                return worker
+        return None
+
+    def acquire(self, exclude=()):
+        """Chọn worker khoẻ, không drain, có score nhỏ nhất và giữ chỗ cho 1 request"""
+        with self._lock:
+            candidates = [w for w in self.workers
+                          if w.healthy and not w.draining and w not in exclude]
+            if not candidates:
+                return None
+            worker = min(candidates, key=Worker.score)
+            worker.in_flight += 1
+            worker.dispatched += 1
+            return worker
+
+    def release(self, worker, latency_ms=None, error=None):
+        with self._lock:
+            worker.in_flight -= 1
+            if latency_ms is not None:
+                worker.latency_ms = latency_ms if not worker.latency_ms \
+                    else worker.latency_ms + 0.2 * (latency_ms - worker.latency_ms)
+            if error is not None:
+                worker.failures += 1
+                worker.last_error = error
+
+    def mark_down(self, worker):
+        """Không gửi thêm tới worker cho tới lần poll /health kế tiếp thành công"""
+        with self._lock:
+            worker.healthy = False
+
+    def stats(self):
+        with self._lock:
+            return [worker.to_dict() for worker in self.workers]
+
+
+# ==================== DISPATCHER APP ====================
+app = Flask(__name__)
+CORS(app)
+
+USERNAME = os.getenv('CAMERA_USERNAME', 'admin')
+PASSWORD = os.getenv('CAMERA_PASSWORD', '123456')
+pool = None
+
+def requires_auth(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        auth = request.authorization
+        if not auth or auth.username != USERNAME or auth.password != PASSWORD:
+            return Response(
+                'Authentication required', 401,
+                {'WWW-Authenticate': 'Basic realm="Login Required"'})
+        return f(*args, **kwargs)
+    return decorated
+
+def forward(worker, body, headers):
+    response = worker.session.post(f"{worker.url}/api/detect-shrimp", data=body, headers=headers,
+                                   timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    response_headers = {name: response.headers[name]
+                        for name in FORWARD_RESPONSE_HEADERS if name in response.headers}
+    response_headers['X-Worker'] = worker.url
+    return response.status_code, response.content, response_headers
+
+@app.route('/api/detect-shrimp', methods=['POST'])
+def detect_shrimp():
+    """Chuyển request detection tới worker ít tải nhất"""
+    body = request.get_data(cache=False)
+    headers = {name: request.headers[name] for name in FORWARD_REQUEST_HEADERS if name in request.headers}
+
+    tried = []
+    for attempt in range(DISPATCH_RETRIES + 1):
+        worker = pool.acquire(exclude=tried)
+        if worker is None:
+            break
+        tried.append(worker)
+
+        started = time.time()
+        try:
+            status, content, response_headers = forward(worker, body, headers)
+        except requests.ConnectionError as e:
+            # Không kết nối được: worker chưa nhận ảnh, thử worker khác
+            pool.release(worker, error=str(e))
+            pool.mark_down(worker)
+            print(f"[ERROR] Worker {worker.url} unreachable: {str(e)}")
+            continue
+        except requests.RequestException as e:
+            # Timeout khi đang đọc response: worker có thể đã xử lý/lưu ảnh, không gửi lại
+            pool.release(worker, error=str(e))
+            print(f"[ERROR] Worker {worker.url} failed: {str(e)}")
+            return jsonify({
+                "success": False,
+                "message": f"Worker error: {str(e)}"
+            }), 504
+
+        pool.release(worker, latency_ms=(time.time() - started) * 1000,
+                     error=f"HTTP {status}" if status >= 500 else None)
+        if status == 503 and attempt < DISPATCH_RETRIES:
+            # Worker quá tải (hết ngân sách RAM), ảnh chưa được xử lý
+            print(f"[INFO] Worker {worker.url} busy, retrying on another worker")
+            continue
+        return Response(content, status=status, headers=response_headers)
+
+    return jsonify({
+        "success": False,
+        "message": "No worker available"
+    }), 503, {"Retry-After": "2"}
+
+@app.route('/dispatcher/workers', methods=['GET'])
+def list_workers():
+    return jsonify(pool.stats())
+
+@app.route('/dispatcher/workers/drain', methods=['POST', 'DELETE'])
+@requires_auth
+def drain_worker():
+    """
+    POST: ngừng gửi request mới tới worker (request đang chạy vẫn hoàn tất)
+    DELETE: nhận request trở lại
+    Query: url của worker
+    """
+    worker = pool.find(request.args.get('url', ''))
+    if worker is None:
+        return jsonify({
+            "success": False,
+            "message": "Worker not found"
+        }), 404
+
+    worker.draining = request.method == 'POST'
+    print(f"[INFO] Worker {worker.url} {'draining' if worker.draining else 'resumed'}")
+    return jsonify({
+        "success": True,
+        "worker": worker.to_dict(),
+        "drained": worker.draining and worker.in_flight == 0
+    })
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    workers = pool.stats()
+    available = sum(1 for w in workers if w["healthy"] and not w["draining"])
+    return jsonify({
+        "status": "healthy" if available else "degraded",
+        "role": "dispatcher",
+        "availableWorkers": available,
+        "workers": workers
+    })
+
+
+def start_local_workers(count, base_port):
+    """Chạy count backend offline trên máy này (MongoDB/Cloudinary giả, xem load_test.py)"""
+    from load_test import start_local_backend
+
+    processes, urls = [], []
+    for i in range(count):
+        process, url, log_path = start_local_backend(base_port + i, 'sqlite', 0.05)
+        print(f"✅ Local worker {url} (log: {log_path})")
+        processes.append(process)
+        urls.append(url)
+    return processes, urls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dispatcher phân tải detection cho nhiều worker")
+    parser.add_argument("--workers", default=DISPATCHER_WORKERS, help="Danh sách URL worker, cách nhau dấu phẩy")
+    parser.add_argument("--port", type=int, default=DISPATCHER_PORT)
+    parser.add_argument("--local-workers", type=int, default=0, help="Tự chạy N worker offline trên máy này")
+    parser.add_argument("--local-base-port", type=int, default=8101)
+    args = parser.parse_args()
+
+    urls = [url for url in args.workers.split(',') if url]
+    processes = []
+    if args.local_workers:
+        processes, local_urls = start_local_workers(args.local_workers, args.local_base_port)
+        urls += local_urls
+    if not urls:
+        parser.error("Cần ít nhất 1 worker (--workers hoặc DISPATCHER_WORKERS)")
+
+    pool = WorkerPool(urls).start()
+
+    print("\n" + "="*50)
+    print("🦐 Shrimp Detection Dispatcher Starting...")
+    print("="*50)
+    for worker in pool.workers:
+        print(f"  - {worker.url}: {'✅ Healthy' if worker.healthy else '❌ Down'}")
+    print("\nEndpoints:")
+    print("  - Detection API: /api/detect-shrimp")
+    print("  - Workers: /dispatcher/workers")
+    print("  - Drain worker: /dispatcher/workers/drain?url=")
+    print("  - Health Check: /health")
+    print("="*50 + "\n")
+
+    try:
+        app.run(host='0.0.0.0', port=args.port, debug=False, threaded=True)
+    finally:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,143 @@
+"""
+Hub phát sự kiện trong tiến trình (in-process broadcast) cho Server-Sent Events
+Mỗi client có buffer giới hạn riêng: client chậm chỉ mất event cũ của chính nó,
+producer (camera loop / upload) không bao giờ bị chặn.
+AsyncSubscription dùng cho server asyncio (app_async.py): producer chạy trên thread khác
+đẩy event vào event loop bằng call_soon_threadsafe, client chờ event mà không giữ thread nào.
+"""
+import asyncio
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+    """Một client đang nghe hub, với buffer giới hạn riêng"""
+
+    def __init__(self, hub, maxsize):
+        self._hub = hub
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, event):
+        """Đẩy event không chặn; buffer đầy thì bỏ event cũ nhất"""
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Lấy event tiếp theo, trả về None nếu hết timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class AsyncSubscription:
+    """Subscription cho client trên event loop asyncio, cùng cơ chế bỏ event cũ nhất khi đầy"""
+
+    def __init__(self, hub, maxsize, loop):
+        self._hub = hub
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, event):
+        """Gọi được từ mọi thread; event được đưa vào queue trên thread của event loop"""
+        try:
+            self._loop.call_soon_threadsafe(self._push, event)
+        except RuntimeError:
+            # Event loop đã đóng (server đang tắt)
+            pass
+
+    def _push(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except asyncio.QueueFull:
+                self._queue.get_nowait()
+                self.dropped += 1
+
+    async def get(self, timeout=None):
+        """Chờ event tiếp theo, trả về None nếu hết timeout"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class EventHub:
+    """Broadcast event tới mọi subscription, giữ lại vài event gần nhất để replay"""
+
+    def __init__(self, client_buffer_size=32, history_size=50):
+        self.client_buffer_size = client_buffer_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._next_id = 1
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, last_event_id=None):
+        """
+        Đăng ký client mới
+        Args:
+            last_event_id: id event cuối client đã nhận (header Last-Event-ID),
+                           các event sau id này còn trong history sẽ được gửi lại
+        """
+        return self._add(Subscription(self, self.client_buffer_size), last_event_id)
+
+    def subscribe_async(self, last_event_id=None):
+        """Như subscribe nhưng cho client asyncio (gọi trong event loop đang chạy)"""
+        return self._add(AsyncSubscription(self, self.client_buffer_size, asyncio.get_running_loop()),
+                         last_event_id)
+
+    def _add(self, subscription, last_event_id):
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event['id'] > last_event_id:
+                        subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.discard(subscription)
+                self.dropped += subscription.dropped
+
+    def publish(self, event_type, data):
+        """Phát event tới mọi client, không bao giờ chặn producer"""
+        with self._lock:
+            event = {"id": self._next_id, "event": event_type, "data": data}
+            self._next_id += 1
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self.published += 1
+
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def stats(self):
+        with self._lock:
+            return {
+                "clients": len(self._subscribers),
+                "published": self.published,
+                "dropped": self.dropped + sum(s.dropped for s in self._subscribers)
+            }
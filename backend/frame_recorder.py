@@ -0,0 +1,278 @@
+"""
+Ghi lại frame camera gần đây ra đĩa để phân tích lại (VD: chạy model mới trên đoạn bị nhận sai)
+Mỗi segment gồm 2 file:
+- seg-<start_ms>.jpgs: các JPEG nối liền nhau
+- seg-<start_ms>.idx: bản ghi cố định 20 byte (timestamp ms, offset, length) cho từng frame
+Tổng dung lượng bị giới hạn: trước mỗi frame, nếu ghi thêm sẽ vượt max_bytes thì xoá segment
+cũ nhất (segment đang ghi cũng bị xoay sang segment mới khi chỉ còn nó).
+RecordingReader đọc theo khoảng thời gian bằng mmap, không copy dữ liệu JPEG.
+"""
+import mmap
+import os
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from mjpeg_stream import encode_frame
+
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('offset', '<u8'), ('length', '<u4')])
+SEGMENT_PATTERN = re.compile(r'^seg-(\d+)\.jpgs$')
+
+
+def segment_paths(directory, start_ms):
+    base = os.path.join(directory, f"seg-{start_ms}")
+    return base + '.jpgs', base + '.idx'
+
+
+def list_segments(directory):
+    """Danh sách start_ms của các segment, cũ nhất trước"""
+    if not os.path.isdir(directory):
+        return []
+    starts = [int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(directory)) if m]
+    return sorted(starts)
+
+
+class FrameRecorder:
+    """Thread ghi frame từ CameraCapture vào các segment JPEG xoay vòng"""
+
+    def __init__(self, capture, directory, fps=2.0, segment_seconds=60, max_bytes=2 * 1024 ** 3,
+                 quality=80, width=None, encode=None):
+        """
+        Args:
+            encode: hàm(seq, frame) -> bytes JPEG; truyền SharedFrameEncoder.get để dùng chung
+                    JPEG với stream khi cùng quality/width (mặc định encode riêng)
+        """
+        self.capture = capture
+        self.directory = directory
+        self.interval = 1.0 / fps
+        self.segment_ms = int(segment_seconds * 1000)
+        self.max_bytes = max_bytes
+        self.encode = encode or (lambda seq, frame: encode_frame(frame, quality, width))
+
+        self.frames = 0
+        self.bytes_written = 0
+        self.evicted = 0
+        # start_ms -> dung lượng (data + index) của các segment trên đĩa, cũ nhất trước
+        self._sizes = None
+        self._segment_start = None
+        self._data = None
+        self._index = None
+        self._offset = 0
+        self._running = False
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        self._running = True
+        name = getattr(self.capture, 'name', None)
+        self._thread = threading.Thread(target=self._run, name=f"frame-recorder-{name}" if name else "frame-recorder",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self._close_segment()
+
+    def _run(self):
+        seq = -1
+        next_time = time.time()
+        while self._running:
+            next_seq, frame, timestamp = self.capture.wait_for_frame(seq, timeout=1.0)
+            # Camera đứng: hết timeout vẫn nhận lại frame cũ, không ghi trùng vào buffer
+            if frame is None or next_seq == seq:
+                continue
+            seq = next_seq
+            try:
+                jpeg = self.encode(seq, frame)
+                if jpeg is not None:
+                    self.write(jpeg, int(timestamp * 1000))
+            except OSError as e:
+                print(f"[ERROR] Recorder write failed: {str(e)}")
+
+            next_time += self.interval
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.time()
+
+    def write(self, jpeg, timestamp_ms):
+        """Ghi 1 frame (data trước, index sau để reader không đọc phải frame dở)"""
+        size = len(jpeg) + INDEX_DTYPE.itemsize
+        if self._segment_start is None or timestamp_ms - self._segment_start >= self.segment_ms:
+            self._rotate(timestamp_ms)
+        elif (len(self._sizes) == 1 and self._offset and timestamp_ms > self._segment_start
+              and self._sizes[self._segment_start] + size > self.max_bytes):
+            # Chỉ còn segment đang ghi mà đã đầy: sang segment mới để xoá được segment này
+            self._rotate(timestamp_ms)
+        self._evict(size)
+
+        self._data.write(jpeg)
+        self._data.flush()
+        record = np.array([(timestamp_ms, self._offset, len(jpeg))], dtype=INDEX_DTYPE)
+        self._index.write(record.tobytes())
+        self._index.flush()
+
+        self._offset += len(jpeg)
+        self._sizes[self._segment_start] += size
+        self.frames += 1
+        self.bytes_written += size
+
+    def _close_segment(self):
+        for f in (self._data, self._index):
+            if f is not None:
+                f.close()
+        self._data = self._index = None
+
+    @staticmethod
+    def _segment_size(directory, start):
+        return sum(os.path.getsize(p) for p in segment_paths(directory, start) if os.path.exists(p))
+
+    def _rotate(self, timestamp_ms):
+        self._close_segment()
+        if self._sizes is None:
+            # Lần đầu: tính cả segment của lần chạy trước
+            self._sizes = {start: self._segment_size(self.directory, start)
+                           for start in list_segments(self.directory)}
+        self._segment_start = timestamp_ms
+        data_path, index_path = segment_paths(self.directory, timestamp_ms)
+        self._data = open(data_path, 'ab')
+        self._index = open(index_path, 'ab')
+        self._offset = self._data.tell()
+        self._sizes[timestamp_ms] = self._segment_size(self.directory, timestamp_ms)
+
+    def _evict(self, incoming=0):
+        """
+        Xoá segment cũ nhất tới khi tổng dung lượng cộng incoming byte sắp ghi <= max_bytes
+        (không xoá segment đang ghi)
+        """
+        total = sum(self._sizes.values()) + incoming
+        for start in list(self._sizes):
+            if total <= self.max_bytes or start == self._segment_start:
+                break
+            for path in segment_paths(self.directory, start):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= self._sizes.pop(start)
+            self.evicted += 1
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "bytesWritten": self.bytes_written,
+            "evictedSegments": self.evicted,
+            "segments": len(list_segments(self.directory)),
+            "maxBytes": self.max_bytes
+        }
+
+
+class RecordingReader:
+    """Đọc frame đã ghi theo khoảng thời gian (mmap, không copy JPEG)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _load_segment(self, start_ms):
+        data_path, index_path = segment_paths(self.directory, start_ms)
+        try:
+            with open(index_path, 'rb') as f:
+                index_bytes = f.read()
+            data_file = open(data_path, 'rb')
+        except FileNotFoundError:
+            # Segment vừa bị xoá bởi recorder
+            return None, None
+        with data_file:
+            size = os.fstat(data_file.fileno()).st_size
+            if size == 0:
+                return None, None
+            data = mmap.mmap(data_file.fileno(), size, access=mmap.ACCESS_READ)
+
+        count = len(index_bytes) // INDEX_DTYPE.itemsize
+        index = np.frombuffer(index_bytes[:count * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        # Chỉ giữ frame đã ghi đủ trong phần data được map
+        index = index[index['offset'] + index['length'] <= size]
+        return index, data
+
+    def segments(self):
+        """Thông tin các segment: thời gian đầu/cuối, số frame, dung lượng"""
+        result = []
+        for start in list_segments(self.directory):
+            data_path, index_path = segment_paths(self.directory, start)
+            try:
+                with open(index_path, 'rb') as f:
+                    index_bytes = f.read()
+                size = os.path.getsize(data_path)
+            except FileNotFoundError:
+                continue
+            count = len(index_bytes) // INDEX_DTYPE.itemsize
+            index = np.frombuffer(index_bytes[:count * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+            result.append({
+                "start": int(index['timestamp'][0]) if len(index) else start,
+                "end": int(index['timestamp'][-1]) if len(index) else start,
+                "frames": len(index),
+                "bytes": size + len(index) * INDEX_DTYPE.itemsize
+            })
+        return result
+
+    def frames(self, start_ms, end_ms):
+        """
+        Các frame có timestamp trong [start_ms, end_ms)
+        Yields:
+            (timestamp_ms, memoryview JPEG); memoryview chỉ hợp lệ tới frame kế tiếp
+            của segment khác, copy bằng bytes() nếu cần giữ lâu
+        """
+        starts = list_segments(self.directory)
+        for i, segment_start in enumerate(starts):
+            segment_end = starts[i + 1] if i + 1 < len(starts) else None
+            if segment_start >= end_ms or (segment_end is not None and segment_end <= start_ms):
+                continue
+            index, data = self._load_segment(segment_start)
+            if index is None:
+                continue
+            view = memoryview(data)
+            try:
+                timestamps = index['timestamp']
+                first = np.searchsorted(timestamps, start_ms, side='left')
+                last = np.searchsorted(timestamps, end_ms, side='left')
+                for timestamp, offset, length in index[first:last].tolist():
+                    yield timestamp, view[offset:offset + length]
+            finally:
+                view.release()
+                try:
+                    data.close()
+                except BufferError:
+                    # Caller còn giữ memoryview: mmap được đóng khi view bị thu hồi
+                    pass
+
+    def decoded_frames(self, start_ms, end_ms, step=1):
+        """Như frames() nhưng decode sẵn ra BGR, lấy 1 frame mỗi step frame"""
+        for i, (timestamp, jpeg) in enumerate(self.frames(start_ms, end_ms)):
+            if i % step:
+                continue
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield timestamp, frame
+
+    def frame_at(self, timestamp_ms):
+        """JPEG (bytes) của frame gần nhất tại hoặc trước timestamp_ms"""
+        for start in reversed(list_segments(self.directory)):
+            if start > timestamp_ms:
+                continue
+            index, data = self._load_segment(start)
+            if index is None or not len(index):
+                continue
+            try:
+                position = np.searchsorted(index['timestamp'], timestamp_ms, side='right') - 1
+                if position < 0:
+                    continue
+                timestamp, offset, length = index[position].tolist()
+                return timestamp, data[offset:offset + length]
+            finally:
+                data.close()
+        return None
@@ -0,0 +1,177 @@
+"""
+Làn ưu tiên cho interpreter dùng chung: interactive (app bấm detect), live (camera), batch (phân tích lại)
+PriorityLock thay cho threading.Lock quanh mỗi lần invoke: khi lock được trả (ranh giới frame/tile),
+lượt kế tiếp được cấp theo weighted fair queuing giữa các làn đang chờ, nên 1 request interactive
+chỉ phải chờ tối đa frame đang chạy dở chứ không xếp sau hàng chục frame nền.
+Làn interactive có latency target: chờ quá target thì được cấp lượt ngay, bỏ qua tỉ lệ chia.
+
+Làn của thread hiện tại đặt bằng:
+    with inference_lane('interactive'):
+        detections = detect_frame(frame)
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+LANES = ('interactive', 'live', 'batch')
+DEFAULT_LANE = 'batch'
+
+_current_lane = contextvars.ContextVar('inference_lane', default=DEFAULT_LANE)
+
+
+def parse_lane_weights(value):
+    """"interactive=8,live=2,batch=1" -> dict (làn không có trong chuỗi giữ trọng số 1)"""
+    weights = dict.fromkeys(LANES, 1.0)
+    for item in (part.strip() for part in value.split(',')):
+        if not item:
+            continue
+        lane, _, weight = item.partition('=')
+        if lane not in weights:
+            raise ValueError(f"Unknown inference lane: {lane}")
+        weights[lane] = max(float(weight), 0.01)
+    return weights
+
+
+def current_lane():
+    return _current_lane.get()
+
+
+@contextmanager
+def inference_lane(lane):
+    """Đặt làn ưu tiên cho các lần inference trong khối with (thread/context hiện tại)"""
+    if lane not in LANES:
+        raise ValueError(f"Unknown inference lane: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+class _LaneStats:
+    def __init__(self, window=512):
+        self.acquired = 0
+        self.target_misses = 0
+        self.wait_total = 0.0
+        self.service_total = 0.0
+        self.waits = deque(maxlen=window)
+        self.services = deque(maxlen=window)
+
+    def to_dict(self, waiting):
+        def percentile(values, q):
+            return round(float(np.percentile(values, q)) * 1000, 1) if values else 0.0
+        waits, services = list(self.waits), list(self.services)
+        return {
+            "acquired": self.acquired,
+            "waiting": waiting,
+            "targetMisses": self.target_misses,
+            "avgWaitMs": round(self.wait_total / self.acquired * 1000, 1) if self.acquired else 0.0,
+            "p95WaitMs": percentile(waits, 95),
+            "maxWaitMs": round(max(waits) * 1000, 1) if waits else 0.0,
+            "avgServiceMs": round(self.service_total / self.acquired * 1000, 1) if self.acquired else 0.0,
+            "p95ServiceMs": percentile(services, 95)
+        }
+
+
+class PriorityLock:
+    """
+    Lock độc quyền interpreter, cấp lượt theo làn ưu tiên
+    Mỗi làn có virtual time tăng thêm service_time / weight sau mỗi lượt; lượt kế tiếp thuộc
+    làn đang chờ có virtual time nhỏ nhất. Làn vừa có request mới không được dồn phần
+    chưa dùng lúc rảnh (virtual time được kéo lên mức hiện tại).
+    """
+
+    def __init__(self, weights=None, latency_targets=None):
+        """
+        Args:
+            weights: dict làn -> trọng số (mặc định bằng nhau)
+            latency_targets: dict làn -> số giây chờ tối đa trước khi được ưu tiên tuyệt đối
+        """
+        self.weights = weights or dict.fromkeys(LANES, 1.0)
+        self.latency_targets = latency_targets or {}
+        self._cond = threading.Condition()
+        self._queues = {lane: deque() for lane in LANES}
+        self._vtime = dict.fromkeys(LANES, 0.0)
+        self._virtual_now = 0.0
+        self._owner = None
+        self._owner_lane = None
+        self._granted_at = 0.0
+        self._stats = {lane: _LaneStats() for lane in LANES}
+
+    def _select(self, now):
+        """Waiter được cấp lượt kế tiếp (gọi khi giữ _cond)"""
+        waiting = [lane for lane in LANES if self._queues[lane]]
+        if not waiting:
+            return None
+        overdue = [lane for lane in waiting if lane in self.latency_targets
+                   and now - self._queues[lane][0][1] >= self.latency_targets[lane]]
+        if overdue:
+            lane = min(overdue, key=lambda l: self._queues[l][0][1] + self.latency_targets[l])
+        else:
+            lane = min(waiting, key=lambda l: self._vtime[l])
+        return self._queues[lane][0][0]
+
+    def acquire(self, lane=None):
+        lane = lane or current_lane()
+        waiter = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            if not self._queues[lane] and self._owner_lane != lane:
+                # Làn vừa hoạt động trở lại
+                self._vtime[lane] = max(self._vtime[lane], self._virtual_now)
+            self._queues[lane].append((waiter, enqueued))
+            if self._owner is None:
+                self._owner = self._select(enqueued)
+                if self._owner is not waiter:
+                    self._cond.notify_all()
+            self._cond.wait_for(lambda: self._owner is waiter)
+
+            self._queues[lane].popleft()
+            self._owner_lane = lane
+            self._virtual_now = self._vtime[lane]
+            self._granted_at = time.monotonic()
+
+            wait = self._granted_at - enqueued
+            stats = self._stats[lane]
+            stats.acquired += 1
+            stats.wait_total += wait
+            stats.waits.append(wait)
+            target = self.latency_targets.get(lane)
+            if target is not None and wait > target:
+                stats.target_misses += 1
+
+    def release(self):
+        with self._cond:
+            lane = self._owner_lane
+            service = time.monotonic() - self._granted_at
+            stats = self._stats[lane]
+            stats.service_total += service
+            stats.services.append(service)
+            self._vtime[lane] += service / self.weights.get(lane, 1.0)
+
+            self._owner_lane = None
+            self._owner = self._select(time.monotonic())
+            if self._owner is not None:
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def stats(self):
+        with self._cond:
+            result = {lane: stats.to_dict(len(self._queues[lane]))
+                      for lane, stats in self._stats.items()}
+        for lane, info in result.items():
+            info["weight"] = self.weights.get(lane, 1.0)
+            if lane in self.latency_targets:
+                info["latencyTargetMs"] = round(self.latency_targets[lane] * 1000, 1)
+        return result
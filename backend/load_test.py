@@ -0,0 +1,523 @@
+"""
+Load test cho backend: replay ảnh vào /api/detect-shrimp và các endpoint gallery
+- Closed-loop: --concurrency N client gửi liên tục
+- Open-loop: --rate R request/giây theo phân phối Poisson (latency tính từ thời điểm
+  request lẽ ra được gửi, không bị che khi server chậm)
+Báo cáo throughput, p50/p95/p99 và tỉ lệ lỗi theo từng endpoint.
+Mix "batch" gửi detection ở làn ưu tiên thấp, VD --mix detect=1,batch=4 để xem
+request interactive có bị kẹt sau detection nền không.
+Client chậm chạy song song với workload để so sánh server threaded (app_complete) và asyncio
+(app_async, --server async):
+- --slow-clients N: N điện thoại mạng yếu upload ảnh với tốc độ --slow-rate byte/giây
+- --sse-clients N: N client giữ kết nối /api/events
+Với --local, báo cáo thêm RSS và số thread của process server.
+
+Với --local, script tự chạy backend ở process con, dùng MongoDB giả (mongomock,
+hoặc SQLite nếu không có mongomock) và Cloudinary giả (ghi file tạm), không cần mạng.
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+import requests
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png')
+DEFAULT_MIX = "detect=1,gallery=3,detail=1"
+
+
+# ==================== OFFLINE SERVER ====================
+def serve_offline(port, store, upload_latency, workdir, server='threaded'):
+    """Chạy app_complete (hoặc app_async) với MongoDB/Cloudinary giả (gọi trong process con)"""
+    os.environ['SPOOL_DIR'] = os.path.join(workdir, 'spool')
+    os.environ.setdefault('LIVE_DETECTION', '0')
+    if store == 'sqlite':
+        os.environ['DETECTION_DB'] = 'sqlite'
+        os.environ['SQLITE_PATH'] = os.path.join(workdir, 'load_test.db')
+        os.environ['MONGODB_URI'] = 'mongodb://127.0.0.1:1/'
+    else:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        # motor không chạy được trên mongomock: app_async gọi pymongo trên io executor
+        os.environ['ASYNC_MONGO'] = '0'
+
+    import cloudinary.uploader
+    upload_dir = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    counter = iter(range(1 << 62))
+
+    def save_upload(data):
+        public_id = f"shrimp-detections/{next(counter)}"
+        path = os.path.join(upload_dir, public_id.replace('/', '_') + '.jpg')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return {"url": f"http://fake-cloudinary/{public_id}.jpg",
+                "secure_url": f"https://fake-cloudinary/{public_id}.jpg",
+                "public_id": public_id}
+
+    def fake_upload(file, **kwargs):
+        time.sleep(upload_latency)
+        return save_upload(file.read())
+
+    cloudinary.uploader.upload = fake_upload
+
+    if server == 'async':
+        import asyncio
+        import app_async
+
+        async def fake_async_upload(image_bytes):
+            # Không gọi fake_upload: time.sleep sẽ chặn event loop
+            await asyncio.sleep(upload_latency)
+            return save_upload(image_bytes)
+
+        app_async.upload_image = fake_async_upload
+        app_async.run(host='127.0.0.1', port=port)
+        return
+
+    import app_complete
+    app_complete.app.run(host='127.0.0.1', port=port, debug=False, threaded=True)
+
+
+def start_local_backend(port, store, upload_latency, server='threaded'):
+    workdir = tempfile.mkdtemp(prefix='shrimp-load-')
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+         '--store', store, '--upload-latency', str(upload_latency), '--workdir', workdir,
+         '--server', server],
+        stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited, xem log: {log.name}")
+        try:
+            requests.get(f"{url}/health", timeout=1)
+            return process, url, log.name
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Backend không khởi động được, xem log: {log.name}")
+
+
+# ==================== WORKLOAD ====================
+def load_corpus(paths, count, size):
+    """Đọc ảnh (file hoặc thư mục) và encode base64; không có thì tạo ảnh giả"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in IMAGE_EXTENSIONS:
+                files.extend(glob.glob(os.path.join(path, pattern)))
+        else:
+            files.append(path)
+
+    corpus = []
+    for path in sorted(files):
+        with open(path, 'rb') as f:
+            corpus.append(base64.b64encode(f.read()).decode('utf-8'))
+
+    if not corpus:
+        width, height = size
+        rng = np.random.default_rng(0)
+        for _ in range(count):
+            image = np.full((height, width, 3), 90, dtype=np.uint8)
+            for _ in range(20):
+                x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+                cv2.ellipse(image, (x, y), (int(width * 0.03), int(height * 0.01)),
+                            float(rng.uniform(0, 180)), 0, 360, (200, 170, 140), -1)
+            ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            corpus.append(base64.b64encode(jpeg.tobytes()).decode('utf-8'))
+    return corpus
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('detect', 'batch', 'gallery', 'detail'):
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Workload:
+    """Chọn request theo tỉ lệ mix và gửi bằng session của từng thread"""
+
+    def __init__(self, url, corpus, weights, gallery_form):
+        self.url = url
+        self.corpus = corpus
+        self.names = list(weights)
+        self.weights = [weights[name] for name in self.names]
+        self.gallery_form = gallery_form
+        self.image_ids = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def pick(self, rng):
+        name = rng.choices(self.names, self.weights)[0]
+        if name == 'detail' and not self.image_ids:
+            name = 'gallery'
+        return name
+
+    def send(self, name, rng):
+        session = self.session()
+        if name in ('detect', 'batch'):
+            # batch: detection nền, gửi ở làn ưu tiên thấp (so sánh latency với detect)
+            payload = {"image": rng.choice(self.corpus), "source": "load-test"}
+            if name == 'batch':
+                payload["priority"] = "batch"
+            response = session.post(f"{self.url}/api/detect-shrimp", json=payload, timeout=120)
+            if response.ok:
+                mongo_id = response.json().get('mongoId')
+                if mongo_id and not mongo_id.startswith(('spool-', 'no-')):
+                    with self._lock:
+                        self.image_ids.append(mongo_id)
+        elif name == 'gallery':
+            response = session.get(f"{self.url}/api/shrimp-images",
+                                   params={"detections": self.gallery_form}, timeout=60)
+        else:
+            with self._lock:
+                image_id = rng.choice(self.image_ids)
+            response = session.get(f"{self.url}/api/shrimp-images/{image_id}", timeout=60)
+        return response.status_code, len(response.content)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.bytes = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, status, nbytes=0):
+        with self._lock:
+            self.latencies[name].append(latency)
+            self.statuses[name][status] += 1
+            self.bytes[name] += nbytes
+
+
+def run_request(workload, recorder, name, rng, scheduled):
+    try:
+        status, nbytes = workload.send(name, rng)
+    except requests.RequestException as e:
+        status, nbytes = type(e).__name__, 0
+    recorder.record(name, time.perf_counter() - scheduled, status, nbytes)
+
+
+def run_closed_loop(workload, recorder, concurrency, duration, total, seed):
+    """Mỗi client gửi request tiếp theo ngay khi nhận được response"""
+    deadline = time.perf_counter() + duration
+    remaining = [total]
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            if total:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            run_request(workload, recorder, workload.pick(rng), rng, time.perf_counter())
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(workload, recorder, rate, duration, total, seed, max_workers):
+    """Request đến theo Poisson với tốc độ rate/s, không phụ thuộc tốc độ server"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    scheduled = started
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while scheduled - started < duration and (not total or sent < total):
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            request_rng = random.Random(rng.random())
+            pool.submit(run_request, workload, recorder, workload.pick(request_rng), request_rng, scheduled)
+            sent += 1
+            scheduled += rng.expovariate(rate)
+
+
+# ==================== SLOW CLIENTS ====================
+class SlowClients:
+    """
+    Client chậm giữ kết nối suốt thời gian test (socket thô, mỗi client 1 thread phía load tester)
+    - upload: gửi POST /api/detect-shrimp với tốc độ rate byte/giây, xong thì gửi lại
+    - sse: nghe /api/events
+    """
+
+    def __init__(self, url, corpus, uploads, sse, rate):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname, parsed.port or 80)
+        self.corpus = corpus
+        self.uploads = uploads
+        self.sse = sse
+        self.rate = rate
+        self.stop = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        self.events = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.uploads):
+            self._threads.append(threading.Thread(target=self._upload, args=(i,), daemon=True))
+        for _ in range(self.sse):
+            self._threads.append(threading.Thread(target=self._listen, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self.stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _upload(self, index):
+        chunk = max(int(self.rate / 10), 1)
+        rng = random.Random(index)
+        while not self.stop.is_set():
+            body = json.dumps({"image": rng.choice(self.corpus), "source": "slow-client"}).encode('utf-8')
+            head = (f"POST /api/detect-shrimp HTTP/1.1\r\nHost: {self.address[0]}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n").encode('ascii')
+            try:
+                with socket.create_connection(self.address, timeout=120) as sock:
+                    sock.sendall(head)
+                    for start in range(0, len(body), chunk):
+                        if self.stop.is_set():
+                            return
+                        sock.sendall(body[start:start + chunk])
+                        time.sleep(0.1)
+                    status = sock.recv(64).split(b' ', 2)[1]
+                with self._lock:
+                    if status.startswith(b'2'):
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            except (OSError, IndexError):
+                with self._lock:
+                    self.failed += 1
+                self.stop.wait(1.0)
+
+    def _listen(self):
+        request = (f"GET /api/events HTTP/1.1\r\nHost: {self.address[0]}\r\n"
+                   f"Accept: text/event-stream\r\n\r\n").encode('ascii')
+        try:
+            with socket.create_connection(self.address, timeout=1.0) as sock:
+                sock.sendall(request)
+                while not self.stop.is_set():
+                    try:
+                        data = sock.recv(65536)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    with self._lock:
+                        self.events += data.count(b'event: detection')
+        except OSError:
+            with self._lock:
+                self.failed += 1
+
+    def report(self):
+        print(f"\n🐢 Client chậm: {self.uploads} upload ({self.rate / 1024:.0f} KB/s), {self.sse} SSE; "
+              f"upload xong {self.completed}, lỗi {self.failed}, event SSE nhận {self.events}")
+
+
+class ProcessSampler:
+    """Lấy mẫu RSS và số thread của process server (Linux /proc) trong lúc test"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def read(self):
+        values = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'Threads'):
+                    values[name] = int(value.split()[0])
+        return values.get('VmRSS', 0) / 1024, values.get('Threads', 0)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.samples.append(self.read())
+            except OSError:
+                return
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def report(self, baseline):
+        if not self.samples:
+            return
+        rss = [sample[0] for sample in self.samples]
+        threads = [sample[1] for sample in self.samples]
+        print(f"\n🧠 Server: RSS {baseline[0]:.0f} MB lúc rảnh -> tối đa {max(rss):.0f} MB "
+              f"(TB {sum(rss) / len(rss):.0f} MB); thread {baseline[1]} -> tối đa {max(threads)}")
+
+
+# ==================== REPORT ====================
+def report(recorder, elapsed):
+    print(f"\n📊 Kết quả ({elapsed:.1f}s):")
+    print(f"   {'endpoint':<10}{'req':>7}{'req/s':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    all_latencies = []
+    total_errors = 0
+    for name in sorted(recorder.latencies):
+        latencies = np.array(recorder.latencies[name]) * 1000
+        statuses = recorder.statuses[name]
+        errors = sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400))
+        total_errors += errors
+        all_latencies.extend(latencies)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"   {name:<10}{len(latencies):>7}{len(latencies) / elapsed:>9.1f}"
+              f"{errors / len(latencies):>7.1%}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{latencies.max():>9.1f}")
+        codes = ", ".join(f"{status}: {n}" for status, n in sorted(statuses.items(), key=str))
+        print(f"   {'':<10}status {codes}; {recorder.bytes[name] / max(len(latencies), 1) / 1024:.1f} KB/resp")
+
+    if all_latencies:
+        all_latencies = np.array(all_latencies)
+        p50, p95, p99 = np.percentile(all_latencies, [50, 95, 99])
+        print(f"\n   Tổng: {len(all_latencies)} request, {len(all_latencies) / elapsed:.1f} req/s, "
+              f"lỗi {total_errors / len(all_latencies):.1%}, p50 {p50:.1f} / p95 {p95:.1f} / p99 {p99:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test cho Shrimp Detection backend")
+    parser.add_argument("images", nargs="*", help="File ảnh hoặc thư mục ảnh (trống: tạo ảnh giả)")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend đang chạy")
+    parser.add_argument("--local", action="store_true", help="Tự chạy backend offline với MongoDB/Cloudinary giả")
+    parser.add_argument("--port", type=int, default=8765, help="Port cho backend --local")
+    parser.add_argument("--store", choices=["mongomock", "sqlite"], default=None,
+                        help="MongoDB giả cho --local (mặc định mongomock nếu đã cài)")
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="Độ trễ Cloudinary giả (giây)")
+    parser.add_argument("--server", choices=["threaded", "async"], default="threaded",
+                        help="Backend --local: app_complete (Flask threaded) hoặc app_async (asyncio)")
+    parser.add_argument("--slow-clients", type=int, default=0, help="Số client upload chậm chạy song song")
+    parser.add_argument("--slow-rate", type=float, default=16384, help="Tốc độ upload của client chậm (byte/giây)")
+    parser.add_argument("--sse-clients", type=int, default=0, help="Số client giữ kết nối SSE /api/events")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số client (closed-loop)")
+    parser.add_argument("--rate", type=float, default=None, help="Request/giây (open-loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Thời gian chạy (giây)")
+    parser.add_argument("--requests", type=int, default=0, help="Dừng sau N request (0: theo --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Tỉ lệ endpoint (mặc định {DEFAULT_MIX})")
+    parser.add_argument("--gallery-form", default="verbose", choices=["verbose", "compact", "none"])
+    parser.add_argument("--synthetic", type=int, default=8, help="Số ảnh giả khi không truyền ảnh")
+    parser.add_argument("--size", default="1920x1080", help="Kích thước ảnh giả WxH")
+    parser.add_argument("--max-workers", type=int, default=64, help="Số thread tối đa cho open-loop")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.store is None:
+        try:
+            import mongomock  # noqa: F401
+            args.store = "mongomock"
+        except ImportError:
+            args.store = "sqlite"
+
+    if args.serve:
+        serve_offline(args.port, args.store, args.upload_latency, args.workdir, args.server)
+        return
+
+    print("=" * 50)
+    print("🧪 Load Test: Shrimp Detection Backend")
+    print("=" * 50)
+
+    process = None
+    url = args.url
+    if args.local:
+        print(f"\n🚀 Khởi động backend offline ({args.server}, store: {args.store}, "
+              f"Cloudinary giả {args.upload_latency * 1000:.0f} ms)...")
+        process, url, log_path = start_local_backend(args.port, args.store, args.upload_latency, args.server)
+        print(f"✅ Backend: {url} (log: {log_path})")
+
+    try:
+        width, height = (int(v) for v in args.size.lower().split('x'))
+        corpus = load_corpus(args.images, args.synthetic, (width, height))
+        workload = Workload(url, corpus, parse_mix(args.mix), args.gallery_form)
+        recorder = Recorder()
+
+        mode = f"open-loop {args.rate} req/s" if args.rate else f"closed-loop {args.concurrency} client"
+        print(f"\n🔁 {mode}, {len(corpus)} ảnh, mix {args.mix}, "
+              f"{args.requests or 'không giới hạn'} request / {args.duration:.0f}s")
+
+        sampler = slow = None
+        if process is not None:
+            sampler = ProcessSampler(process.pid)
+            baseline = sampler.read()
+            sampler.start()
+        if args.slow_clients or args.sse_clients:
+            slow = SlowClients(url, corpus, args.slow_clients, args.sse_clients, args.slow_rate).start()
+
+        started = time.perf_counter()
+        try:
+            if args.rate:
+                run_open_loop(workload, recorder, args.rate, args.duration, args.requests,
+                              args.seed, args.max_workers)
+            else:
+                run_closed_loop(workload, recorder, args.concurrency, args.duration, args.requests, args.seed)
+        finally:
+            elapsed = time.perf_counter() - started
+            if slow is not None:
+                slow.close()
+            if sampler is not None:
+                sampler.close()
+        report(recorder, elapsed)
+        if slow is not None:
+            slow.report()
+        if sampler is not None:
+            sampler.report(baseline)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                print("⚠️  Backend không tắt sau 10s, kill")
+                process.kill()
+                process.wait()
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    main()
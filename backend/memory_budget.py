@@ -0,0 +1,138 @@
+"""
+Ngân sách bộ nhớ cho các ảnh đang xử lý đồng thời
+Mỗi request ước lượng RAM cần (ảnh nén + ảnh decode + tensor đầu vào model + JPEG kết quả) và giữ chỗ
+trước khi decode; khi tổng vượt ngân sách thì request chờ (có timeout) thay vì
+đẩy Pi vào swap. Bộ nhớ thực dùng của từng bước được ghi lại để đo peak mỗi request.
+RAM giữ lâu dài ngoài request (interpreter batch) được trừ khỏi ngân sách qua set_resident().
+"""
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class MemoryBudgetExceeded(Exception):
+    """Không giữ được chỗ trong ngân sách bộ nhớ"""
+
+
+class RequestMemory:
+    """Theo dõi các buffer lớn của 1 request (bytes theo tên)"""
+
+    def __init__(self, reserved):
+        self.reserved = reserved
+        self.current = 0
+        self.peak = 0
+        self._buffers = {}
+
+    def track(self, name, nbytes):
+        self.current += nbytes - self._buffers.get(name, 0)
+        self._buffers[name] = nbytes
+        self.peak = max(self.peak, self.current)
+
+    def release(self, name):
+        self.current -= self._buffers.pop(name, 0)
+
+
+class MemoryBudget:
+    """Semaphore theo bytes cho ảnh đang xử lý"""
+
+    def __init__(self, limit_bytes, wait_timeout=10.0, history_size=200):
+        self.limit_bytes = limit_bytes
+        self.wait_timeout = wait_timeout
+        self.reserved = 0
+        self.resident = 0
+        self.reserved_high_water = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.over_estimate = 0
+        self._peaks = deque(maxlen=history_size)
+        self._condition = threading.Condition()
+
+    def set_resident(self, nbytes):
+        """RAM giữ lâu dài ngoài các request (VD: interpreter batch), trừ vào ngân sách"""
+        with self._condition:
+            self.resident = nbytes
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes, timeout=None):
+        """
+        Giữ chỗ nbytes trong ngân sách, chờ tối đa timeout giây
+        Yields:
+            RequestMemory để ghi lại bộ nhớ thực dùng
+        Raises:
+            MemoryBudgetExceeded nếu ảnh lớn hơn cả ngân sách hoặc chờ quá lâu
+        """
+        timeout = self.wait_timeout if timeout is None else timeout
+        with self._condition:
+            if nbytes > self.limit_bytes - self.resident:
+                self.rejected += 1
+                raise MemoryBudgetExceeded(
+                    f"Request needs {nbytes / 1e6:.0f} MB, budget is {self.limit_bytes / 1e6:.0f} MB "
+                    f"({self.resident / 1e6:.0f} MB resident)")
+
+            deadline = time.monotonic() + timeout
+            self.waiting += 1
+            try:
+                while self.resident + self.reserved + nbytes > self.limit_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise MemoryBudgetExceeded("Memory budget busy, retry later")
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self.reserved += nbytes
+            self.in_flight += 1
+            self.reserved_high_water = max(self.reserved_high_water, self.reserved)
+
+        usage = RequestMemory(nbytes)
+        try:
+            yield usage
+        finally:
+            with self._condition:
+                self.reserved -= nbytes
+                self.in_flight -= 1
+                self._peaks.append(usage.peak)
+                if usage.peak > nbytes:
+                    self.over_estimate += 1
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            peaks = np.array(self._peaks, dtype=np.float64)
+            stats = {
+                "limitBytes": self.limit_bytes,
+                "reservedBytes": self.reserved,
+                "residentBytes": self.resident,
+                "reservedHighWater": self.reserved_high_water,
+                "inFlight": self.in_flight,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "overEstimate": self.over_estimate,
+                "requests": len(peaks)
+            }
+        if len(peaks):
+            stats.update({
+                "peakRequestBytesP50": int(np.percentile(peaks, 50)),
+                "peakRequestBytesP95": int(np.percentile(peaks, 95)),
+                "peakRequestBytesMax": int(peaks.max())
+            })
+        # ru_maxrss tính theo KB trên Linux
+        stats["processMaxRssBytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return stats
+
+
+def estimate_request_bytes(encoded_bytes, decoded_width, decoded_height, input_bytes=0):
+    """
+    Ước lượng RAM cho 1 ảnh upload
+    ảnh nén + ảnh BGR decode (vẽ bbox tại chỗ) + JPEG kết quả (~1/4 ảnh BGR)
+    + input_bytes: tensor float32 đưa vào model (cả batch tile/ROI)
+    """
+    decoded = decoded_width * decoded_height * 3
+    return encoded_bytes + decoded + decoded // 4 + input_bytes
@@ -0,0 +1,198 @@
+"""
+Tham số stream MJPEG theo từng client (quality / độ phân giải / FPS),
+cache JPEG dùng chung và điều chỉnh tự động theo tốc độ ghi socket
+"""
+import threading
+
+import cv2
+
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+MIN_WIDTH = 160
+MAX_FPS = 30
+
+# Các bậc giảm chất lượng khi mạng yếu: (giảm quality, hệ số resize)
+ADAPTIVE_LADDER = [
+    (0, 1.0),
+    (15, 1.0),
+    (15, 0.75),
+    (25, 0.5),
+    (35, 0.5),
+    (40, 0.375),
+]
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def quantize_quality(quality):
+    """Làm tròn quality về bội số của 5 để client gần giống nhau dùng chung bản encode"""
+    return int(_clamp(round(quality / 5) * 5, MIN_QUALITY, MAX_QUALITY))
+
+
+def quantize_width(width, max_width):
+    """Làm tròn chiều rộng về bội số của 32, không vượt quá frame gốc"""
+    if width is None or width >= max_width:
+        return max_width
+    return int(_clamp(round(width / 32) * 32, MIN_WIDTH, max_width))
+
+
+class StreamSettings:
+    """Tham số stream client yêu cầu qua query string"""
+
+    def __init__(self, quality=80, width=None, fps=MAX_FPS, adaptive=False):
+        self.quality = quantize_quality(quality)
+        self.width = width
+        self.fps = _clamp(fps, 1, MAX_FPS)
+        self.adaptive = adaptive
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.fps
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Đọc tham số từ query string, ví dụ:
+            /blynk_feed?quality=50&width=320&fps=10&adaptive=1
+        """
+        def number(name, default, cast=int):
+            try:
+                return cast(args.get(name, default))
+            except (TypeError, ValueError):
+                return default
+
+        width = args.get('width')
+        return cls(
+            quality=number('quality', 80),
+            width=number('width', None) if width else None,
+            fps=number('fps', MAX_FPS, float),
+            adaptive=args.get('adaptive', '0').lower() in ('1', 'true', 'yes')
+        )
+
+
+class SharedFrameEncoder:
+    """
+    Cache JPEG của frame hiện tại theo (quality, width):
+    mỗi tổ hợp chỉ encode 1 lần mỗi frame, dù có bao nhiêu client
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._seq = -1
+        self._cache = {}
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, seq, frame, quality, width):
+        key = (quality, width)
+        with self._lock:
+            if seq > self._seq:
+                self._seq = seq
+                self._cache = {}
+            data = self._cache.get(key) if seq == self._seq else None
+            if data is not None:
+                self.hits += 1
+                return data
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Client khác có thể đã encode xong trong lúc chờ lock
+            with self._lock:
+                data = self._cache.get(key) if seq == self._seq else None
+                if data is not None:
+                    self.hits += 1
+                    return data
+
+            data = encode_frame(frame, quality, width)
+
+            with self._lock:
+                self.encodes += 1
+                if data is not None and seq == self._seq:
+                    self._cache[key] = data
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "variants": len(self._cache),
+                "encodes": self.encodes,
+                "hits": self.hits
+            }
+
+
+def encode_frame(frame, quality, width=None):
+    """Resize (nếu cần) và encode JPEG"""
+    height, frame_width = frame.shape[:2]
+    if width and width < frame_width:
+        new_height = max(1, int(round(height * width / frame_width)))
+        frame = cv2.resize(frame, (width, new_height), interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+
+class AdaptiveStreamController:
+    """
+    Điều chỉnh quality/độ phân giải/FPS theo thời gian ghi socket đo được.
+    Khi buffer TCP của client đầy, lần ghi frame bị chặn lâu hơn: nếu thời gian
+    ghi chiếm quá nhiều khung thời gian của 1 frame thì giảm 1 bậc, ngược lại
+    mạng rảnh lâu thì tăng dần trở lại.
+    """
+
+    DOWNGRADE_RATIO = 0.5
+    UPGRADE_RATIO = 0.15
+    DOWNGRADE_AFTER = 3
+    UPGRADE_AFTER = 30
+    MAX_INTERVAL = 1.0
+
+    def __init__(self, settings, max_width):
+        self.settings = settings
+        self.max_width = max_width
+        self.level = 0
+        self.frame_interval = settings.frame_interval
+        self.throughput = 0.0
+        self._slow = 0
+        self._fast = 0
+
+    def current(self):
+        """Trả về (quality, width) cho bậc hiện tại"""
+        quality_drop, scale = ADAPTIVE_LADDER[self.level]
+        base_width = self.settings.width or self.max_width
+        quality = quantize_quality(self.settings.quality - quality_drop)
+        width = quantize_width(int(base_width * scale), self.max_width)
+        return quality, width
+
+    def record(self, nbytes, write_time):
+        """Ghi nhận 1 lần gửi frame"""
+        if write_time > 0:
+            rate = nbytes / write_time
+            self.throughput = rate if self.throughput == 0 else 0.8 * self.throughput + 0.2 * rate
+
+        ratio = write_time / self.frame_interval
+        if ratio > self.DOWNGRADE_RATIO:
+            self._slow += 1
+            self._fast = 0
+        elif ratio < self.UPGRADE_RATIO:
+            self._fast += 1
+            self._slow = 0
+        else:
+            self._slow = 0
+            self._fast = 0
+
+        if self._slow >= self.DOWNGRADE_AFTER:
+            self._slow = 0
+            if self.level < len(ADAPTIVE_LADDER) - 1:
+                self.level += 1
+            else:
+                # Đã ở bậc thấp nhất: giảm FPS
+                self.frame_interval = min(self.MAX_INTERVAL, self.frame_interval * 2)
+        elif self._fast >= self.UPGRADE_AFTER:
+            self._fast = 0
+            if self.frame_interval > self.settings.frame_interval:
+                self.frame_interval = max(self.settings.frame_interval, self.frame_interval / 2)
+            elif self.level > 0:
+                self.level -= 1
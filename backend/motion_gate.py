@@ -0,0 +1,114 @@
+"""
+Bỏ qua inference khi cảnh không thay đổi (motion gating)
+So sánh ảnh xám thu nhỏ của frame hiện tại với frame lần chạy model gần nhất;
+nếu tỉ lệ pixel thay đổi dưới ngưỡng thì dùng lại detections cũ.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Bộ phát hiện thay đổi rẻ trên ảnh xám thu nhỏ"""
+
+    def __init__(self, threshold=0.01, pixel_threshold=15, width=160, refresh_interval=10.0):
+        """
+        Args:
+            threshold: tỉ lệ pixel thay đổi tối thiểu để chạy lại model (0-1)
+            pixel_threshold: chênh lệch mức xám để tính 1 pixel là thay đổi
+            width: chiều rộng ảnh thu nhỏ dùng để so sánh
+            refresh_interval: số giây tối đa được dùng lại kết quả cũ
+        """
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._reference = None
+        self._last_run = None
+        self._last_detections = []
+        self.frames = 0
+        self.inferences = 0
+        self.skipped = 0
+        self.gate_time = 0.0
+        self.inference_time = 0.0
+        self.last_change = 0.0
+
+    def _prepare(self, frame):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = frame.shape[:2]
+        if width > self.width:
+            small_height = max(1, int(height * self.width / width))
+            frame = cv2.resize(frame, (self.width, small_height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(frame, (5, 5), 0)
+
+    def change_ratio(self, small):
+        """Tỉ lệ pixel khác frame tham chiếu (1.0 nếu chưa có tham chiếu)"""
+        if self._reference is None or self._reference.shape != small.shape:
+            return 1.0
+        diff = cv2.absdiff(small, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def process(self, frame, infer, now=None):
+        """
+        Chạy infer(frame) nếu cảnh đã thay đổi hoặc quá refresh_interval,
+        ngược lại trả về detections lần trước
+        Returns:
+            (detections, ran): ran=True nếu model thực sự được chạy
+        """
+        now = time.time() if now is None else now
+        gate_started = time.perf_counter()
+        small = self._prepare(frame)
+
+        with self._lock:
+            change = self.change_ratio(small)
+            self.last_change = change
+            self.frames += 1
+            stale = self._last_run is None or now - self._last_run >= self.refresh_interval
+            run = stale or change >= self.threshold
+            if not run:
+                self.skipped += 1
+                detections = self._last_detections
+            self.gate_time += time.perf_counter() - gate_started
+
+        if not run:
+            return detections, False
+
+        infer_started = time.perf_counter()
+        detections = infer(frame)
+        elapsed = time.perf_counter() - infer_started
+
+        with self._lock:
+            self.inferences += 1
+            self.inference_time += elapsed
+            self._reference = small
+            self._last_run = now
+            self._last_detections = detections
+        return detections, True
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self._last_run = None
+            self._last_detections = []
+
+    def stats(self):
+        """Skip ratio và ước tính thời gian CPU tiết kiệm được"""
+        with self._lock:
+            avg_inference = self.inference_time / self.inferences if self.inferences else 0.0
+            full_cost = self.frames * avg_inference
+            saved = max(0.0, self.skipped * avg_inference - self.gate_time)
+            return {
+                "frames": self.frames,
+                "inferences": self.inferences,
+                "skipped": self.skipped,
+                "skipRatio": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+                "lastChange": round(self.last_change, 4),
+                "avgGateMs": round(self.gate_time / self.frames * 1000, 3) if self.frames else 0.0,
+                "avgInferenceMs": round(avg_inference * 1000, 2),
+                "cpuSavedSeconds": round(saved, 2),
+                "cpuSavedRatio": round(saved / full_cost, 3) if full_cost else 0.0
+            }
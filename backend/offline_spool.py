@@ -0,0 +1,312 @@
+"""
+Hàng đợi store-and-forward trên đĩa khi MongoDB/Cloudinary không truy cập được
+Kết quả detection luôn được nhận ngay (SQLite WAL + file ảnh), thread forwarder
+đẩy dần lên Cloudinary/MongoDB theo lô, có backoff khi dịch vụ vẫn lỗi.
+Khi đã biết dịch vụ mất kết nối (ServiceState), request spool ngay không gọi thử.
+Mỗi bản ghi có spoolKey cố định nên gửi lại sau lỗi giữa lô không ghi trùng; document bị
+store từ chối quá max_rejections lần thì nằm lại trong spool (dead letter), không thử nữa.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+MAX_BACKOFF_SECONDS = 300
+
+
+class OfflineSpool:
+    """Lưu kết quả chưa gửi được vào SQLite (WAL) và thư mục ảnh"""
+
+    def __init__(self, directory, max_rejections=5):
+        self.directory = directory
+        self.max_rejections = max_rejections
+        self.image_dir = os.path.join(directory, 'images')
+        os.makedirs(self.image_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'spool.db'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL NOT NULL,
+                record TEXT NOT NULL,
+                image_path TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                rejections INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(spool)")}
+        if 'rejections' not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_spool_next ON spool (next_attempt, id)")
+        self._db.commit()
+
+    def enqueue(self, record, image_bytes=None):
+        """
+        Thêm 1 kết quả vào spool
+        Args:
+            record: dict JSON được (detections, timestamp, capturedFrom, upload...)
+            image_bytes: JPEG cần upload sau (None nếu ảnh đã lên Cloudinary)
+        Returns:
+            id trong spool
+        """
+        # Khoá idempotent: lần gửi lại sau timeout/lỗi giữa lô không tạo document thứ 2
+        record = dict(record, spoolKey=uuid.uuid4().hex)
+        image_path = None
+        if image_bytes is not None:
+            image_path = os.path.join(self.image_dir, f"{uuid.uuid4().hex}.jpg")
+            with open(image_path, 'wb') as f:
+                f.write(image_bytes)
+
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO spool (created, record, image_path) VALUES (?, ?, ?)",
+                (time.time(), json.dumps(record), image_path))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def due(self, limit, now=None):
+        """Các bản ghi đến hạn gửi lại, cũ nhất trước"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, record, image_path, attempts FROM spool "
+                "WHERE next_attempt <= ? AND rejections < ? ORDER BY id LIMIT ?",
+                (now, self.max_rejections, limit)).fetchall()
+        entries = [{"id": row[0], "record": json.loads(row[1]), "image_path": row[2], "attempts": row[3]}
+                   for row in rows]
+        for entry in entries:
+            # Bản ghi spool từ trước khi có spoolKey: khoá suy ra từ id trong spool
+            entry["record"].setdefault("spoolKey", f"spool-{entry['id']}")
+        return entries
+
+    def update_record(self, spool_id, record, image_path=None):
+        """Lưu tiến độ (VD: ảnh đã upload xong) để không upload lại nếu Mongo vẫn lỗi"""
+        with self._lock:
+            self._db.execute("UPDATE spool SET record = ?, image_path = ? WHERE id = ?",
+                             (json.dumps(record), image_path, spool_id))
+            self._db.commit()
+
+    def complete(self, entries):
+        with self._lock:
+            self._db.executemany("DELETE FROM spool WHERE id = ?", [(e["id"],) for e in entries])
+            self._db.commit()
+        for entry in entries:
+            if entry.get("image_path") and os.path.exists(entry["image_path"]):
+                os.remove(entry["image_path"])
+
+    def fail(self, entries, error, now=None, rejected=False):
+        """
+        Tăng số lần thử và lùi thời điểm gửi lại theo backoff mũ
+        rejected: lỗi của chính bản ghi (không phải mất kết nối), tính vào max_rejections
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._db.executemany(
+                "UPDATE spool SET attempts = attempts + 1, next_attempt = ?, last_error = ?, "
+                "rejections = rejections + ? WHERE id = ?",
+                [(now + min(MAX_BACKOFF_SECONDS, 2 ** (e["attempts"] + 1)), str(error)[:500], int(rejected),
+                  e["id"]) for e in entries])
+            self._db.commit()
+            if rejected:
+                dead = self._db.execute(
+                    f"SELECT id FROM spool WHERE rejections >= ? AND id IN ({','.join('?' * len(entries))})",
+                    [self.max_rejections] + [e["id"] for e in entries]).fetchall()
+                for (spool_id,) in dead:
+                    print(f"[ERROR] Spool entry {spool_id} rejected {self.max_rejections} times, "
+                          f"no longer retried: {str(error)[:200]}")
+
+    def stats(self):
+        with self._lock:
+            pending, oldest, images = self._db.execute(
+                "SELECT COUNT(*), MIN(created), COUNT(image_path) FROM spool WHERE rejections < ?",
+                (self.max_rejections,)).fetchone()
+            dead = self._db.execute("SELECT COUNT(*) FROM spool WHERE rejections >= ?",
+                                    (self.max_rejections,)).fetchone()[0]
+            last_error = self._db.execute(
+                "SELECT last_error FROM spool WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 1").fetchone()
+
+        size = 0
+        for name in os.listdir(self.image_dir):
+            size += os.path.getsize(os.path.join(self.image_dir, name))
+        for name in ('spool.db', 'spool.db-wal'):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+
+        return {
+            "pending": pending,
+            "pendingImages": images,
+            "dead": dead,
+            "bytes": size,
+            "oldestAgeSeconds": round(time.time() - oldest, 1) if oldest else 0,
+            "lastError": last_error[0] if last_error else None
+        }
+
+
+class ServiceState:
+    """
+    Trạng thái kết nối 1 dịch vụ (Cloudinary / storage), dùng chung giữa request và forwarder
+    Lỗi -> đánh dấu mất kết nối: request đưa thẳng vào spool thay vì chờ hết timeout;
+    forwarder vẫn thử lại theo lô và đánh dấu có kết nối lại khi gửi thành công
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.down_since = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.down_since is None
+
+    def report(self, error=None):
+        """Kết quả 1 lần gọi dịch vụ (error None: thành công)"""
+        with self._lock:
+            if error is None:
+                if self.down_since is not None:
+                    print(f"[INFO] {self.name} reachable again after "
+                          f"{time.time() - self.down_since:.0f}s")
+                self.down_since = None
+                return
+            if self.down_since is None:
+                print(f"[WARN] {self.name} unreachable, spooling new results: {str(error)[:200]}")
+                self.down_since = time.time()
+            self.last_error = str(error)[:500]
+
+    def to_dict(self):
+        return {
+            "available": self.available,
+            "downSeconds": round(time.time() - self.down_since, 1) if self.down_since else 0
+        }
+
+
+class SpoolForwarder:
+    """Thread đẩy dữ liệu từ spool lên Cloudinary/MongoDB theo lô"""
+
+    def __init__(self, spool, upload_image, get_store, build_document, on_forwarded=None,
+                 batch_size=20, interval=2.0):
+        """
+        Args:
+            upload_image: hàm(bytes) -> upload_result của Cloudinary
+            get_store: hàm() -> detection store (detection_store, cần insert_spooled) hoặc None nếu chưa kết nối được
+            build_document: hàm(record) -> document để insert
+            on_forwarded: hàm(record, inserted_id) gọi sau khi lưu thành công
+        """
+        self.spool = spool
+        self.upload_image = upload_image
+        self.get_store = get_store
+        self.build_document = build_document
+        self.on_forwarded = on_forwarded
+        self.batch_size = batch_size
+        self.interval = interval
+        self.forwarded = 0
+        # Request kiểm tra trước khi gọi: dịch vụ đang mất kết nối thì spool ngay
+        self.services = {"cloudinary": ServiceState("Cloudinary"), "storage": ServiceState("Storage")}
+        self._recent = deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-forwarder", daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Báo có dữ liệu mới trong spool"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                print(f"[ERROR] Spool forwarder: {str(e)}")
+                drained = 0
+            if drained < self.batch_size:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+    def drain_once(self):
+        """Gửi 1 lô; trả về số bản ghi đã gửi thành công"""
+        entries = self.spool.due(self.batch_size)
+        if not entries:
+            return 0
+
+        store = self.get_store()
+        if store is None:
+            self.spool.fail(entries, "Storage not available")
+            return 0
+
+        ready = []
+        for entry in entries:
+            record = entry["record"]
+            if record.get("upload") is None:
+                try:
+                    with open(entry["image_path"], 'rb') as f:
+                        record["upload"] = self.upload_image(f.read())
+                except Exception as e:
+                    self.services["cloudinary"].report(e)
+                    self.spool.fail([entry], f"Cloudinary: {e}")
+                    continue
+                self.services["cloudinary"].report()
+                # Ảnh đã lên Cloudinary, nếu insert Mongo lỗi thì lần sau không upload lại
+                self.spool.update_record(entry["id"], record, entry["image_path"])
+            try:
+                document = self.build_document(record)
+            except Exception as e:
+                self.spool.fail([entry], f"Document: {e}", rejected=True)
+                continue
+            document["spoolKey"] = record["spoolKey"]
+            ready.append((entry, document))
+
+        if not ready:
+            return 0
+
+        try:
+            # Không theo thứ tự: 1 document lỗi không làm hỏng cả lô, bản đã ghi lần trước được bỏ qua
+            results = store.insert_spooled([document for _, document in ready])
+        except Exception as e:
+            self.services["storage"].report(e)
+            self.spool.fail([entry for entry, _ in ready], f"Storage: {e}")
+            return 0
+
+        self.services["storage"].report()
+        written = []
+        for (entry, _), result in zip(ready, results):
+            if isinstance(result, Exception):
+                print(f"[ERROR] Spool entry {entry['id']} rejected by storage: {str(result)[:200]}")
+                self.spool.fail([entry], f"Storage: {result}", rejected=True)
+            else:
+                written.append((entry, result))
+
+        self.spool.complete([entry for entry, _ in written])
+        # Bản ghi trùng (đã ghi ở lần gửi lỗi trước) chưa được tính rollup/phát SSE nên vẫn gọi ở đây
+        if self.on_forwarded is not None:
+            for entry, inserted_id in written:
+                self.on_forwarded(entry["record"], inserted_id)
+
+        now = time.time()
+        self.forwarded += len(written)
+        self._recent.append((now, len(written)))
+        return len(written)
+
+    def stats(self):
+        now = time.time()
+        while self._recent and self._recent[0][0] < now - 60:
+            self._recent.popleft()
+        stats = self.spool.stats()
+        stats.update({
+            "forwarded": self.forwarded,
+            "drainRatePerMinute": sum(n for _, n in self._recent),
+            "services": {name: state.to_dict() for name, state in self.services.items()}
+        })
+        return stats
@@ -0,0 +1,84 @@
+"""
+Chạy lại detection trên đoạn camera đã ghi (frame_recorder) mà không đụng tới stream live
+Dùng để so sánh model mới với model đang chạy trên đúng những frame đã bị nhận sai:
+    YOLO_MODEL_PATH=models/new.tflite python replay_recording.py --from=-10m
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from frame_recorder import RecordingReader
+
+
+def parse_time(value, now_ms):
+    """Epoch ms, hoặc tương đối so với hiện tại: -30s, -10m, -2h"""
+    units = {'s': 1000, 'm': 60 * 1000, 'h': 3600 * 1000}
+    if value.startswith('-') and value[-1] in units:
+        return now_ms - int(float(value[1:-1]) * units[value[-1]])
+    return int(value)
+
+
+def replay(directory, start_ms, end_ms, step, tiled, output):
+    # Import detector sau khi parse args: model được load theo YOLO_MODEL_PATH
+    from detector import MODEL_PATH, interpreter, run_inference, parse_yolo_output, detect_tiled
+
+    print("=" * 50)
+    print("🎞️  Replay recorded frames")
+    print("=" * 50)
+    print(f"Model: {MODEL_PATH}")
+    if interpreter is None:
+        print("❌ Model chưa load được")
+        return
+
+    reader = RecordingReader(directory)
+    results = []
+    inference_times = []
+    started = time.time()
+    for timestamp, frame in reader.decoded_frames(start_ms, end_ms, step=step):
+        inference_started = time.perf_counter()
+        if tiled:
+            detections = detect_tiled(frame)
+        else:
+            detections = parse_yolo_output(run_inference(frame), frame.shape)
+        inference_times.append(time.perf_counter() - inference_started)
+
+        results.append({
+            "timestamp": timestamp,
+            "count": len(detections),
+            "totalWeight": round(sum(d.get('weight', 0) for d in detections), 2),
+            "detections": detections
+        })
+        print(f"  {time.strftime('%H:%M:%S', time.localtime(timestamp / 1000))}.{timestamp % 1000:03d}"
+              f"  {len(detections):3d} tôm  {results[-1]['totalWeight']:8.2f} g")
+
+    if not results:
+        print("❌ Không có frame nào trong khoảng thời gian này")
+        return
+
+    counts = np.array([r["count"] for r in results])
+    print(f"\n📊 {len(results)} frame trong {time.time() - started:.1f}s "
+          f"(inference trung bình {np.mean(inference_times) * 1000:.1f} ms)")
+    print(f"   Số tôm/frame: trung bình {counts.mean():.1f}, min {counts.min()}, max {counts.max()}")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({"model": MODEL_PATH, "from": start_ms, "to": end_ms, "frames": results}, f)
+        print(f"💾 Đã lưu kết quả: {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy lại detection trên frame đã ghi")
+    parser.add_argument("--dir", default=os.getenv('RECORDING_DIR', 'recordings'))
+    parser.add_argument("--from", dest="start", default="-10m", help="Epoch ms hoặc -30s/-10m/-2h")
+    parser.add_argument("--to", dest="end", default=None, help="Epoch ms hoặc tương đối (mặc định: hiện tại)")
+    parser.add_argument("--step", type=int, default=1, help="Lấy 1 frame mỗi N frame")
+    parser.add_argument("--tiled", action="store_true", help="Dùng tiled inference")
+    parser.add_argument("--json", default=None, help="Lưu detections ra file JSON")
+    args = parser.parse_args()
+
+    now_ms = int(time.time() * 1000)
+    end_ms = parse_time(args.end, now_ms) if args.end else now_ms
+    replay(args.dir, parse_time(args.start, now_ms), end_ms, max(args.step, 1), args.tiled, args.json)
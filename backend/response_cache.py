@@ -0,0 +1,71 @@
+"""
+Cache response đã serialize của gallery API trong process
+Key là path + query string + định dạng (JSON/MessagePack); mỗi entry ghi lại version của
+detection store lúc tạo, store tăng version mỗi lần insert/delete nên entry cũ tự hết hiệu lực.
+Entry có ETag (hash nội dung) để client gửi lại If-None-Match và nhận 304 mà không cần query DB.
+TTL ngắn giới hạn độ trễ khi process khác (worker khác dùng chung MongoDB) ghi dữ liệu.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    def __init__(self, body, mimetype, headers, version):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+        self.version = version
+        self.created = time.time()
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ResponseCache:
+    """LRU cache response theo version của store"""
+
+    def __init__(self, max_entries=256, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key, version):
+        """Entry còn hiệu lực với version hiện tại, None nếu không có"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.version != version or time.time() - entry.created > self.ttl):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "notModified": self.not_modified,
+                "hitRatio": round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,186 @@
+"""
+Giới hạn dung lượng gallery: xoá ảnh quá hạn (theo tuổi và/hoặc số ảnh tối đa)
+khỏi detection store và Cloudinary
+- AssetDeleter: xoá ảnh Cloudinary theo lô qua Admin API (tối đa 100 public_id/lần gọi),
+  giới hạn số lần gọi/giờ để không vượt rate limit của tài khoản
+- RetentionPurger: thread nền lấy các ảnh cũ nhất, xoá ảnh Cloudinary trước rồi mới xoá document
+  (lỗi giữa chừng thì lần sau xoá lại, Cloudinary trả "not_found" cho ảnh đã xoá)
+Rollup biomass được giữ nguyên khi purge: thống kê lâu dài vẫn còn sau khi ảnh hết hạn.
+"""
+import os
+import re
+import threading
+import time
+
+VERSION_SEGMENT = re.compile(r'^v\d+$')
+CLOUDINARY_BATCH_LIMIT = 100
+
+
+class RateLimited(Exception):
+    """Hết lượt gọi Cloudinary Admin API trong thời gian chờ cho phép"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cloudinary delete rate limit, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def public_id_from_url(url):
+    """
+    public_id từ URL Cloudinary (cho document lưu trước khi có cloudinaryPublicId)
+    .../image/upload/v1700000000/shrimp-detections/abc.jpg -> shrimp-detections/abc
+    """
+    if not url or '/upload/' not in url:
+        return None
+    parts = url.split('?', 1)[0].split('/upload/', 1)[1].split('/')
+    for i, part in enumerate(parts):
+        if VERSION_SEGMENT.match(part):
+            parts = parts[i + 1:]
+            break
+    return os.path.splitext('/'.join(parts))[0] or None
+
+
+def document_public_id(doc):
+    return doc.get('cloudinaryPublicId') or public_id_from_url(doc.get('cloudinaryUrl') or doc.get('imageUrl'))
+
+
+class AssetDeleter:
+    """Xoá ảnh Cloudinary theo lô, token bucket cho số lần gọi API mỗi giờ"""
+
+    def __init__(self, delete_resources, calls_per_hour=200, burst=10):
+        """
+        Args:
+            delete_resources: hàm(list public_id) -> response Admin API ({"deleted": {id: status}})
+        """
+        self.delete_resources = delete_resources
+        self.rate = calls_per_hour / 3600.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deleted = 0
+        self.errors = 0
+
+    def _take(self, timeout):
+        """Lấy 1 lượt gọi, chờ tối đa timeout giây (RateLimited nếu không kịp)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                raise RateLimited(wait)
+            time.sleep(wait)
+
+    def delete(self, public_ids, timeout=3600.0, done=None):
+        """
+        Xoá các public_id (bỏ qua None), trả về số ảnh Cloudinary thực sự xoá
+        Lỗi API được ném ra để caller giữ lại document và thử lại sau
+        done: list nhận public_id của các lô đã gọi xong (phần đã xoá khi lỗi giữa chừng)
+        """
+        public_ids = [public_id for public_id in public_ids if public_id]
+        deleted = 0
+        for start in range(0, len(public_ids), CLOUDINARY_BATCH_LIMIT):
+            batch = public_ids[start:start + CLOUDINARY_BATCH_LIMIT]
+            self._take(timeout)
+            try:
+                result = self.delete_resources(batch)
+            except Exception:
+                self.errors += 1
+                raise
+            self.calls += 1
+            deleted += sum(1 for status in result.get('deleted', {}).values() if status == 'deleted')
+            if done is not None:
+                done.extend(batch)
+        self.deleted += deleted
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            tokens = min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+        return {
+            "calls": self.calls,
+            "deleted": self.deleted,
+            "errors": self.errors,
+            "callsAvailable": int(tokens),
+            "callsPerHour": round(self.rate * 3600)
+        }
+
+
+class RetentionPurger:
+    """Thread nền xoá ảnh cũ nhất vượt quá max_age_ms hoặc max_images theo từng lô"""
+
+    def __init__(self, get_store, asset_deleter, max_age_ms=0, max_images=0,
+                 batch_size=100, interval=600.0):
+        """
+        Args:
+            get_store: hàm() -> detection store (None nếu chưa kết nối)
+            max_age_ms, max_images: 0 = không giới hạn theo tiêu chí đó
+        """
+        self.get_store = get_store
+        self.asset_deleter = asset_deleter
+        self.max_age_ms = max_age_ms
+        self.max_images = max_images
+        self.batch_size = batch_size
+        self.interval = interval
+        self.purged = 0
+        self.last_run = None
+        self.last_error = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="retention-purger", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                purged = self.purge_once()
+                self.last_error = None
+            except Exception as e:
+                print(f"[ERROR] Retention purge: {str(e)}")
+                self.last_error = str(e)
+                purged = 0
+            self.last_run = int(time.time() * 1000)
+            # Còn nguyên 1 lô quá hạn: chạy tiếp ngay (AssetDeleter tự giới hạn tốc độ)
+            if purged < self.batch_size:
+                time.sleep(self.interval)
+
+    def expired(self, store):
+        """Các document quá hạn trong lô cũ nhất (cũ nhất trước)"""
+        oldest = store.oldest(self.batch_size)
+        cutoff = int(time.time() * 1000) - self.max_age_ms if self.max_age_ms else None
+        excess = store.count() - self.max_images if self.max_images else 0
+        return [doc for i, doc in enumerate(oldest)
+                if i < excess or (cutoff is not None and doc.get('timestamp', 0) < cutoff)]
+
+    def purge_once(self):
+        """Xoá 1 lô; trả về số document đã xoá"""
+        store = self.get_store()
+        if store is None:
+            return 0
+        docs = self.expired(store)
+        if not docs:
+            return 0
+
+        self.asset_deleter.delete([document_public_id(doc) for doc in docs])
+        deleted = store.delete_many([doc['id'] for doc in docs])
+        self.purged += len(deleted)
+        print(f"[INFO] Retention purged {len(deleted)} images")
+        return len(deleted)
+
+    def stats(self):
+        return {
+            "maxAgeDays": round(self.max_age_ms / 86400000, 2) if self.max_age_ms else None,
+            "maxImages": self.max_images or None,
+            "purged": self.purged,
+            "lastRun": self.last_run,
+            "lastError": self.last_error,
+            "cloudinary": self.asset_deleter.stats()
+        }
@@ -0,0 +1,154 @@
+"""
+Vùng quan tâm (ROI) theo camera/nguồn ảnh: chỉ đưa vùng bể nuôi vào model
+Mỗi ROI là hình chữ nhật hoặc đa giác, toạ độ tương đối 0-1 nên dùng được cho mọi độ phân giải.
+Các ROI được cắt theo hình chữ nhật bao, chạy chung 1 batch, toạ độ đưa về ảnh gốc;
+detection có tâm nằm ngoài mask đa giác bị loại trước NMS.
+
+File cấu hình (ROI_CONFIG, mặc định roi.json), key là source, "*" là mặc định:
+{
+  "pi-camera": [{"rect": [0.10, 0.05, 0.90, 0.95]}],
+  "*": [{"polygon": [[0.1, 0.2], [0.9, 0.2], [0.8, 0.9], [0.2, 0.9]]}]
+}
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from detector import run_inference_batch, decode_yolo_boxes, build_detections
+
+DEFAULT_KEY = '*'
+# Số kích thước ảnh giữ mask trong cache (mask 12MP ~12 MB, ảnh điện thoại đủ loại kích thước)
+GEOMETRY_CACHE_SIZE = int(os.getenv('ROI_CACHE_SIZE', '4'))
+
+
+def parse_region(spec):
+    """dict cấu hình -> mảng đỉnh đa giác (K, 2) toạ độ tương đối"""
+    if 'rect' in spec:
+        x1, y1, x2, y2 = (float(v) for v in spec['rect'])
+        points = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+    elif 'polygon' in spec:
+        points = spec['polygon']
+    else:
+        raise ValueError(f"ROI needs 'rect' or 'polygon': {spec}")
+
+    points = np.clip(np.array(points, dtype=np.float64), 0.0, 1.0)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+        raise ValueError(f"Invalid ROI polygon: {spec}")
+    return points
+
+
+class RoiSet:
+    """Các ROI của 1 nguồn ảnh, cache mask/hình chữ nhật theo kích thước ảnh (LRU, GEOMETRY_CACHE_SIZE)"""
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.polygons = [parse_region(spec) for spec in specs]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def geometry(self, width, height):
+        """
+        Returns:
+            crops: list (x1, y1, x2, y2) pixel của hình chữ nhật bao từng ROI
+            mask: uint8 (height, width), 1 bên trong ROI
+        """
+        key = (width, height)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        crops = []
+        for polygon in self.polygons:
+            points = np.round(polygon * [width, height]).astype(np.int32)
+            cv2.fillPoly(mask, [points], 1)
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            if x2 - x1 >= 2 and y2 - y1 >= 2:
+                crops.append((int(x1), int(y1), int(x2), int(y2)))
+
+        with self._lock:
+            self._cache[key] = (crops, mask)
+            while len(self._cache) > GEOMETRY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return crops, mask
+
+
+class RoiConfig:
+    """ROI theo source, đọc/ghi file JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.sets = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.sets = {}
+            return
+        with open(self.path) as f:
+            self.update(json.load(f), save=False)
+
+    def update(self, config, save=True):
+        """Thay toàn bộ cấu hình (ValueError nếu sai định dạng)"""
+        sets = {source: RoiSet(specs) for source, specs in config.items() if specs}
+        self.sets = sets
+        if save:
+            with open(self.path, 'w') as f:
+                json.dump(config, f, indent=2)
+
+    def to_dict(self):
+        return {source: roi_set.specs for source, roi_set in self.sets.items()}
+
+    def for_source(self, source):
+        """RoiSet của source (hoặc mặc định "*"), None nếu dùng cả khung hình"""
+        return self.sets.get(source) or self.sets.get(DEFAULT_KEY)
+
+
+def detect_rois(image_np, roi_set, conf_threshold=0.25, iou_threshold=0.45, scale=1.0, calibration=None):
+    """
+    Detection chỉ trong các ROI
+    Args:
+        scale: tỉ lệ ảnh gốc / image_np, bbox trả về theo toạ độ ảnh gốc
+        calibration: CalibrationProfile của camera (mặc định theo detector)
+    """
+    height, width = image_np.shape[:2]
+    crops, mask = roi_set.geometry(width, height)
+    if not crops:
+        return []
+
+    results = run_inference_batch([image_np[y1:y2, x1:x2] for x1, y1, x2, y2 in crops])
+
+    all_boxes, all_scores, all_classes = [], [], []
+    for (x1, y1, x2, y2), outputs in zip(crops, results):
+        if len(outputs) != 1 or len(outputs[0].shape) != 3:
+            continue
+        boxes, scores, class_ids = decode_yolo_boxes(
+            outputs[0][0], x2 - x1, y2 - y1, conf_threshold, offset=(x1, y1))
+        all_boxes.append(boxes)
+        all_scores.append(scores)
+        all_classes.append(class_ids)
+
+    if not all_boxes:
+        return []
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    class_ids = np.concatenate(all_classes)
+
+    # Loại detection có tâm ngoài mask (tra mảng, không cần point-in-polygon)
+    cx = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, width - 1)
+    cy = np.clip((boxes[:, 1] + boxes[:, 3]) // 2, 0, height - 1)
+    inside = mask[cy, cx].astype(bool)
+    boxes, scores, class_ids = boxes[inside], scores[inside], class_ids[inside]
+
+    if scale != 1.0:
+        boxes = (boxes * scale).astype(np.int64)
+    image_size = (int(round(width * scale)), int(round(height * scale)))
+    return build_detections(boxes, scores, class_ids, conf_threshold, iou_threshold,
+                            calibration, image_size)
@@ -0,0 +1,212 @@
+"""
+Rollup biomass theo giờ và theo nguồn (capturedFrom)
+Mỗi lần lưu detection, document rollup của giờ đó được cập nhật bằng $inc nguyên tử,
+nên thống kê dashboard chỉ cần đọc vài chục document thay vì quét toàn bộ detections.
+minLength/maxLength ($min/$max) không trừ lại được khi xoá ảnh: là biên của mọi ảnh từng ghi
+trong giờ đó, chỉ được xoá (null) khi bucket không còn ảnh nào.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from detection_codec import document_detections
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Biên các bucket chiều dài (cm) cho histogram kích thước, bucket cuối là ">= biên cuối"
+SIZE_BUCKET_EDGES = [0, 2, 4, 6, 8, 10, 12, 14, 16, 18, 20]
+ROLLUP_TZ_OFFSET_MINUTES = int(os.getenv('ROLLUP_TZ_OFFSET_MINUTES', '0'))
+
+
+def bucket_labels():
+    labels = [f"{low}-{high}" for low, high in zip(SIZE_BUCKET_EDGES, SIZE_BUCKET_EDGES[1:])]
+    labels.append(f"{SIZE_BUCKET_EDGES[-1]}+")
+    return labels
+
+
+BUCKET_LABELS = bucket_labels()
+
+
+def hour_start(timestamp_ms):
+    return timestamp_ms - timestamp_ms % HOUR_MS
+
+
+def ensure_rollup_indexes(rollup_collection):
+    rollup_collection.create_index([('source', ASCENDING), ('hour', ASCENDING)], unique=True)
+    rollup_collection.create_index([('hour', ASCENDING)])
+
+
+def build_rollup_update(detections, sign=1):
+    """
+    Tạo update ($inc/$min/$max) cho 1 ảnh
+    Args:
+        sign: 1 khi thêm ảnh, -1 khi xoá ảnh
+    """
+    lengths = np.array([d.get('length', 0.0) for d in detections], dtype=np.float64)
+    weights = np.array([d.get('weight', 0.0) for d in detections], dtype=np.float64)
+
+    inc = {
+        "images": sign,
+        "count": sign * len(detections),
+        "lengthSum": sign * float(lengths.sum()),
+        "weightSum": sign * float(weights.sum())
+    }
+    if len(lengths):
+        bucket_index = np.clip(np.searchsorted(SIZE_BUCKET_EDGES, lengths, side='right') - 1,
+                               0, len(BUCKET_LABELS) - 1)
+        for index, count in zip(*np.unique(bucket_index, return_counts=True)):
+            inc[f"histogram.{BUCKET_LABELS[index]}"] = sign * int(count)
+
+    update = {"$inc": inc}
+    if sign > 0 and len(lengths):
+        update["$min"] = {"minLength": float(lengths.min())}
+        update["$max"] = {"maxLength": float(lengths.max())}
+    return update
+
+
+def empty_bucket_reset(source, timestamp_ms):
+    """(filter, update) xoá minLength/maxLength của bucket không còn ảnh, dùng sau khi xoá ảnh"""
+    return ({"source": source, "hour": hour_start(timestamp_ms), "images": {"$lte": 0}},
+            {"$unset": {"minLength": "", "maxLength": ""}})
+
+
+def record_detections(rollup_collection, source, timestamp_ms, detections, sign=1):
+    """Cập nhật rollup của giờ chứa timestamp_ms cho nguồn source"""
+    rollup_collection.update_one(
+        {"source": source, "hour": hour_start(timestamp_ms)},
+        build_rollup_update(detections, sign),
+        upsert=True
+    )
+    if sign < 0:
+        rollup_collection.update_one(*empty_bucket_reset(source, timestamp_ms))
+
+
+def _empty_total():
+    return {"images": 0, "count": 0, "lengthSum": 0.0, "weightSum": 0.0,
+            "minLength": None, "maxLength": None,
+            "histogram": {label: 0 for label in BUCKET_LABELS}}
+
+
+def _merge(total, doc):
+    for key in ("images", "count", "lengthSum", "weightSum"):
+        total[key] += doc.get(key, 0)
+    for label, count in doc.get("histogram", {}).items():
+        total["histogram"][label] = total["histogram"].get(label, 0) + count
+    # Bucket đã xoá hết ảnh: min/max còn lại là của ảnh đã xoá
+    if doc.get("images", 0) <= 0:
+        return
+    if doc.get("minLength") is not None:
+        total["minLength"] = doc["minLength"] if total["minLength"] is None else min(total["minLength"], doc["minLength"])
+    if doc.get("maxLength") is not None:
+        total["maxLength"] = doc["maxLength"] if total["maxLength"] is None else max(total["maxLength"], doc["maxLength"])
+
+
+def _finish(total):
+    count = total["count"]
+    return {
+        "images": total["images"],
+        "count": count,
+        "totalLength": round(total["lengthSum"], 2),
+        "totalWeight": round(total["weightSum"], 2),
+        "meanLength": round(total["lengthSum"] / count, 2) if count else 0.0,
+        "meanWeight": round(total["weightSum"] / count, 2) if count else 0.0,
+        "minLength": total["minLength"],
+        "maxLength": total["maxLength"],
+        "histogram": total["histogram"]
+    }
+
+
+def query_rollups(rollup_collection, start_ms, end_ms, source=None, granularity='hour',
+                  tz_offset_minutes=ROLLUP_TZ_OFFSET_MINUTES):
+    """
+    Tổng hợp rollup trong khoảng [start_ms, end_ms)
+    Args:
+        granularity: 'hour', 'day' hoặc 'total'
+        tz_offset_minutes: lệch múi giờ khi gom theo ngày (VD: 420 cho UTC+7)
+    Returns:
+        dict gồm series theo thời gian, tổng theo nguồn và tổng toàn bộ
+    """
+    query = {"hour": {"$gte": hour_start(start_ms), "$lt": end_ms}}
+    if source:
+        query["source"] = source
+
+    offset_ms = tz_offset_minutes * 60 * 1000
+    series, by_source, overall = {}, {}, _empty_total()
+    for doc in rollup_collection.find(query, {"_id": 0}):
+        if granularity == 'day':
+            bucket = (doc["hour"] + offset_ms) // DAY_MS * DAY_MS - offset_ms
+        else:
+            bucket = doc["hour"]
+        if granularity != 'total':
+            _merge(series.setdefault(bucket, _empty_total()), doc)
+        _merge(by_source.setdefault(doc["source"], _empty_total()), doc)
+        _merge(overall, doc)
+
+    return {
+        "from": start_ms,
+        "to": end_ms,
+        "granularity": granularity,
+        "series": [dict(_finish(series[bucket]), start=bucket) for bucket in sorted(series)],
+        "sources": {name: _finish(total) for name, total in sorted(by_source.items())},
+        "total": _finish(overall),
+        "histogramBuckets": BUCKET_LABELS
+    }
+
+
+def _aggregate_into(detections_collection, target, query, batch_size):
+    """Cộng rollup của các document khớp query vào collection target, trả về số document"""
+    operations = []
+    processed = 0
+    cursor = detections_collection.find(query, {"detections": 1, "detectionsPacked": 1,
+                                                "timestamp": 1, "capturedFrom": 1})
+    for doc in cursor:
+        operations.append(UpdateOne(
+            {"source": doc.get("capturedFrom", "unknown"), "hour": hour_start(doc.get("timestamp", 0))},
+            build_rollup_update(document_detections(doc)),
+            upsert=True
+        ))
+        processed += 1
+        if len(operations) >= batch_size:
+            target.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        target.bulk_write(operations, ordered=False)
+    return processed
+
+
+def rebuild_rollups(detections_collection, rollup_collection, batch_size=500):
+    """
+    Tính lại toàn bộ rollup từ collection detections (dùng 1 lần cho dữ liệu cũ)
+    Tính vào collection tạm rồi rename đè collection thật, server vẫn ghi $inc vào collection
+    cũ trong lúc tính nên ảnh mới (theo _id) được cộng bù trước khi rename. Ảnh bị xoá trong
+    lúc tính thì không trừ lại được: nên chạy lúc ít xoá ảnh.
+    """
+    temp = rollup_collection.database[f"{rollup_collection.name}_rebuild"]
+    temp.drop()
+    ensure_rollup_indexes(temp)
+
+    started = ObjectId.from_datetime(datetime.now(timezone.utc))
+    processed = _aggregate_into(detections_collection, temp, {"_id": {"$lt": started}}, batch_size)
+    processed += _aggregate_into(detections_collection, temp, {"_id": {"$gte": started}}, batch_size)
+    temp.rename(rollup_collection.name, dropTarget=True)
+    return processed
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    db = client[os.getenv('MONGODB_DATABASE', 'shrimp_db')]
+
+    print("Rebuilding biomass rollups from detections...")
+    started = time.time()
+    total = rebuild_rollups(db['detections'], db['rollups'])
+    print(f"✅ Rebuilt rollups from {total} images in {time.time() - started:.1f}s")
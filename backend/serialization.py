@@ -0,0 +1,109 @@
+"""
+Serialize response nhanh cho API
+- JSON qua orjson (nếu có), hỗ trợ sẵn NumPy scalar/array và ObjectId
+- MessagePack khi client gửi header Accept: application/msgpack
+orjson và msgpack là tuỳ chọn: thiếu thì quay về json chuẩn của Python.
+"""
+import json
+
+from bson import ObjectId
+from flask import current_app, request
+from flask.json.provider import JSONProvider
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def _default(obj):
+    """Kiểu không có sẵn trong JSON/MessagePack"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if np is not None:
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_json(obj):
+        """Serialize JSON ra bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads_json(data):
+        return orjson.loads(data)
+else:
+    def dumps_json(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+    def loads_json(data):
+        return json.loads(data)
+
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider cho Flask dùng orjson: jsonify() và request.json đều nhanh hơn"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads_json(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_json(obj), mimetype=JSON_MIMETYPE)
+
+
+def accepts_msgpack(accept_header):
+    """Header Accept có ưu tiên MessagePack hơn JSON không (dùng được ngoài Flask request)"""
+    if msgpack is None or not accept_header:
+        return False
+    best = parse_accept_header(accept_header, MIMEAccept).best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+def wants_msgpack():
+    """Client có ưu tiên MessagePack hơn JSON không (theo header Accept)"""
+    return accepts_msgpack(request.headers.get('Accept'))
+
+
+def serialize_payload(payload, use_msgpack=False):
+    """payload -> (body bytes, mimetype)"""
+    if use_msgpack:
+        return dumps_msgpack(payload), MSGPACK_MIMETYPE
+    return dumps_json(payload), JSON_MIMETYPE
+
+
+def negotiated_response(payload, status=200, headers=None):
+    """Trả về JSON hoặc MessagePack tuỳ header Accept của client"""
+    body, mimetype = serialize_payload(payload, wants_msgpack())
+    response = current_app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+    response.vary.add('Accept')
+    return response
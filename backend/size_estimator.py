@@ -0,0 +1,183 @@
+"""
+Ước tính chiều dài/khối lượng tôm cho cả mảng bbox một lần (numpy), hiệu chuẩn theo camera
+Chiều dài: coi con tôm là thanh mảnh dài L, dày t = aspect * L nằm nghiêng góc bất kỳ trong bbox
+    w = L cos(a) + t sin(a),  h = L sin(a) + t cos(a)
+    => L = sqrt((((w + h) / (1 + r))^2 + ((w - h) / (1 - r))^2) / 2)   với r = aspect
+nên tôm nằm chéo không bị tính thiếu như khi lấy cạnh dài của bbox. Tôm nằm ngang có bbox
+h = r * w nên L = w; bbox mỏng hơn mô hình (h -> 0) cho L ~ 1.05 * w với r = 0.18.
+Khối lượng: W = a * L^b (gram, cm).
+
+Hiệu chuẩn (CALIBRATION_CONFIG, mặc định calibration.json), key là camera/source, "*" là mặc định:
+{
+  "pi-camera": {"cmPerPixel": 0.021, "imageSize": [640, 480]},
+  "tank2": {"marker": {"pixels": 180, "cm": 5.0}, "imageSize": [1280, 720]},
+  "tank3": {"points": {"image": [[102, 80], [530, 75], [560, 410], [90, 420]],
+                       "plane": [[0, 0], [60, 0], [60, 45], [0, 45]]},
+            "imageSize": [640, 480], "lengthWeightA": 0.0065, "lengthWeightB": 3.1},
+  "*": {"cmPerPixel": 0.02}
+}
+- cmPerPixel / marker (vật mẫu dài "cm" đo được "pixels" trên ảnh): tỉ lệ cố định cho cả ảnh
+- points / homography: ánh xạ phối cảnh ảnh -> mặt phẳng đáy bể (cm), tỉ lệ tính theo vị trí
+- imageSize: độ phân giải lúc đo; ảnh khác độ phân giải được quy đổi (cache theo kích thước)
+"""
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from detection_codec import summarize_sizes
+
+DEFAULT_KEY = '*'
+DEFAULT_BODY_ASPECT = 0.18
+
+
+def rod_length(widths, heights, aspect=DEFAULT_BODY_ASPECT):
+    """Chiều dài thân từ kích thước bbox (cùng đơn vị), mô hình thanh mảnh nằm nghiêng"""
+    r = min(max(aspect, 0.0), 0.9)
+    along = (widths + heights) / (1.0 + r)
+    across = (widths - heights) / (1.0 - r)
+    return np.sqrt((along * along + across * across) / 2.0)
+
+
+class CalibrationProfile:
+    """Hiệu chuẩn 1 camera: pixel -> cm (tỉ lệ cố định hoặc homography) và hệ số W = a * L^b"""
+
+    def __init__(self, cm_per_pixel=None, homography=None, image_size=None,
+                 length_weight_a=0.0065, length_weight_b=3.1, body_aspect=DEFAULT_BODY_ASPECT, spec=None):
+        if cm_per_pixel is None and homography is None:
+            raise ValueError("Calibration needs cmPerPixel, marker, points or homography")
+        self.cm_per_pixel = cm_per_pixel
+        self.homography = None if homography is None else np.asarray(homography, dtype=np.float64)
+        if self.homography is not None and self.homography.shape != (3, 3):
+            raise ValueError("homography must be a 3x3 matrix")
+        self.image_size = tuple(image_size) if image_size else None
+        self.length_weight_a = length_weight_a
+        self.length_weight_b = length_weight_b
+        self.body_aspect = body_aspect
+        self.spec = spec
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """dict cấu hình -> CalibrationProfile (ValueError nếu sai định dạng)"""
+        cm_per_pixel = spec.get('cmPerPixel')
+        homography = spec.get('homography')
+        if 'marker' in spec:
+            marker = spec['marker']
+            if float(marker['pixels']) <= 0:
+                raise ValueError("marker pixels must be positive")
+            cm_per_pixel = float(marker['cm']) / float(marker['pixels'])
+        if 'points' in spec:
+            image_points = np.array(spec['points']['image'], dtype=np.float64)
+            plane_points = np.array(spec['points']['plane'], dtype=np.float64)
+            if image_points.shape != plane_points.shape or len(image_points) < 4:
+                raise ValueError("points needs >= 4 matching image/plane points")
+            homography, _ = cv2.findHomography(image_points, plane_points)
+            if homography is None:
+                raise ValueError("Cannot compute homography from points")
+        return cls(cm_per_pixel=None if cm_per_pixel is None else float(cm_per_pixel),
+                   homography=homography,
+                   image_size=spec.get('imageSize'),
+                   length_weight_a=float(spec.get('lengthWeightA', 0.0065)),
+                   length_weight_b=float(spec.get('lengthWeightB', 3.1)),
+                   body_aspect=float(spec.get('bodyAspect', DEFAULT_BODY_ASPECT)),
+                   spec=spec)
+
+    def _for_size(self, image_size):
+        """(cm_per_pixel, homography) quy đổi theo độ phân giải ảnh, cache theo kích thước"""
+        if self.image_size is None or image_size is None or tuple(image_size) == self.image_size:
+            return self.cm_per_pixel, self.homography
+        key = tuple(image_size)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        sx = self.image_size[0] / image_size[0]
+        sy = self.image_size[1] / image_size[1]
+        cm_per_pixel = None if self.cm_per_pixel is None else self.cm_per_pixel * (sx * sy) ** 0.5
+        homography = None if self.homography is None else self.homography @ np.diag([sx, sy, 1.0])
+        with self._lock:
+            self._cache[key] = (cm_per_pixel, homography)
+        return cm_per_pixel, homography
+
+    def estimate(self, boxes, image_size=None):
+        """
+        Args:
+            boxes: mảng (N, 4) [x1, y1, x2, y2] pixel
+            image_size: (width, height) của ảnh chứa boxes
+        Returns:
+            lengths (cm), weights (gram): mảng float64 (N,), đã làm tròn 2 chữ số
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        widths = boxes[:, 2] - boxes[:, 0]
+        heights = boxes[:, 3] - boxes[:, 1]
+        cm_per_pixel, homography = self._for_size(image_size)
+
+        if homography is None:
+            widths_cm = widths * cm_per_pixel
+            heights_cm = heights * cm_per_pixel
+        else:
+            # Tỉ lệ cm/pixel theo trục x, y tại tâm bbox: Jacobian của phép chiếu phối cảnh
+            cx = (boxes[:, 0] + boxes[:, 2]) / 2
+            cy = (boxes[:, 1] + boxes[:, 3]) / 2
+            h = homography
+            p0 = h[0, 0] * cx + h[0, 1] * cy + h[0, 2]
+            p1 = h[1, 0] * cx + h[1, 1] * cy + h[1, 2]
+            p2 = h[2, 0] * cx + h[2, 1] * cy + h[2, 2]
+            u, v = p0 / p2, p1 / p2
+            scale_x = np.hypot(h[0, 0] - u * h[2, 0], h[1, 0] - v * h[2, 0]) / np.abs(p2)
+            scale_y = np.hypot(h[0, 1] - u * h[2, 1], h[1, 1] - v * h[2, 1]) / np.abs(p2)
+            widths_cm = widths * scale_x
+            heights_cm = heights * scale_y
+
+        lengths = np.round(rod_length(widths_cm, heights_cm, self.body_aspect), 2)
+        weights = np.where(lengths > 0,
+                           np.round(self.length_weight_a * np.power(lengths, self.length_weight_b), 2),
+                           0.0)
+        return lengths, weights
+
+    def estimate_biomass(self, boxes, image_size=None):
+        """Như estimate, kèm tổng hợp của cả ảnh (count, totalWeight, mean/min/max) từ cùng mảng"""
+        lengths, weights = self.estimate(boxes, image_size)
+        return lengths, weights, summarize_sizes(lengths, weights)
+
+    def to_dict(self):
+        if self.spec is not None:
+            return self.spec
+        return {"cmPerPixel": self.cm_per_pixel, "lengthWeightA": self.length_weight_a,
+                "lengthWeightB": self.length_weight_b, "bodyAspect": self.body_aspect}
+
+
+class CalibrationConfig:
+    """Hiệu chuẩn theo camera/source, đọc/ghi file JSON"""
+
+    def __init__(self, path, default_profile):
+        self.path = path
+        self.default_profile = default_profile
+        self.profiles = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.profiles = {}
+            return
+        with open(self.path) as f:
+            self.update(json.load(f), save=False)
+
+    def update(self, config, save=True):
+        """Thay toàn bộ cấu hình (ValueError nếu sai định dạng)"""
+        profiles = {source: CalibrationProfile.from_spec(spec) for source, spec in config.items()}
+        self.profiles = profiles
+        if save:
+            with open(self.path, 'w') as f:
+                json.dump(config, f, indent=2)
+
+    def to_dict(self):
+        return {source: profile.to_dict() for source, profile in self.profiles.items()}
+
+    def for_source(self, source):
+        """Profile của source, không có thì "*", không có nữa thì profile mặc định"""
+        return self.profiles.get(source) or self.profiles.get(DEFAULT_KEY) or self.default_profile
@@ -1,7 +1,19 @@
 """
 Script test TFLite model trước khi chạy backend đầy đủ
+Chạy không tham số: kiểm tra model load và chạy được 1 lần invoke().
+Chạy với --profile: đo hiệu năng theo số thread, kích thước input và delegate
+(có warm-up), thời gian load, RAM, thống kê op và so sánh nhiều model (FP16/INT8...).
 """
+import argparse
+import gc
+import json
 import os
+import re
+import shutil
+import subprocess
+import time
+from collections import Counter
+
 import numpy as np
 import cv2
 from PIL import Image
@@ -9,100 +21,364 @@ from PIL import Image
 # Test import
 print("Testing imports...")
 try:
-    from tflite_runtime.interpreter import Interpreter
+    from tflite_runtime.interpreter import Interpreter, load_delegate
+    try:
+        from tflite_runtime.interpreter import OpResolverType
+    except ImportError:
+        OpResolverType = None
     print("✅ Using tflite_runtime")
 except ImportError:
     try:
         import tensorflow as tf
         Interpreter = tf.lite.Interpreter
+        load_delegate = tf.lite.experimental.load_delegate
+        OpResolverType = getattr(tf.lite.experimental, 'OpResolverType', None)
         print("✅ Using tensorflow.lite")
     except ImportError:
         print("❌ Không tìm thấy TFLite! Cần cài đặt tflite_runtime hoặc tensorflow")
         exit(1)
 
-# Load model
 MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'models/best-fp16(1).tflite')
-print(f"\nLoading model: {MODEL_PATH}")
 
-if not os.path.exists(MODEL_PATH):
-    print(f"❌ Model file không tồn tại: {MODEL_PATH}")
-    exit(1)
 
-try:
-    interpreter = Interpreter(model_path=MODEL_PATH)
-    interpreter.allocate_tensors()
-    print("✅ Model loaded successfully!")
-except Exception as e:
-    print(f"❌ Lỗi khi load model: {e}")
-    exit(1)
-
-# Get input/output details
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-
-print("\n" + "="*50)
-print("MODEL INFORMATION")
-print("="*50)
-
-print(f"\nInput Details:")
-for i, inp in enumerate(input_details):
-    print(f"  Input {i}:")
-    print(f"    - Shape: {inp['shape']}")
-    print(f"    - Type: {inp['dtype']}")
-    print(f"    - Index: {inp['index']}")
-
-print(f"\nOutput Details:")
-for i, out in enumerate(output_details):
-    print(f"  Output {i}:")
-    print(f"    - Shape: {out['shape']}")
-    print(f"    - Type: {out['dtype']}")
-    print(f"    - Index: {out['index']}")
-
-# Test với ảnh dummy
-print("\n" + "="*50)
-print("TESTING INFERENCE")
-print("="*50)
-
-input_shape = input_details[0]['shape']
-INPUT_HEIGHT = input_shape[1]
-INPUT_WIDTH = input_shape[2]
-INPUT_CHANNELS = input_shape[3]
-
-print(f"\nCreating dummy image: {INPUT_HEIGHT}x{INPUT_WIDTH}x{INPUT_CHANNELS}")
-
-# Tạo ảnh dummy
-dummy_image = np.random.rand(INPUT_HEIGHT, INPUT_WIDTH, INPUT_CHANNELS).astype(np.float32)
-dummy_input = np.expand_dims(dummy_image, axis=0)
-
-print(f"Input shape: {dummy_input.shape}")
-print(f"Input dtype: {dummy_input.dtype}")
-
-# Run inference
-try:
-    print("\nRunning inference...")
-    interpreter.set_tensor(input_details[0]['index'], dummy_input)
-    interpreter.invoke()
+def run_smoke_test():
+    """Kiểm tra model load và chạy được 1 lần với input ngẫu nhiên"""
+    # Load model
+    print(f"\nLoading model: {MODEL_PATH}")
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"❌ Model file không tồn tại: {MODEL_PATH}")
+        exit(1)
 
-    print("✅ Inference successful!")
+    try:
+        interpreter = Interpreter(model_path=MODEL_PATH)
+        interpreter.allocate_tensors()
+        print("✅ Model loaded successfully!")
+    except Exception as e:
+        print(f"❌ Lỗi khi load model: {e}")
+        exit(1)
+
+    # Get input/output details
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+
+    print("\n" + "="*50)
+    print("MODEL INFORMATION")
+    print("="*50)
 
-    print("\nOutput shapes:")
+    print(f"\nInput Details:")
+    for i, inp in enumerate(input_details):
+        print(f"  Input {i}:")
+        print(f"    - Shape: {inp['shape']}")
+        print(f"    - Type: {inp['dtype']}")
+        print(f"    - Index: {inp['index']}")
+
+    print(f"\nOutput Details:")
     for i, out in enumerate(output_details):
-        output = interpreter.get_tensor(out['index'])
-        print(f"  Output {i}: {output.shape}, min={output.min():.4f}, max={output.max():.4f}")
+        print(f"  Output {i}:")
+        print(f"    - Shape: {out['shape']}")
+        print(f"    - Type: {out['dtype']}")
+        print(f"    - Index: {out['index']}")
+
+    # Test với ảnh dummy
+    print("\n" + "="*50)
+    print("TESTING INFERENCE")
+    print("="*50)
+
+    input_shape = input_details[0]['shape']
+    INPUT_HEIGHT = input_shape[1]
+    INPUT_WIDTH = input_shape[2]
+    INPUT_CHANNELS = input_shape[3]
+
+    print(f"\nCreating dummy image: {INPUT_HEIGHT}x{INPUT_WIDTH}x{INPUT_CHANNELS}")
+
+    # Tạo ảnh dummy
+    dummy_image = np.random.rand(INPUT_HEIGHT, INPUT_WIDTH, INPUT_CHANNELS).astype(np.float32)
+    dummy_input = np.expand_dims(dummy_image, axis=0)
+
+    print(f"Input shape: {dummy_input.shape}")
+    print(f"Input dtype: {dummy_input.dtype}")
+
+    # Run inference
+    try:
+        print("\nRunning inference...")
+        interpreter.set_tensor(input_details[0]['index'], dummy_input)
+        interpreter.invoke()
+
+        print("✅ Inference successful!")
+
+        print("\nOutput shapes:")
+        for i, out in enumerate(output_details):
+            output = interpreter.get_tensor(out['index'])
+            print(f"  Output {i}: {output.shape}, min={output.min():.4f}, max={output.max():.4f}")
+
+    except Exception as e:
+        print(f"❌ Lỗi khi chạy inference: {e}")
+        import traceback
+        traceback.print_exc()
+        exit(1)
+
+    print("\n" + "="*50)
+    print("TEST COMPLETED SUCCESSFULLY!")
+    print("="*50)
+
+    print("\n📝 Ghi chú:")
+    print("  - Model đã load và chạy thành công")
+    print("  - Input shape:", input_details[0]['shape'])
+    print("  - Output có", len(output_details), "tensors")
+    print("\n  Bây giờ bạn có thể chạy backend bằng: python3 app_tflite.py")
+
+
+# ==================== PROFILER ====================
+def rss_bytes():
+    """RSS hiện tại của process (Linux), None nếu không đọc được"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def make_interpreter(model_path, threads, delegate):
+    """
+    Args:
+        delegate: 'default' (XNNPACK nếu runtime bật sẵn), 'none' (kernel builtin),
+                  hoặc đường dẫn thư viện delegate .so (VD: libedgetpu.so.1)
+    """
+    kwargs = {"model_path": model_path, "num_threads": threads}
+    if delegate == 'none':
+        if OpResolverType is None:
+            raise RuntimeError("Runtime không hỗ trợ tắt delegate mặc định")
+        kwargs["experimental_op_resolver_type"] = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    elif delegate != 'default':
+        kwargs["experimental_delegates"] = [load_delegate(delegate)]
+    return Interpreter(**kwargs)
+
+
+def random_input(detail):
+    """Input ngẫu nhiên đúng dtype (model INT8 cần lượng tử hoá theo scale/zero point)"""
+    shape = detail['shape']
+    values = np.random.rand(*shape).astype(np.float32)
+    dtype = detail['dtype']
+    if dtype == np.float32:
+        return values
+    scale, zero_point = detail.get('quantization', (0.0, 0))
+    if scale:
+        values = values / scale + zero_point
+    info = np.iinfo(dtype)
+    return np.clip(np.round(values), info.min, info.max).astype(dtype)
+
+
+def op_histogram(interpreter):
+    """Số lượng op theo loại trong graph (chưa tính việc delegate gom op)"""
+    try:
+        return Counter(op['op_name'] for op in interpreter._get_ops_details())
+    except Exception:
+        return Counter()
+
+
+def profile_config(model_path, threads, size, delegate, warmup, iterations):
+    """Đo 1 cấu hình: thời gian load, RAM, warm-up và latency các lần chạy"""
+    gc.collect()
+    rss_before = rss_bytes()
+
+    started = time.perf_counter()
+    interpreter = make_interpreter(model_path, threads, delegate)
+    input_detail = interpreter.get_input_details()[0]
+    native_size = int(input_detail['shape'][1])
+    if size and size != native_size:
+        interpreter.resize_tensor_input(input_detail['index'], [1, size, size, int(input_detail['shape'][3])])
+    interpreter.allocate_tensors()
+    load_ms = (time.perf_counter() - started) * 1000
+    rss_loaded = rss_bytes()
+
+    input_detail = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()
+    data = random_input(input_detail)
+
+    def invoke():
+        interpreter.set_tensor(input_detail['index'], data)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_details[0]['index'])
+
+    started = time.perf_counter()
+    invoke()
+    first_ms = (time.perf_counter() - started) * 1000
+    for _ in range(max(warmup - 1, 0)):
+        invoke()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        invoke()
+        timings.append((time.perf_counter() - started) * 1000)
+    rss_after = rss_bytes()
+    timings = np.array(timings)
+
+    result = {
+        "model": os.path.basename(model_path),
+        "inputDtype": np.dtype(input_detail['dtype']).name,
+        "threads": threads,
+        "size": int(input_detail['shape'][1]),
+        "delegate": delegate if delegate in ('default', 'none') else os.path.basename(delegate),
+        "loadMs": round(load_ms, 1),
+        "firstInvokeMs": round(first_ms, 2),
+        "meanMs": round(float(timings.mean()), 2),
+        "p50Ms": round(float(np.percentile(timings, 50)), 2),
+        "p95Ms": round(float(np.percentile(timings, 95)), 2),
+        "minMs": round(float(timings.min()), 2),
+        "fps": round(1000 / float(timings.mean()), 1),
+        "loadMemoryMB": round((rss_loaded - rss_before) / 1e6, 1) if rss_before else None,
+        "runMemoryMB": round((rss_after - rss_before) / 1e6, 1) if rss_before else None,
+        "ops": dict(op_histogram(interpreter).most_common())
+    }
+    del interpreter
+    return result
+
+
+def benchmark_model_ops(model_path, threads, binary, runs=20):
+    """
+    Thời gian theo loại op từ tool benchmark_model của TensorFlow Lite
+    (Python runtime không có API profiling từng op)
+    Returns:
+        list (op, ms trung bình, %) hoặc None nếu không chạy được
+    """
+    try:
+        output = subprocess.run(
+            [binary, f"--graph={model_path}", f"--num_threads={threads}", f"--num_runs={runs}",
+             "--enable_op_profiling=true"],
+            capture_output=True, text=True, timeout=600).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    section = output.split("Summary by node type", 1)
+    if len(section) < 2:
+        return None
+    rows = []
+    for line in section[1].splitlines():
+        # [Node type]  [count]  [avg ms]  [avg %]  [cdf %] ...
+        match = re.match(r"\s*([A-Za-z_0-9 ():]+?)\s+(\d+)\s+([\d.]+)\s+([\d.]+)%", line)
+        if match:
+            rows.append((match.group(1).strip(), float(match.group(3)), float(match.group(4))))
+        elif rows and not line.strip():
+            break
+    return rows
+
+
+def parse_list(value, cast=str):
+    return [cast(v) for v in value.split(',') if v]
+
+
+def print_report(results):
+    print("\n" + "=" * 50)
+    print("PROFILE REPORT (sắp xếp theo latency trung bình)")
+    print("=" * 50)
+    header = (f"{'model':<24}{'dtype':>8}{'size':>6}{'thr':>5}{'delegate':>10}"
+              f"{'load':>8}{'first':>8}{'mean':>8}{'p50':>8}{'p95':>8}{'fps':>7}{'RAM MB':>8}")
+    print(header)
+    for r in sorted(results, key=lambda r: r['meanMs']):
+        ram = f"{r['runMemoryMB']:.1f}" if r['runMemoryMB'] is not None else "-"
+        print(f"{r['model'][:23]:<24}{r['inputDtype']:>8}{r['size']:>6}{r['threads']:>5}{r['delegate'][:9]:>10}"
+              f"{r['loadMs']:>8.0f}{r['firstInvokeMs']:>8.1f}{r['meanMs']:>8.2f}{r['p50Ms']:>8.2f}"
+              f"{r['p95Ms']:>8.2f}{r['fps']:>7.1f}{ram:>8}")
+
+    best = min(results, key=lambda r: r['meanMs'])
+    print(f"\n🏆 Nhanh nhất: {best['model']} size {best['size']}, {best['threads']} thread, "
+          f"delegate {best['delegate']} ({best['meanMs']:.2f} ms, {best['fps']:.1f} fps)")
+
+
+def run_profile(args):
+    models = args.model or [MODEL_PATH]
+    threads = parse_list(args.threads, int)
+    sizes = parse_list(args.sizes, int) or [0]
+    delegates = parse_list(args.delegates)
+
+    print("=" * 50)
+    print("🧪 TFLite Profiler")
+    print("=" * 50)
+    print(f"Models: {', '.join(models)}")
+    print(f"Threads: {threads}, sizes: {sizes or 'native'}, delegates: {delegates}")
+    print(f"Warm-up {args.warmup}, đo {args.iterations} lần mỗi cấu hình")
+
+    results = []
+    for model_path in models:
+        if not os.path.exists(model_path):
+            print(f"❌ Model file không tồn tại: {model_path}")
+            continue
+        for delegate in delegates:
+            for size in sizes:
+                for thread_count in threads:
+                    try:
+                        result = profile_config(model_path, thread_count, size, delegate,
+                                                args.warmup, args.iterations)
+                    except Exception as e:
+                        print(f"⚠️  {os.path.basename(model_path)} size={size} threads={thread_count} "
+                              f"delegate={delegate}: {e}")
+                        continue
+                    results.append(result)
+                    print(f"  - {result['model']} size={result['size']} threads={thread_count} "
+                          f"delegate={result['delegate']}: {result['meanMs']:.2f} ms "
+                          f"(p95 {result['p95Ms']:.2f}, load {result['loadMs']:.0f} ms)")
+
+    if not results:
+        print("❌ Không có cấu hình nào chạy được")
+        exit(1)
+
+    print_report(results)
+
+    print("\nOp theo loại (cấu hình đầu tiên của mỗi model/delegate):")
+    seen = set()
+    for r in results:
+        key = (r['model'], r['delegate'])
+        if key in seen:
+            continue
+        seen.add(key)
+        top = ", ".join(f"{name} x{count}" for name, count in list(r['ops'].items())[:8])
+        print(f"  - {r['model']} [{r['delegate']}]: {top}")
+
+    binary = args.benchmark_binary or shutil.which('benchmark_model')
+    if binary:
+        print(f"\nThời gian theo op (benchmark_model, {threads[-1]} thread):")
+        for model_path in models:
+            rows = benchmark_model_ops(model_path, threads[-1], binary)
+            if not rows:
+                print(f"  - {os.path.basename(model_path)}: không lấy được profile từ {binary}")
+                continue
+            print(f"  {os.path.basename(model_path)}:")
+            for name, avg_ms, percent in rows[:12]:
+                print(f"    {name:<28}{avg_ms:>9.3f} ms {percent:>6.1f}%")
+            for r in results:
+                if r['model'] == os.path.basename(model_path):
+                    r.setdefault('opTimings', [
+                        {"op": name, "ms": avg_ms, "percent": percent} for name, avg_ms, percent in rows])
+    else:
+        print("\nℹ️  Per-op timing: Python runtime không hỗ trợ; cài tool benchmark_model của "
+              "TensorFlow Lite (hoặc --benchmark-binary) để có thời gian từng loại op")
 
-except Exception as e:
-    print(f"❌ Lỗi khi chạy inference: {e}")
-    import traceback
-    traceback.print_exc()
-    exit(1)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.json}")
 
-print("\n" + "="*50)
-print("TEST COMPLETED SUCCESSFULLY!")
-print("="*50)
 
-print("\n📝 Ghi chú:")
-print("  - Model đã load và chạy thành công")
-print("  - Input shape:", input_details[0]['shape'])
-print("  - Output có", len(output_details), "tensors")
-print("\n  Bây giờ bạn có thể chạy backend bằng: python3 app_tflite.py")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test/Profile TFLite model")
+    parser.add_argument("--profile", action="store_true", help="Đo hiệu năng thay vì chỉ test 1 lần")
+    parser.add_argument("--model", action="append", help="Model cần đo (lặp lại để so sánh FP16/INT8...)")
+    parser.add_argument("--threads", default="1,2,4", help="Danh sách số thread")
+    parser.add_argument("--sizes", default="", help="Danh sách kích thước input (VD: 96,160,320), trống: gốc")
+    parser.add_argument("--delegates", default="default,none",
+                        help="default (XNNPACK), none (builtin) hoặc đường dẫn delegate .so")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--benchmark-binary", default=None, help="Đường dẫn tool benchmark_model")
+    parser.add_argument("--json", default=None, help="Lưu kết quả ra file JSON")
+    args = parser.parse_args()
 
+    if args.profile:
+        run_profile(args)
+    else:
+        run_smoke_test()
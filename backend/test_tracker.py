@@ -0,0 +1,74 @@
+"""
+Script test tracker với cảnh tôm giả lập
+Kiểm tra số tôm duy nhất đếm được (không đếm trùng giữa các frame)
+và thời gian cập nhật mỗi frame (cần < 33ms để theo kịp 30 FPS trên Pi)
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tracker import ShrimpTracker
+
+
+def simulate(num_shrimp, frames, miss_rate, seed=0):
+    """Tạo detections của num_shrimp con tôm bơi ngẫu nhiên, có frame bị mất detection"""
+    rng = np.random.default_rng(seed)
+    position = rng.uniform([50, 50], [590, 430], size=(num_shrimp, 2))
+    velocity = rng.normal(0, 2.0, size=(num_shrimp, 2))
+    size = rng.uniform(20, 60, size=num_shrimp)
+
+    for _ in range(frames):
+        position += velocity
+        bounce = (position < 20) | (position > [620, 460])
+        velocity[bounce] *= -1
+        detections = []
+        for i in range(num_shrimp):
+            if rng.random() < miss_rate:
+                continue
+            jitter = rng.normal(0, 1.0, size=2)
+            length = round(size[i] * 0.02 + rng.normal(0, 0.05), 2)
+            detections.append({
+                "className": "shrimp",
+                "confidence": 0.8,
+                "bbox": {"x": float(position[i, 0] + jitter[0]), "y": float(position[i, 1] + jitter[1]),
+                         "width": float(size[i]), "height": float(size[i] * 0.4)},
+                "length": length,
+                "weight": round(0.0065 * max(length, 0) ** 3.1, 2)
+            })
+        yield detections
+
+
+def test_tracker(num_shrimp, frames, miss_rate):
+    print("=" * 50)
+    print("🧪 Testing Shrimp Tracker")
+    print("=" * 50)
+
+    tracker = ShrimpTracker()
+    now = 0.0
+    worst = 0.0
+    for detections in simulate(num_shrimp, frames, miss_rate):
+        started = time.perf_counter()
+        tracker.update(detections, now=now)
+        worst = max(worst, time.perf_counter() - started)
+        now += 1 / 30
+
+    counts = tracker.unique_counts(window_seconds=frames / 30 + 1, now=now)
+    stats = tracker.stats()
+
+    print(f"\n📊 Results ({num_shrimp} tôm, {frames} frames, mất {miss_rate:.0%} detections):")
+    print(f"   - Unique count: {counts['uniqueCount']} (thực tế {num_shrimp})")
+    print(f"   - Mean length: {counts['meanLength']} cm, total weight: {counts['totalWeight']} g")
+    print(f"   - Update time: avg {stats['avgUpdateMs']} ms, worst {worst * 1000:.2f} ms")
+    print(f"   - {'✅' if stats['avgUpdateMs'] < 33 else '❌'} 30 FPS budget (33 ms)")
+    print("\n" + "=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test tracker với dữ liệu giả lập")
+    parser.add_argument("--shrimp", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--miss-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    test_tracker(args.shrimp, args.frames, args.miss_rate)
@@ -0,0 +1,323 @@
+"""
+Tracker nhiều đối tượng cho đếm tôm trên camera (không đếm trùng giữa các frame)
+Ghép detection với track bằng IoU (dự phòng bằng khoảng cách tâm), dự đoán vị trí
+bằng Kalman vận tốc không đổi. Toàn bộ trạng thái là mảng NumPy, cập nhật theo lô
+cho mọi track nên đủ nhanh cho 30 FPS trên Pi.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+STATE_DIM = 8   # cx, cy, w, h, vx, vy, vw, vh
+MEAS_DIM = 4    # cx, cy, w, h
+
+_F = np.eye(STATE_DIM)
+_F[:MEAS_DIM, MEAS_DIM:] = np.eye(MEAS_DIM)
+
+# Độ lệch chuẩn nhiễu tỉ lệ theo chiều cao box (giống DeepSORT)
+STD_POSITION = 1.0 / 20
+STD_VELOCITY = 1.0 / 160
+
+
+def detections_to_array(detections):
+    """List detections (dict bbox tâm) -> mảng (N, 4) cx, cy, w, h"""
+    if not detections:
+        return np.empty((0, MEAS_DIM))
+    return np.array([[d['bbox']['x'], d['bbox']['y'], d['bbox']['width'], d['bbox']['height']]
+                     for d in detections], dtype=np.float64)
+
+
+def to_corners(boxes):
+    """(N, 4) cx, cy, w, h -> (N, 4) x1, y1, x2, y2"""
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def iou_matrix(a, b):
+    """IoU giữa 2 tập box dạng góc, kết quả (len(a), len(b))"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(score, threshold, higher_is_better=True):
+    """Ghép greedy theo điểm (IoU cao nhất / khoảng cách nhỏ nhất trước)"""
+    if score.size == 0:
+        return []
+    candidates = np.argwhere(score >= threshold if higher_is_better else score <= threshold)
+    if len(candidates) == 0:
+        return []
+    values = score[candidates[:, 0], candidates[:, 1]]
+    order = np.argsort(-values if higher_is_better else values, kind='stable')
+
+    used_rows, used_cols, pairs = set(), set(), []
+    for row, col in candidates[order]:
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        pairs.append((row, col))
+    return pairs
+
+
+def average_frame_detections(frames, iou_threshold=0.3, min_ratio=0.5):
+    """
+    Gộp detections của N frame liên tiếp thành 1 kết quả ổn định
+    Detection được ghép giữa các frame theo IoU, chỉ giữ con tôm xuất hiện trong
+    ít nhất min_ratio số frame; bbox, độ tin cậy, chiều dài, khối lượng lấy trung bình.
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    clusters = []   # mỗi cluster: list detection của cùng 1 con tôm
+    for detections in frames:
+        boxes = detections_to_array(detections)
+        if clusters and len(boxes):
+            means = np.array([detections_to_array(c).mean(axis=0) for c in clusters])
+            pairs = greedy_match(iou_matrix(to_corners(means), to_corners(boxes)), iou_threshold)
+        else:
+            pairs = []
+        matched = set()
+        for row, col in pairs:
+            clusters[row].append(detections[col])
+            matched.add(col)
+        clusters.extend([detections[i]] for i in range(len(detections)) if i not in matched)
+
+    min_hits = max(1, int(np.ceil(min_ratio * len(frames))))
+    averaged = []
+    for cluster in clusters:
+        if len(cluster) < min_hits:
+            continue
+        box = detections_to_array(cluster).mean(axis=0)
+        names = [d['className'] for d in cluster]
+        averaged.append({
+            "className": max(set(names), key=names.count),
+            "confidence": float(np.mean([d['confidence'] for d in cluster])),
+            "bbox": {"x": float(box[0]), "y": float(box[1]), "width": float(box[2]), "height": float(box[3])},
+            "length": round(float(np.mean([d.get('length', 0.0) for d in cluster])), 2),
+            "weight": round(float(np.mean([d.get('weight', 0.0) for d in cluster])), 2),
+            "frames": len(cluster)
+        })
+    averaged.sort(key=lambda d: d['confidence'], reverse=True)
+    return averaged
+
+
+class ShrimpTracker:
+    """Gán track id ổn định cho detections và đếm số tôm duy nhất theo cửa sổ thời gian"""
+
+    def __init__(self, iou_threshold=0.3, distance_threshold=1.0, max_age=15,
+                 min_hits=3, history_seconds=3600):
+        """
+        Args:
+            iou_threshold: IoU tối thiểu để ghép detection với track
+            distance_threshold: khoảng cách tâm tối đa (tính theo cạnh lớn của box) khi ghép dự phòng
+            max_age: số frame liên tiếp mất dấu trước khi xoá track
+            min_hits: số lần khớp để track được xác nhận (lọc nhiễu 1 frame)
+            history_seconds: thời gian giữ lại track đã kết thúc để đếm theo cửa sổ
+        """
+        self.iou_threshold = iou_threshold
+        self.distance_threshold = distance_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.history_seconds = history_seconds
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._finished = deque()
+        self.frames = 0
+        self.update_time = 0.0
+        self._reset_arrays()
+
+    def _reset_arrays(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._x = np.empty((0, STATE_DIM))
+        self._p = np.empty((0, STATE_DIM, STATE_DIM))
+        self._hits = np.empty(0, dtype=np.int64)
+        self._misses = np.empty(0, dtype=np.int64)
+        self._confidence = np.empty(0)
+        self._length_sum = np.empty(0)
+        self._weight_sum = np.empty(0)
+        self._samples = np.empty(0)
+        self._first_seen = np.empty(0)
+        self._last_seen = np.empty(0)
+
+    def _select(self, mask):
+        for name in ('_ids', '_x', '_p', '_hits', '_misses', '_confidence', '_length_sum',
+                     '_weight_sum', '_samples', '_first_seen', '_last_seen'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def _predict(self):
+        if len(self._ids) == 0:
+            return
+        height = np.maximum(self._x[:, 3], 1.0)
+        std = np.concatenate([np.repeat((STD_POSITION * height)[:, None], MEAS_DIM, axis=1),
+                              np.repeat((STD_VELOCITY * height)[:, None], MEAS_DIM, axis=1)], axis=1)
+        q = np.zeros_like(self._p)
+        idx = np.arange(STATE_DIM)
+        q[:, idx, idx] = std ** 2
+
+        self._x = self._x @ _F.T
+        self._x[:, 2:4] = np.maximum(self._x[:, 2:4], 1.0)
+        self._p = _F @ self._p @ _F.T + q
+
+    def _correct(self, rows, measurements):
+        x = self._x[rows]
+        p = self._p[rows]
+        std = STD_POSITION * np.maximum(x[:, 3], 1.0)
+        r = np.zeros((len(rows), MEAS_DIM, MEAS_DIM))
+        idx = np.arange(MEAS_DIM)
+        r[:, idx, idx] = (std ** 2)[:, None]
+
+        s = p[:, :MEAS_DIM, :MEAS_DIM] + r
+        k = p[:, :, :MEAS_DIM] @ np.linalg.inv(s)
+        innovation = measurements - x[:, :MEAS_DIM]
+        self._x[rows] = x + (k @ innovation[:, :, None])[:, :, 0]
+        self._p[rows] = p - k @ p[:, :MEAS_DIM, :]
+
+    def _spawn(self, measurements, detections, det_rows, now):
+        count = len(det_rows)
+        height = np.maximum(measurements[:, 3], 1.0)
+        std = np.concatenate([np.repeat((2 * STD_POSITION * height)[:, None], MEAS_DIM, axis=1),
+                              np.repeat((10 * STD_VELOCITY * height)[:, None], MEAS_DIM, axis=1)], axis=1)
+        p = np.zeros((count, STATE_DIM, STATE_DIM))
+        idx = np.arange(STATE_DIM)
+        p[:, idx, idx] = std ** 2
+
+        self._ids = np.concatenate([self._ids, np.arange(self._next_id, self._next_id + count)])
+        self._next_id += count
+        self._x = np.concatenate([self._x, np.hstack([measurements, np.zeros((count, MEAS_DIM))])])
+        self._p = np.concatenate([self._p, p])
+        self._hits = np.concatenate([self._hits, np.ones(count, dtype=np.int64)])
+        self._misses = np.concatenate([self._misses, np.zeros(count, dtype=np.int64)])
+        self._confidence = np.concatenate([self._confidence,
+                                           [detections[i].get('confidence', 0.0) for i in det_rows]])
+        self._length_sum = np.concatenate([self._length_sum,
+                                           [detections[i].get('length', 0.0) for i in det_rows]])
+        self._weight_sum = np.concatenate([self._weight_sum,
+                                           [detections[i].get('weight', 0.0) for i in det_rows]])
+        self._samples = np.concatenate([self._samples, np.ones(count)])
+        self._first_seen = np.concatenate([self._first_seen, np.full(count, now)])
+        self._last_seen = np.concatenate([self._last_seen, np.full(count, now)])
+
+    def update(self, detections, now=None):
+        """
+        Cập nhật tracker với detections của 1 frame
+        Returns:
+            list track đã xác nhận và có mặt trong frame này (bbox đã lọc Kalman,
+            length/weight là trung bình trên toàn bộ vòng đời track)
+        """
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+
+        with self._lock:
+            measurements = detections_to_array(detections)
+            self._predict()
+
+            pairs = []
+            if len(self._ids) and len(measurements):
+                ious = iou_matrix(to_corners(self._x[:, :MEAS_DIM]), to_corners(measurements))
+                pairs = greedy_match(ious, self.iou_threshold)
+
+                # Dự phòng: tôm nhỏ di chuyển nhanh có thể không chồng box, ghép theo tâm
+                free_tracks = np.setdiff1d(np.arange(len(self._ids)), [p[0] for p in pairs])
+                free_dets = np.setdiff1d(np.arange(len(measurements)), [p[1] for p in pairs])
+                if len(free_tracks) and len(free_dets):
+                    size = np.maximum(self._x[free_tracks, 2], self._x[free_tracks, 3])
+                    delta = self._x[free_tracks, None, :2] - measurements[None, free_dets, :2]
+                    distance = np.linalg.norm(delta, axis=2) / np.maximum(size[:, None], 1.0)
+                    pairs += [(free_tracks[i], free_dets[j])
+                              for i, j in greedy_match(distance, self.distance_threshold, False)]
+
+            matched_tracks = np.array([p[0] for p in pairs], dtype=np.int64)
+            matched_dets = np.array([p[1] for p in pairs], dtype=np.int64)
+
+            self._misses += 1
+            if len(pairs):
+                self._correct(matched_tracks, measurements[matched_dets])
+                self._hits[matched_tracks] += 1
+                self._misses[matched_tracks] = 0
+                self._last_seen[matched_tracks] = now
+                self._samples[matched_tracks] += 1
+                self._confidence[matched_tracks] = [detections[i].get('confidence', 0.0) for i in matched_dets]
+                self._length_sum[matched_tracks] += [detections[i].get('length', 0.0) for i in matched_dets]
+                self._weight_sum[matched_tracks] += [detections[i].get('weight', 0.0) for i in matched_dets]
+
+            new_dets = np.setdiff1d(np.arange(len(measurements)), matched_dets)
+            if len(new_dets):
+                self._spawn(measurements[new_dets], detections, new_dets, now)
+
+            # Xoá track mất dấu quá lâu, giữ lại lịch sử của track đã xác nhận
+            expired = self._misses > self.max_age
+            for row in np.flatnonzero(expired & (self._hits >= self.min_hits)):
+                self._finished.append(self._summary(row))
+            if expired.any():
+                self._select(~expired)
+            while self._finished and self._finished[0]['lastSeen'] < now - self.history_seconds:
+                self._finished.popleft()
+
+            visible = np.flatnonzero((self._misses == 0) & (self._hits >= self.min_hits))
+            tracks = [self._track_output(row) for row in visible]
+
+            self.frames += 1
+            self.update_time += time.perf_counter() - started
+            return tracks
+
+    def _summary(self, row):
+        samples = max(self._samples[row], 1)
+        return {
+            "trackId": int(self._ids[row]),
+            "firstSeen": float(self._first_seen[row]),
+            "lastSeen": float(self._last_seen[row]),
+            "length": round(float(self._length_sum[row] / samples), 2),
+            "weight": round(float(self._weight_sum[row] / samples), 2)
+        }
+
+    def _track_output(self, row):
+        cx, cy, w, h = (float(v) for v in self._x[row, :MEAS_DIM])
+        track = self._summary(row)
+        track.update({
+            "confidence": float(self._confidence[row]),
+            "bbox": {"x": cx, "y": cy, "width": w, "height": h},
+            "hits": int(self._hits[row])
+        })
+        return track
+
+    def unique_counts(self, window_seconds, now=None):
+        """Số tôm duy nhất xuất hiện trong window_seconds gần nhất và biomass ước tính"""
+        now = time.time() if now is None else now
+        since = now - window_seconds
+        with self._lock:
+            seen = [t for t in self._finished if t['lastSeen'] >= since]
+            for row in np.flatnonzero((self._hits >= self.min_hits) & (self._last_seen >= since)):
+                seen.append(self._summary(row))
+
+        count = len(seen)
+        total_weight = sum(t['weight'] for t in seen)
+        return {
+            "window": window_seconds,
+            "uniqueCount": count,
+            "meanLength": round(sum(t['length'] for t in seen) / count, 2) if count else 0.0,
+            "meanWeight": round(total_weight / count, 2) if count else 0.0,
+            "totalWeight": round(total_weight, 2)
+        }
+
+    def reset(self):
+        with self._lock:
+            self._reset_arrays()
+            self._finished.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "activeTracks": int(len(self._ids)),
+                "confirmedTracks": int(np.count_nonzero(self._hits >= self.min_hits)),
+                "nextTrackId": self._next_id,
+                "frames": self.frames,
+                "avgUpdateMs": round(self.update_time / self.frames * 1000, 3) if self.frames else 0.0
+            }
@@ -4,12 +4,16 @@ import androidx.compose.runtime.mutableStateListOf
 import androidx.compose.runtime.mutableStateOf
 import androidx.lifecycle.ViewModel
 import androidx.lifecycle.viewModelScope
+import com.dung.myapplication.models.DetectionEvent
 import com.dung.myapplication.models.ShrimpImage
 import dagger.hilt.android.lifecycle.HiltViewModel
 import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.delay
+import kotlinx.coroutines.isActive
 import kotlinx.coroutines.launch
 import kotlinx.coroutines.withContext
 import kotlinx.serialization.json.Json
+import okhttp3.Call
 import okhttp3.OkHttpClient
 import okhttp3.Request
 import java.util.concurrent.TimeUnit
@@ -27,6 +31,13 @@ class GalleryViewModel @Inject constructor() : ViewModel() {
         .readTimeout(10, TimeUnit.SECONDS)
         .build()
 
+    // Kết nối SSE giữ lâu, server gửi keep-alive mỗi 15s
+    private val eventClient = client.newBuilder()
+        .readTimeout(60, TimeUnit.SECONDS)
+        .build()
+
+    private var eventCall: Call? = null
+
     private val json = Json {
         ignoreUnknownKeys = true
         isLenient = true
@@ -37,6 +48,78 @@ class GalleryViewModel @Inject constructor() : ViewModel() {
 
     init {
         loadImages()
+        listenForDetectionEvents()
+    }
+
+    // Nghe /api/events (SSE) để nhận ảnh mới thay vì poll lại cả gallery
+    private fun listenForDetectionEvents() {
+        viewModelScope.launch(Dispatchers.IO) {
+            var lastEventId: String? = null
+            while (isActive) {
+                try {
+                    val builder = Request.Builder()
+                        .url("$BACKEND_URL/api/events")
+                        .get()
+                        .addHeader("Accept", "text/event-stream")
+                        .addHeader("User-Agent", "Android-Camera-App")
+                    lastEventId?.let { builder.addHeader("Last-Event-ID", it) }
+
+                    val call = eventClient.newCall(builder.build())
+                    eventCall = call
+                    call.execute().use { response ->
+                        val source = response.body?.source() ?: return@use
+                        var eventType = ""
+                        val data = StringBuilder()
+                        while (isActive) {
+                            val line = source.readUtf8Line() ?: break
+                            when {
+                                line.isEmpty() -> {
+                                    if (eventType == "detection" && data.isNotEmpty()) {
+                                        onDetectionEvent(data.toString())
+                                    }
+                                    eventType = ""
+                                    data.clear()
+                                }
+                                line.startsWith("id:") -> lastEventId = line.substring(3).trim()
+                                line.startsWith("event:") -> eventType = line.substring(6).trim()
+                                line.startsWith("data:") -> data.append(line.substring(5).trim())
+                            }
+                        }
+                    }
+                } catch (e: Exception) {
+                    // Mất kết nối, thử lại sau
+                }
+                delay(3000)
+            }
+        }
+    }
+
+    private suspend fun onDetectionEvent(data: String) {
+        val event = json.decodeFromString<DetectionEvent>(data)
+        if (imageList.any { it.id == event.id }) return
+
+        // Chỉ lấy đúng 1 document mới thay vì tải lại 100 ảnh
+        val request = Request.Builder()
+            .url("$BACKEND_URL/api/shrimp-images/${event.id}")
+            .get()
+            .addHeader("User-Agent", "Android-Camera-App")
+            .build()
+
+        client.newCall(request).execute().use { response ->
+            if (!response.isSuccessful) return
+            val responseBody = response.body?.string() ?: return
+            val image = json.decodeFromString<ShrimpImage>(responseBody)
+            withContext(Dispatchers.Main) {
+                if (imageList.none { it.id == image.id }) {
+                    imageList.add(0, image)
+                }
+            }
+        }
+    }
+
+    override fun onCleared() {
+        eventCall?.cancel()
+        super.onCleared()
     }
 
     fun loadImages() {
@@ -9,7 +9,21 @@ data class ShrimpImage(
     val cloudinaryUrl: String,
     val detections: List<ShrimpDetection>,
     val timestamp: Long = System.currentTimeMillis(),
-    val capturedFrom: String = ""
+    val capturedFrom: String = "",
+    val summary: ImageSummary? = null
+)
+
+// Số liệu tóm tắt backend tính sẵn cho mỗi ảnh (dùng để lọc gallery)
+@Serializable
+data class ImageSummary(
+    val count: Int = 0,
+    val totalWeight: Float = 0f,
+    val meanLength: Float = 0f,
+    val minLength: Float = 0f,
+    val maxLength: Float = 0f,
+    val meanWeight: Float = 0f,
+    val minWeight: Float = 0f,
+    val maxWeight: Float = 0f
 )
 
 @Serializable
@@ -38,3 +52,14 @@ data class YoloProcessResponse(
     val message: String = ""
 )
 
+
+// Event SSE từ /api/events khi có kết quả detection mới
+@Serializable
+data class DetectionEvent(
+    val id: String,
+    val timestamp: Long,
+    val count: Int,
+    val totalWeight: Float,
+    val thumbnailUrl: String? = null,
+    val capturedFrom: String = ""
+)
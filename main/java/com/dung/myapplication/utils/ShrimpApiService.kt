@@ -43,31 +43,66 @@ class ShrimpApiService {
                     }
                 """.trimIndent()
 
-                val request = Request.Builder()
-                    .url("$BACKEND_URL/api/detect-shrimp")
-                    .post(jsonBody.toRequestBody("application/json".toMediaType()))
-                    .addHeader("User-Agent", "Android-Camera-App")
-                    .build()
-
-                client.newCall(request).execute().use { response ->
-                    if (!response.isSuccessful) {
-                        return@withContext Result.failure(
-                            Exception("Server error: ${response.code} - ${response.message}")
-                        )
-                    }
+                postDetection("$BACKEND_URL/api/detect-shrimp", jsonBody)
+            } catch (e: Exception) {
+                Result.failure(e)
+            }
+        }
+    }
 
-                    val responseBody = response.body?.string()
-                        ?: return@withContext Result.failure(Exception("Empty response"))
+    /**
+     * Detection trên frame mới nhất của camera Pi (server tự lấy frame),
+     * không cần decode MJPEG, encode lại và upload ảnh từ điện thoại
+     * @param frames số frame liên tiếp được gộp để kết quả ổn định hơn
+     * @param camera tên camera khi Pi có nhiều camera (null: camera mặc định)
+     */
+    suspend fun processSnapshot(
+        sourceUrl: String,
+        frames: Int = 1,
+        camera: String? = null
+    ): Result<YoloProcessResponse> {
+        return withContext(Dispatchers.IO) {
+            try {
+                val jsonBody = """
+                    {
+                        "source": "$sourceUrl",
+                        "frames": $frames
+                    }
+                """.trimIndent()
 
-                    val result = json.decodeFromString<YoloProcessResponse>(responseBody)
-                    Result.success(result)
+                val url = if (camera != null) {
+                    "$BACKEND_URL/api/cameras/$camera/detect-snapshot"
+                } else {
+                    "$BACKEND_URL/api/detect-snapshot"
                 }
+                postDetection(url, jsonBody)
             } catch (e: Exception) {
                 Result.failure(e)
             }
         }
     }
 
+    private fun postDetection(url: String, jsonBody: String): Result<YoloProcessResponse> {
+        val request = Request.Builder()
+            .url(url)
+            .post(jsonBody.toRequestBody("application/json".toMediaType()))
+            .addHeader("User-Agent", "Android-Camera-App")
+            .build()
+
+        client.newCall(request).execute().use { response ->
+            if (!response.isSuccessful) {
+                return Result.failure(
+                    Exception("Server error: ${response.code} - ${response.message}")
+                )
+            }
+
+            val responseBody = response.body?.string()
+                ?: return Result.failure(Exception("Empty response"))
+
+            return Result.success(json.decodeFromString<YoloProcessResponse>(responseBody))
+        }
+    }
+
     private fun bitmapToBase64(bitmap: Bitmap): String {
         val outputStream = ByteArrayOutputStream()
         bitmap.compress(Bitmap.CompressFormat.JPEG, 90, outputStream)